@@ -2,9 +2,14 @@
 
 """Backend tests."""
 
+import json
 import logging
+from collections import defaultdict
 from datetime import datetime
 from datetime import timedelta
+from typing import Dict
+from typing import List
+from typing import Tuple
 from typing import Iterable
 
 import sqlalchemy
@@ -37,7 +42,6 @@ logger = logging.getLogger("database")
 
 # Timeseries check
 
-
 		# activities:Iterable[str],
 		# threshold:timedelta,
 		# job_sidnum_filter:int=None):
@@ -53,51 +57,147 @@ logger = logging.getLogger("database")
 			description="Age of most recently executed matching job",
 			datatype=timedelta,
 			multiple=dict),
+		MessageDescription(
+			name="total",
+			label="Jobs",
+			description="Count of recent jobs",
+			datatype=int,
+			multiple=dict),
 		MessageDescription(
 			name="failed",
 			label="Failed jobs",
 			description="Count of recent failed jobs",
-			datatype=timedelta,
+			datatype=int,
 			multiple=dict),
 		MessageDescription(
 			name="errors",
 			label="Log file errors",
 			description="Total logged errors for recent jobs",
-			datatype=timedelta,
+			datatype=int,
+			multiple=dict),
+		MessageDescription(
+			name="latency_min",
+			label="Min latency",
+			description="Shortest latency of recent jobs",
+			unit="s",
+			sf=3,
+			datatype=float,
+			multiple=dict),
+		MessageDescription(
+			name="latency_avg",
+			label="Avg latency",
+			description="Average latency of recent jobs",
+			unit="s",
+			sf=3,
+			datatype=float,
+			multiple=dict),
+		MessageDescription(
+			name="latency_max",
+			label="Max latency",
+			description="Longest latency of recent jobs",
+			unit="s",
+			sf=3,
+			datatype=float,
 			multiple=dict),
 	]
 )
 def measure_backend_jobs(subject:Backend, context:Context):
-	conn = subject.database.connect()
+	"""Count jobs of each of `subject.expected_jobs` over their rolling windows.
+
+	Each entry of `expected_jobs` is a dict of:
+	- `activity`: Value of the jobs.activity column to look for
+	- `field`: Time column of each job, whose most recent value is reported and which
+		places jobs in the window
+	- `filters`: List of extra SQL conditions
+	- `window`: timedelta of the rolling window for counts (default 1 day)
+	- `settle`: timedelta after `field` by which a job is committed and its status, errors
+		and latency no longer change (default 1 hour)
+	- `failed`: SQL condition for a failed job (default "status='FAILED'")
+	- `errors`: Optional SQL expression giving the number of logged errors for a job
+	- `latency`: Optional SQL expression giving the latency of a job in seconds
+
+	Only jobs after the mark saved in `context.state` by the previous run are read, all in
+	one query, so the cost of a run depends on how many jobs arrived recently rather than on
+	the size of the jobs table. The mark is the time before which jobs have settled, so jobs
+	which are still changing, or are committed late, are read again by the next run. Counts of
+	settled jobs are kept as buckets and summed over the window, and counts of jobs still
+	settling are added for this run only.
+
+	Buckets are stamped with the time of the earliest job counted rather than the time of the
+	run, so they leave the window with that job.
+	"""
 	result = Measurement(state=MeasurementState.GOOD)
-	for expected_jobs in subject.expected_jobs:
-		where_clauses = []
-		bindvars = {}
-		for f in expected_jobs["filters"]:
-			where_clauses.append(f)
-
-		where_clauses.append("activity=:activity")
-		bindvars["activity"] = expected_jobs["activity"]
-
-		sql = "SELECT max({field}) FROM jobs WHERE {where}".format(
-			field=expected_jobs["field"],
-			where=" AND ".join(where_clauses))
-	# bindvars["sidnum"] = job_sidnum_filter
-		cursor = conn.execute(sqlalchemy.text(sql), bindvars)
-		last_gen_time = cursor.fetchone()[0]
-		logger.info('last gen time {l}'.format(l=last_gen_time))
-
-		# delay = datetime.utcnow() - last_gen_time
-
-		result.add_message(
-			Message(name="recent",
-					parameter=expected_jobs["activity"],
-					value=last_gen_time),
-			)
-
-		cursor.close()
-
-	conn.close()
+	if not subject.expected_jobs:
+		return result
+
+	jobs = [job_settings(job) for job in subject.expected_jobs]
+	groups = job_groups(jobs)
+	state_key = "backend-jobs.{id}".format(id=subject.get_id())
+	state = context.state.load(state_key, {})
+	now = context.execute_start
+	jobs_settled = [now - key[2] for key in groups]
+
+	# previous state for each group, dropped if the group's activities have changed
+	previous = []
+	for key, activities in groups.items():
+		group_state = state.get(group_name(key))
+		if group_state is None or set(group_state["activities"]) != set(activities):
+			group_state = {"mark": None, "activities": activities, "jobs": {}}
+
+		previous.append(group_state)
+
+	since = [now - max(job["window"] for job in jobs if group_key(job) == key) for key in groups]
+	query, columns = new_jobs_query(groups, [p["mark"] for p in previous], since, jobs_settled)
+	with subject.database.connect() as conn:
+		rows = conn.execute(query).fetchall()
+
+	# (group, activity) : buckets of jobs still settling, counted by this run only
+	settling = defaultdict(list)
+	for row in rows:
+		row = row._mapping
+		group_state = previous[row["grp"]]
+		stamp = row["first"] if isinstance(row["first"], datetime) else now
+		job_state = group_state["jobs"].setdefault(row["activity"], {"recent": None, "buckets": []})
+		recent = row["value_{c}".format(c=columns[row["grp"]])]
+		if recent is not None:
+			job_state["recent"] = recent if job_state["recent"] is None else\
+				max(job_state["recent"], recent)
+
+		if row["settled"]:
+			buckets = job_state["buckets"]
+
+		else:
+			buckets = settling[row["grp"], row["activity"]]
+
+		buckets.append([
+			stamp,
+			int(row["total"] or 0),
+			int(row["failed"] or 0),
+			None if row["errors"] is None else int(row["errors"]),
+			None if row["latency_min"] is None else float(row["latency_min"]),
+			None if row["latency_sum"] is None else float(row["latency_sum"]),
+			int(row["latency_count"] or 0),
+			None if row["latency_max"] is None else float(row["latency_max"])])
+
+	for group_state, mark in zip(previous, jobs_settled):
+		group_state["mark"] = mark
+
+	group_numbers = {key: number for number, key in enumerate(groups)}
+	for job in jobs:
+		group = group_numbers[group_key(job)]
+		job_state = previous[group]["jobs"].get(job["activity"])
+		if job_state is None:
+			job_state = {"recent": None, "buckets": []}
+
+		# drop buckets which have left the window
+		job_state["buckets"] = [b for b in job_state["buckets"] if b[0] >= now - job["window"]]
+		add_job_messages(result, job, {
+			"recent": job_state["recent"],
+			"buckets": job_state["buckets"] + settling[group, job["activity"]]})
+
+	context.state.save(state_key, {group_name(key): group_state
+								   for key, group_state in zip(groups, previous)})
+
 	# activity_clauses = []
 	# for a in activities:
 	# 	where_clauses.append("jobs.gen_time>:mintime")
@@ -125,6 +225,143 @@ def measure_backend_jobs(subject:Backend, context:Context):
 		# cursor = conn.execute(sqlalchemy.text(sql), bindvars)
 
 
-	
+
+	return result
+
+# Settings of each `Backend.expected_jobs` entry which are optional
+JOB_DEFAULTS = {
+	"filters": [],
+	"window": timedelta(days=1),
+	"settle": timedelta(hours=1),
+	"failed": "status='FAILED'",
+	"errors": None,
+	"latency": None,
+}
+
+def job_settings(expected_jobs:dict) -> dict:
+	"""Fill in defaults for an entry of `Backend.expected_jobs`."""
+	result = dict(JOB_DEFAULTS)
+	result.update(expected_jobs)
+	return result
+
+def group_key(expected_jobs:dict) -> Tuple[object, ...]:
+	"""Expected jobs with the same field, filters, settle time and expressions can be found by
+	one grouped query."""
+	return (expected_jobs["field"],
+			tuple(expected_jobs["filters"]),
+			expected_jobs["settle"],
+			expected_jobs["failed"],
+			expected_jobs["errors"],
+			expected_jobs["latency"])
+
+def group_name(key:Tuple[object, ...]) -> str:
+	"""Name for a group in saved state."""
+	field, filters, settle, *expressions = key
+	return json.dumps([field, filters, settle.total_seconds()] + expressions)
+
+def job_groups(expected_jobs:Iterable[dict]) -> Dict[Tuple[object, ...], List[str]]:
+	"""Map of group key against the activities using it, in config order."""
+	result = {}
+	for job in expected_jobs:
+		activities = result.setdefault(group_key(job), [])
+		if job["activity"] not in activities:
+			activities.append(job["activity"])
+
 	return result
 
+def new_jobs_query(groups:Dict[Tuple[object, ...], List[str]],
+				   marks:List[datetime],
+				   since:List[datetime],
+				   settled:List[datetime]) -> Tuple[sqlalchemy.TextClause, List[int]]:
+	"""Build one statement summarising new jobs for every activity of `groups`.
+
+	Each group becomes a `GROUP BY activity` query over its activities and the groups are
+	joined with UNION ALL so everything is fetched in a single round trip.
+	A group with a mark in `marks` only reads jobs after it. Otherwise all jobs are read to
+	find the most recent, but only those after its time in `since` are counted.
+	Jobs up to the group's time in `settled` and those after it are summarised in separate
+	rows, told apart by the `settled` column, and the `first` column gives the earliest value
+	of the field among the jobs counted in each row.
+
+	Groups using different fields may have different result types, so each field gets its
+	own value column and the other columns are NULL. Returns the statement and the index of
+	the value column for each group.
+	"""
+	fields = list(dict.fromkeys(key[0] for key in groups))
+	selects = []
+	params = []
+	columns = []
+	for group, (key, activities) in enumerate(groups.items()):
+		field, filters, _, failed, errors, latency = key
+		where_clauses = list(filters) + ["activity IN :activities_{g}".format(g=group)]
+		params.append(sqlalchemy.bindparam("activities_{g}".format(g=group),
+										   value=activities,
+										   expanding=True))
+		if marks[group] is None:
+			new = "{field} >= :since_{g}".format(field=field, g=group)
+			params.append(sqlalchemy.bindparam("since_{g}".format(g=group), value=since[group]))
+
+		else:
+			new = "1=1"
+			where_clauses.append("{field} > :mark_{g}".format(field=field, g=group))
+			params.append(sqlalchemy.bindparam("mark_{g}".format(g=group), value=marks[group]))
+
+		params.append(sqlalchemy.bindparam("settled_{g}".format(g=group), value=settled[group]))
+		values = ["{value} AS value_{i}".format(value="max({f})".format(f=f) if f == field else "NULL",
+												i=i)
+				  for i, f in enumerate(fields)]
+		selects.append(
+			"SELECT {g} AS grp, activity, {is_settled} AS settled, {values}, "
+			"min(CASE WHEN {new} THEN {field} END) AS first, "
+			"sum(CASE WHEN {new} THEN 1 ELSE 0 END) AS total, "
+			"sum(CASE WHEN {new} AND ({failed}) THEN 1 ELSE 0 END) AS failed, "
+			"sum(CASE WHEN {new} THEN {errors} END) AS errors, "
+			"min(CASE WHEN {new} THEN {latency} END) AS latency_min, "
+			"sum(CASE WHEN {new} THEN {latency} END) AS latency_sum, "
+			"count(CASE WHEN {new} THEN {latency} END) AS latency_count, "
+			"max(CASE WHEN {new} THEN {latency} END) AS latency_max "
+			"FROM jobs WHERE {where} GROUP BY activity, {is_settled}".format(
+				g=group,
+				is_settled="CASE WHEN {field} <= :settled_{g} THEN 1 ELSE 0 END".format(
+					field=field, g=group),
+				field=field,
+				values=", ".join(values),
+				new=new,
+				failed="1=0" if failed is None else failed,
+				errors="NULL" if errors is None else errors,
+				latency="NULL" if latency is None else latency,
+				where=" AND ".join(where_clauses)))
+		columns.append(fields.index(field))
+
+	query = sqlalchemy.text(" UNION ALL ".join(selects)).bindparams(*params)
+	return query, columns
+
+def add_job_messages(result:Measurement, job:dict, job_state:dict) -> None:
+	"""Add messages for one expected activity from the buckets of runs inside its window."""
+	activity = job["activity"]
+	buckets = job_state["buckets"]
+	logger.info('last gen time {l}'.format(l=job_state["recent"]))
+	result.add_message(Message(name="recent", parameter=activity, value=job_state["recent"]))
+	result.add_message(Message(name="total", parameter=activity, value=sum(b[1] for b in buckets)))
+	if job["failed"] is not None:
+		result.add_message(Message(name="failed",
+								   parameter=activity,
+								   value=sum(b[2] for b in buckets)))
+
+	if job["errors"] is not None:
+		result.add_message(Message(name="errors",
+								   parameter=activity,
+								   value=sum(b[3] for b in buckets if b[3] is not None)))
+
+	if job["latency"] is not None:
+		count = sum(b[6] for b in buckets)
+		if count > 0:
+			result.add_message(Message(name="latency_min",
+									   parameter=activity,
+									   value=min(b[4] for b in buckets if b[4] is not None)))
+			result.add_message(Message(name="latency_avg",
+									   parameter=activity,
+									   value=sum(b[5] for b in buckets if b[5] is not None) / count))
+			result.add_message(Message(name="latency_max",
+									   parameter=activity,
+									   value=max(b[7] for b in buckets if b[7] is not None)))
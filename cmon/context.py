@@ -2,18 +2,77 @@
 
 """Implementation of Context object."""
 
+import threading
+from typing import Callable
 from typing import Iterable
+from typing import Hashable
+from pathlib import Path
 from datetime import datetime
 
+from .state import StateStore
+
 class Context:
 	"""Runtime state passed to every test function."""
 	def __init__(self,
 				 simulate:bool=False,
 				 verbose:bool=False,
 				 include_tests:Iterable[str]=None,
-				 include_subjects:Iterable[str]=None):
+				 include_subjects:Iterable[str]=None,
+				 jobs:int=1,
+				 use_asyncio:bool=False,
+				 timeout:float=None,
+				 deadline:float=None,
+				 state_dir:Path=None):
+		"""Args:
+		- `jobs`: Number of subjects to test in parallel, or in asyncio mode the number of
+			threads used to run tests which are not coroutines
+		- `use_asyncio`: Run all subjects as tasks on a single asyncio event loop
+		- `timeout`: Default maximum time in seconds for each test, None for no limit. A test
+			which is not a coroutine runs on in its abandoned thread after timing out
+		- `deadline`: Maximum time in seconds for the whole run. Tests still running
+			when it expires are abandoned and tests not yet started are not attempted
+		- `state_dir`: Directory where tests keep state between runs. If not given state
+			only lasts for this run
+		"""
 		self.simulate = simulate
 		self.verbose = verbose
 		self.include_tests = include_tests
 		self.include_subjects = include_subjects
+		self.jobs = jobs
+		self.use_asyncio = use_asyncio
+		self.timeout = timeout
+		self.deadline = deadline
 		self.execute_start = datetime.utcnow()
+		# values kept between runs, see `StateStore`
+		self.state = StateStore(state_dir)
+		# all subjects selected for this run, set by the runner
+		self.subjects = []
+		# tests to be run against each selected subject, set by the runner
+		self.tests = {}
+		# per-run values shared between tests, see `cached()`
+		self.cache = {}
+		self.cache_lock = threading.Lock()
+
+	def cached(self, key:Hashable, factory:Callable[[], object]) -> object:
+		"""Return a value computed once per run by `factory()` and shared by all tests.
+
+		If several threads ask for the same `key` at once only one calls `factory()` and the others
+		wait for its result. An exception raised by `factory()` is also remembered and raised
+		again for later callers."""
+		with self.cache_lock:
+			entry = self.cache.get(key)
+			if entry is None:
+				entry = {"lock": threading.Lock()}
+				self.cache[key] = entry
+
+		with entry["lock"]:
+			if "value" not in entry and "error" not in entry:
+				try:
+					entry["value"] = factory()
+				except Exception as e:
+					entry["error"] = e
+
+		if "error" in entry:
+			raise entry["error"]
+
+		return entry["value"]
@@ -5,11 +5,14 @@
 import logging
 from enum import Enum
 from typing import Iterable
+from typing import Iterator
+from contextlib import contextmanager
 
 import sqlalchemy
 
 from ..testable import Testable
 from ..server.server import Server
+from .enginepool import engine_pool
 
 logger = logging.getLogger("database")
 
@@ -36,7 +39,11 @@ class Database(Testable):
 				 database:str=None,
 				 port:int=None,
 				 user:str=None,
-				 password:str=None):
+				 password:str=None,
+				 connect_timeout:int=10,
+				 pool_size:int=2,
+				 max_overflow:int=3,
+				 echo:bool=False):
 		"""Args:
 		`dialect`: sqlalchemy dialect string e.g. "postgresql", "postgresql+psycop"
 		`host`:
@@ -44,6 +51,10 @@ class Database(Testable):
 		`port`: If non standard
 		`user`: Username
 		`password`: Password if not configured in ~/.pgppass or other standard place
+		`connect_timeout`: Seconds to wait for a connection (postgresql dialects only)
+		`pool_size`: Connections kept open, shared with other Database objects using the same DSN
+		`max_overflow`: Additional connections allowed when all pooled ones are in use
+		`echo`: Log every SQL statement
 		"""
 		super().__init__(label=label)
 		# Use psycopg3 instead of the default psycopg2
@@ -58,13 +69,10 @@ class Database(Testable):
 		self.port = port
 		self.user = user
 		self.password = password
-		self.engine = None
-		self.connection = None
-
-	def __del__(self):
-		if self.connection is not None:
-			self.connection.rollback()
-			del self.connection
+		self.connect_timeout = connect_timeout
+		self.pool_size = pool_size
+		self.max_overflow = max_overflow
+		self.echo = echo
 
 	def dsn(self):
 		return "{dialect}://{user}{password}@{host}{port}/{name}".format(
@@ -76,8 +84,28 @@ class Database(Testable):
 			port="" if self.port is None else ":{port}".format(port=self.port),
 			name=self.database)
 
-	def connect(self) -> object:
-		"""Log into database.
+	def is_postgres(self) -> bool:
+		"""Test if we are a Postgres database, which some tests require."""
+		return self.dialect.startswith("postgresql")
+
+	def engine(self) -> sqlalchemy.engine.Engine:
+		"""Return the engine shared by all Database objects with our DSN."""
+		connect_args = {}
+		if self.is_postgres() and self.connect_timeout is not None:
+			connect_args["connect_timeout"] = self.connect_timeout
+
+		return engine_pool.engine(self.dsn(),
+								  connect_args=connect_args,
+								  pool_size=self.pool_size,
+								  max_overflow=self.max_overflow,
+								  pool_timeout=self.connect_timeout or 30,
+								  echo=self.echo)
+
+	@contextmanager
+	def connect(self) -> Iterator[sqlalchemy.engine.Connection]:
+		"""Check out a pooled connection to the database for the body of a `with` block.
+
+		The connection is rolled back and returned to the pool afterwards.
 
 		Raises:
 		IOError if local file cannot be found
@@ -90,16 +118,13 @@ class Database(Testable):
 		# metadata_obj=sqlalchemy.MetaData()
 		# tm = sqlalchemy.Table("tm", metadat_obj, autoload_with=engine)
 		# conn.execute(sqlalchemy.text("select 140")).fetchall()[0][0]
-		if self.connection is None:
-			dsn = self.dsn()
-			logger.info("Database string {dsn}".format(dsn=dsn))
-			self.engine = sqlalchemy.create_engine(dsn, echo=True)
-			try:
-				self.connection = self.engine.connect()
-			except sqlalchemy.exc.OperationalError:
-				raise CannotConnect("Connection to {db} failed".format(db=self.dsn()))
-
-		return self.connection
+		try:
+			connection = self.engine().connect()
+		except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.TimeoutError) as e:
+			raise CannotConnect("Connection to {db} failed".format(db=self.dsn())) from e
+
+		with connection:
+			yield connection
 
 	def links(self) -> Iterable[Testable]:
 		"""Return our linked items for dashboard display."""
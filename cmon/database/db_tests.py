@@ -4,27 +4,135 @@
 
 from ..context import Context
 from .database import Database
+from .health import database_health
 from ..measurement import Measurement
+from ..measurement import MeasurementState
+from ..measurement import Message
+from ..measurement import MessageDescription
 from ..measurement import measure
 
-# pg_size_pretty(pg_database_size('chartmtg'));
-
 
 @measure(
 	label="Database login",
 	name="login",
 	description="Check we can log into the server",
-	subject_type=Database)
+	subject_type=Database,
+	prerequisite=True)
 def measure_db_login(subject:Database, context:Context):
 	"""Check we can log into databaseand record server info."""
-	connection = subject.connect()
+	with subject.connect():
+		pass
+
 	return Measurement("GOOD")
 
 @measure(
 	label="Database size",
 	name="size",
 	description="Read database size",
-	subject_type=Database)
-def measure_db_size():
+	subject_type=Database,
+	messages=[
+		MessageDescription(
+			name="size",
+			label="Size",
+			description="Total size of database",
+			unit="bytes",
+			humanize=True,
+			datatype=int),
+	]
+)
+def measure_db_size(subject:Database, context:Context):
 	"""Measure the total used size of database."""
-	raise NotImplementedError()
+	if not subject.is_postgres():
+		return Measurement(MeasurementState.NOT_APPLICABLE)
+
+	health = database_health(subject, context)
+	result = Measurement(MeasurementState.GOOD)
+	result.add_message(Message("size", health.size))
+	return result
+
+@measure(
+	label="Database health",
+	name="health",
+	description="Read connection, cache, transaction, replication and query statistics",
+	subject_type=Database,
+	messages=[
+		MessageDescription(
+			name="connections",
+			label="Connections",
+			description="Client connections open to the server",
+			datatype=int),
+		MessageDescription(
+			name="max_connections",
+			label="Max connections",
+			description="Server connection limit",
+			datatype=int),
+		MessageDescription(
+			name="cache_hit",
+			label="Cache hit ratio",
+			description="Percentage of blocks read from the buffer cache since the last run",
+			unit="%",
+			sf=4,
+			datatype=float),
+		MessageDescription(
+			name="xact_rate",
+			label="Transaction rate",
+			description="Transactions per second since the last run",
+			unit="/s",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="replication_lag",
+			label="Replication lag",
+			description="Replay delay of the slowest standby, or of this server if it is a standby",
+			unit="s",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="longest_query",
+			label="Longest query",
+			description="Run time of the longest running active query",
+			unit="s",
+			sf=3,
+			datatype=float),
+	]
+)
+def measure_db_health(subject:Database, context:Context):
+	"""Snapshot of Postgres statistics, read in a single query.
+
+	Cache hit ratio and transaction rate are worked out from the change in counters since
+	the previous run, kept in `context.state`. The first run reports the cache hit ratio
+	since statistics were reset and no transaction rate. Only Postgres databases are
+	supported."""
+	if not subject.is_postgres():
+		return Measurement(MeasurementState.NOT_APPLICABLE)
+
+	health = database_health(subject, context)
+	result = Measurement(MeasurementState.GOOD)
+	result.add_message(Message("connections", health.connections))
+	result.add_message(Message("max_connections", health.max_connections))
+
+	state_key = "db-health.{id}".format(id=subject.get_id())
+	previous = context.state.load(state_key)
+	blks_hit = health.blks_hit
+	blks_read = health.blks_read
+	# counters go backwards if statistics were reset
+	if previous is not None and health.xacts >= previous["xacts"] and health.now > previous["now"]:
+		blks_hit -= previous["blks_hit"]
+		blks_read -= previous["blks_read"]
+		result.add_message(Message("xact_rate",
+								   (health.xacts - previous["xacts"]) / (health.now - previous["now"])))
+
+	if blks_hit + blks_read > 0:
+		result.add_message(Message("cache_hit", blks_hit * 100 / (blks_hit + blks_read)))
+
+	if health.replication_lag is not None:
+		result.add_message(Message("replication_lag", health.replication_lag))
+
+	if health.longest_query is not None:
+		result.add_message(Message("longest_query", health.longest_query))
+
+	context.state.save(state_key, {"blks_hit": health.blks_hit,
+								   "blks_read": health.blks_read,
+								   "xacts": health.xacts,
+								   "now": health.now})
+	return result
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Implementation of EnginePool class."""
+
+import atexit
+import logging
+import threading
+
+import sqlalchemy
+
+logger = logging.getLogger("database")
+
+class EnginePool:
+	"""Process wide cache of SQLAlchemy engines shared by all Database objects and tests.
+
+	One engine, with its own small connection pool, is kept per DSN so any number of
+	Database and Backend subjects pointing at the same database share a few open
+	connections instead of each logging in separately. The settings of the first
+	Database to ask for a DSN are used to create its engine.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		# dsn : Engine
+		self.engines = {}
+
+	def engine(self,
+			   dsn:str,
+			   connect_args:dict=None,
+			   pool_size:int=2,
+			   max_overflow:int=3,
+			   pool_timeout:float=30,
+			   echo:bool=False) -> sqlalchemy.engine.Engine:
+		"""Return the shared engine for `dsn`, creating it on first use.
+
+		Args:
+		- `connect_args`: Extra arguments for the DBAPI connect() call
+		- `pool_size`: Connections kept open to the database
+		- `max_overflow`: Additional connections allowed when all pooled ones are in use
+		- `pool_timeout`: Seconds to wait for a free connection
+		- `echo`: Log every SQL statement
+		"""
+		with self.lock:
+			engine = self.engines.get(dsn)
+			if engine is None:
+				logger.debug("New database engine for {dsn}".format(dsn=dsn))
+				engine = sqlalchemy.create_engine(
+					dsn,
+					connect_args=connect_args or {},
+					pool_size=pool_size,
+					max_overflow=max_overflow,
+					pool_timeout=pool_timeout,
+					# check pooled connections are still alive before handing them out
+					pool_pre_ping=True,
+					echo=echo)
+				self.engines[dsn] = engine
+
+			return engine
+
+	def close(self) -> None:
+		"""Close all pooled connections."""
+		with self.lock:
+			for engine in self.engines.values():
+				engine.dispose()
+
+			self.engines.clear()
+
+# Engines shared by the whole process
+engine_pool = EnginePool()
+atexit.register(engine_pool.close)
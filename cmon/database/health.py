@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Implementation of DatabaseHealth class and database_health() function.
+
+All the statistics the database tests need are read with a single catalog query against
+`pg_stat_database`, `pg_stat_activity` and `pg_stat_replication`, so checking a busy primary
+costs one round trip no matter how many database tests use the results.
+"""
+
+import logging
+
+import sqlalchemy
+
+from ..context import Context
+from .database import Database
+
+logger = logging.getLogger("database")
+
+# Everything is read in one statement. Replication lag is the replay delay of the slowest
+# standby on a primary. On a standby it is the time since the last replayed transaction, or 0
+# if everything received has been replayed, as an idle primary sends no new transactions
+HEALTH_SQL = """SELECT
+	pg_database_size(d.datname) AS size,
+	(SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend') AS connections,
+	current_setting('max_connections')::int AS max_connections,
+	d.blks_hit,
+	d.blks_read,
+	d.xact_commit + d.xact_rollback AS xacts,
+	extract(epoch FROM now()) AS now,
+	CASE WHEN NOT pg_is_in_recovery()
+		THEN (SELECT max(extract(epoch FROM replay_lag)) FROM pg_stat_replication)
+		WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+		ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+	END AS replication_lag,
+	(SELECT max(extract(epoch FROM now() - query_start)) FROM pg_stat_activity
+		WHERE state = 'active' AND pid <> pg_backend_pid()) AS longest_query
+FROM pg_stat_database d
+WHERE d.datname = current_database()"""
+
+class DatabaseHealth:
+	"""Statistics read from a Postgres database."""
+	def __init__(self,
+				 size:int=None,
+				 connections:int=None,
+				 max_connections:int=None,
+				 blks_hit:int=None,
+				 blks_read:int=None,
+				 xacts:int=None,
+				 now:float=None,
+				 replication_lag:float=None,
+				 longest_query:float=None):
+		"""Args:
+		- `size`: Database size in bytes
+		- `connections`: Client connections open to the server
+		- `max_connections`: Server connection limit
+		- `blks_hit`: Blocks found in the buffer cache since statistics were reset
+		- `blks_read`: Blocks read from disk since statistics were reset
+		- `xacts`: Committed and rolled back transactions since statistics were reset
+		- `now`: Server time as a UNIX timestamp
+		- `replication_lag`: Seconds, or None if there is no replication
+		- `longest_query`: Seconds the longest running active query has taken, or None
+		"""
+		self.size = size
+		self.connections = connections
+		self.max_connections = max_connections
+		self.blks_hit = blks_hit
+		self.blks_read = blks_read
+		self.xacts = xacts
+		self.now = now
+		self.replication_lag = replication_lag
+		self.longest_query = longest_query
+
+def collect_health(database:Database) -> DatabaseHealth:
+	"""Read statistics from `database` in a single query."""
+	if not database.is_postgres():
+		raise ValueError("Health statistics are only available for postgresql databases")
+
+	with database.connect() as conn:
+		row = conn.execute(sqlalchemy.text(HEALTH_SQL)).one()._mapping
+
+	# numeric results come back as Decimal
+	return DatabaseHealth(
+		**{k: None if v is None else (float(v) if k in ("now", "replication_lag", "longest_query")
+									  else int(v))
+		   for k, v in row.items()})
+
+def database_health(database:Database, context:Context) -> DatabaseHealth:
+	"""Return statistics for `database`, read once per run and shared by all tests."""
+	return context.cached(("health", database), lambda: collect_health(database))
@@ -5,9 +5,11 @@
 from pathlib import Path
 from datetime import timedelta
 from typing import Iterable
+from typing import Union
 
 from ..testable import Testable
 from ..server.server import Server
+from ..utils import is_listlike
 
 class Dataflow(Testable):
 	name = "dataflow"
@@ -18,22 +20,61 @@ class Dataflow(Testable):
 				 label:str,
 				 directory: Path,
 				 server:Server=None,
-				 pattern:str=None,
+				 pattern:Union[str, Iterable[str]]=None,
 				 max_outage: timedelta=None,
-				 important:bool=True):
+				 important:bool=True,
+				 scan:str="sftp",
+				 max_depth:int=0,
+				 settle:timedelta=None,
+				 window:timedelta=timedelta(hours=24),
+				 baseline:timedelta=timedelta(days=7),
+				 min_throughput:float=None,
+				 watch:bool=False):
 		"""
 		Args:
 		- `directory`: Directory name to test
-		- `server`: Server to ssh into before checking, if needed
-		- `pattern`: Filter files by wildcard
+		- `server`: Server to ssh into before checking. If not given, or it is the host we run
+			on, the directory is read directly
+		- `pattern`: Filter files by wildcard, or a list of wildcards to count files matching any
 		- `max_outage`: Only raise an error if no changes within time frame
 		- `label`: Nice name for this flow
+		- `scan`: How to read the directory on `server`. "sftp" (the default, as before) walks
+			the tree over SFTP, only listing directories which changed since the last run.
+			"find" runs a find | awk pipeline remotely so only totals are transferred (needs
+			GNU find). Servers with `agent` set always use the collector agent
+		- `max_depth`: Levels of subdirectories to include, 0 for just `directory`
+		- `settle`: With "sftp" or local scanning, subtrees with nothing modified for this long are
+			assumed complete and not checked again. The most recently active branch of the
+			tree is always checked, which suits date partitioned directories
+		- `window`: Period over which throughput and arrival gaps are reported
+		- `baseline`: Period before the window giving the normal throughput
+		- `min_throughput`: Fail if files per hour over the window drops below this fraction
+			of the baseline
+		- `watch`: For directories on the host we run on, follow new files with inotify so
+			when the system is run repeatedly in one process only the first check scans
+			the tree
 		"""
 		super(Dataflow, self).__init__(label=label, important=important)
 		self.directory = directory
 		self.server = server
 		self.pattern = pattern
+		if pattern is None:
+			self.patterns = []
+
+		elif is_listlike(pattern):
+			self.patterns = list(pattern)
+
+		else:
+			self.patterns = [pattern]
+
 		self.max_outage = max_outage
+		self.scan = scan
+		self.max_depth = max_depth
+		self.settle = settle
+		self.window = window
+		self.baseline = baseline
+		self.min_throughput = min_throughput
+		self.watch = watch
 
 	def links(self) -> Iterable[Testable]:
 		"""Return our linked items for dashboard display."""
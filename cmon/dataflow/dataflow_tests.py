@@ -4,7 +4,6 @@
 
 from datetime import timedelta
 from datetime import datetime
-from fnmatch import fnmatch
 
 # import humanize
 
@@ -13,8 +12,15 @@ from ..measurement import MeasurementState
 from ..measurement import MessageDescription
 from ..measurement import Message
 from ..measurement import measure
-from ..server.server import Server
 from .dataflow import Dataflow
+from .scan import scan_agent
+from .scan import scan_find
+from .walk import LocalFilesystem
+from .walk import SFTPFilesystem
+from .walk import walk_dataflow
+from .watch import dataflow_watchers
+from .throughput import dataflow_throughput
+from .throughput import arrivals_since
 from ..context import Context
 
 message_description_outage = MessageDescription(
@@ -40,28 +46,97 @@ message_description_outage = MessageDescription(
 			name="newest",
 			label="Newest file",
 			description="Timestamp of most recent matching file",
-			datatype=datetime)
+			datatype=datetime),
+		MessageDescription(
+			name="size",
+			label="Size",
+			description="Total size of matching files",
+			unit="bytes",
+			humanize=True,
+			datatype=int),
+		MessageDescription(
+			name="files_rate",
+			label="File rate",
+			description="New matching files per hour over the window",
+			unit="files/h",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="bytes_rate",
+			label="Data rate",
+			description="New bytes per hour over the window",
+			unit="bytes/h",
+			humanize=True,
+			datatype=float),
+		MessageDescription(
+			name="baseline_rate",
+			label="Baseline file rate",
+			description="New matching files per hour over the baseline period before the window",
+			unit="files/h",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="gap",
+			label="Arrival gap",
+			description=("Median, 95th percentile and longest time between new files seen over "
+						 "the window"),
+			unit="s",
+			sf=3,
+			datatype=float,
+			multiple=dict),
 	]
 )
 def measure_dataflow_outage(subject:Dataflow, context:Context):
 	"""Test if the last modification to any file in a dataflow is older than threshold."""
-	client = subject.server.ssh_connect()
-	if client is None:
+	since = arrivals_since(subject, context)
+	if subject.server is None or subject.server.is_local():
+		if subject.watch:
+			scanned = dataflow_watchers.scan(
+				subject, lambda: walk_dataflow(LocalFilesystem(), subject, context, since))
+
+		else:
+			scanned = walk_dataflow(LocalFilesystem(), subject, context, since)
+
+	elif subject.server.ssh_connect() is None:
 		return Measurement(state=MeasurementState.NOT_APPLICABLE)
 
-	sftp = client.open_sftp()
-	# sftp.chdir(target.directory)
-	matches = 0
-	latest = None
-	age = None
-	for fileattr in sftp.listdir_iter(subject.directory):
-		if fnmatch(fileattr.filename, subject.pattern):
-			matches += 1
-			if latest is None or fileattr.st_mtime > latest:
-				latest = fileattr.st_mtime
+	elif subject.server.agent:
+		scanned = scan_agent(subject.server,
+							 subject.directory,
+							 subject.patterns,
+							 subject.max_depth,
+							 since)
+
+	elif subject.scan == "sftp":
+		with subject.server.ssh_sftp() as sftp:
+			scanned = walk_dataflow(SFTPFilesystem(sftp), subject, context, since)
+
+	else:
+		scanned = scan_find(subject.server,
+							subject.directory,
+							subject.patterns,
+							subject.max_depth,
+							since)
+
+	matches = scanned.files
+	latest = scanned.newest
 
 	result = Measurement()
 	result.add_message(Message("files", matches))
+	result.add_message(Message("size", scanned.size))
+
+	throughput = dataflow_throughput(subject, scanned, context)
+	if throughput.files_rate is not None:
+		result.add_message(Message("files_rate", throughput.files_rate))
+		result.add_message(Message("bytes_rate", throughput.bytes_rate))
+
+	if throughput.baseline_rate is not None:
+		result.add_message(Message("baseline_rate", throughput.baseline_rate))
+
+	for name, q in (("p50", 0.5), ("p95", 0.95), ("max", 1)):
+		gap = throughput.gap(q)
+		if gap is not None:
+			result.add_message(Message("gap", gap, parameter=name))
 
 	if matches == 0:
 		result.state = MeasurementState.FAILED
@@ -76,4 +151,11 @@ def measure_dataflow_outage(subject:Dataflow, context:Context):
 	else:
 		result.state = MeasurementState.FAILED
 
+	# flag a flow which is still arriving but much more slowly than normal
+	if subject.min_throughput is not None and\
+	   throughput.files_rate is not None and\
+	   throughput.baseline_rate is not None and\
+	   throughput.files_rate < subject.min_throughput * throughput.baseline_rate:
+		result.state = MeasurementState.FAILED
+
 	return result
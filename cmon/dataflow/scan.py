@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""Implementation of ScanResult class and the directory scanning functions.
+
+A dataflow check only needs to know how many files match, when the newest one was
+modified and how much space they use. These functions return just that summary, doing as
+much of the work as possible on the server holding the files.
+"""
+
+import shlex
+import logging
+from pathlib import Path
+from typing import Iterable
+
+from ..server.server import Server
+from ..server.server import ConnectionException
+from ..server.agent import run_agent
+from ..server.agent import AgentError
+
+logger = logging.getLogger("dataflow")
+
+# Shell pipeline listing the modification time and size of each matching file in a directory
+# tree and reducing them to a single "count bytes newest arrived arrived_bytes" line, so only
+# that line crosses the network. Arrivals are files modified after `since`. The exit status is
+# that of awk, so find warnings about single entries (unreadable subdirectories, files removed
+# while scanning) do not fail the scan, but a missing directory exits with 2
+FIND_COMMAND = (
+	"test -d {directory} || {{ echo 'No such directory {directory}' >&2; exit 2; }}; "
+	"find {directory} -mindepth 1 -maxdepth {depth} ! -type d {names}-printf '%T@ %s\\n' | "
+	"awk -v since={since} 'BEGIN {{n = 0; s = 0; m = -1; a = 0; b = 0}} "
+	"{{n++; s += $2; if ($1 + 0 > m) m = $1 + 0; if ($1 + 0 > since) {{a++; b += $2}}}} "
+	"END {{printf \"%d %.0f %.6f %d %.0f\\n\", n, s, m, a, b}}'")
+
+class ScanError(Exception):
+	pass
+
+class ScanResult:
+	"""Summary of the files found in a dataflow."""
+	def __init__(self,
+				 files:int=0,
+				 newest:float=None,
+				 size:int=0,
+				 arrived:int=None,
+				 arrived_size:int=None):
+		"""Args:
+		- `files`: Number of matching files
+		- `newest`: Modification time of the newest file as a UNIX timestamp
+		- `size`: Total size of matching files in bytes
+		- `arrived`: Number of matching files modified after the `since` time the scan was
+			given, or None if arrivals were not counted
+		- `arrived_size`: Total size of those files in bytes
+		"""
+		self.files = files
+		self.newest = newest
+		self.size = size
+		self.arrived = arrived
+		self.arrived_size = arrived_size
+
+	def add(self, mtime:float, size:int) -> None:
+		"""Count one file."""
+		self.files += 1
+		self.size += size
+		if self.newest is None or mtime > self.newest:
+			self.newest = mtime
+
+	def merge(self, other:"ScanResult") -> None:
+		"""Add the totals of `other`."""
+		self.files += other.files
+		self.size += other.size
+		if other.newest is not None and (self.newest is None or other.newest > self.newest):
+			self.newest = other.newest
+
+def scan_find(server:Server,
+			  directory:Path,
+			  patterns:Iterable[str]=None,
+			  max_depth:int=0,
+			  since:float=None) -> ScanResult:
+	"""Scan `directory` on `server` with a find | awk pipeline so only the totals are returned.
+	Files modified after `since` are counted as arrivals.
+
+	Needs GNU find for -printf. Warnings find prints about individual entries are logged and
+	the files it could read are counted.
+
+	Raises:
+	ScanError if the directory is missing or the pipeline fails
+	"""
+	client = server.ssh_connect()
+	if client is None:
+		raise ConnectionException("No ssh connection to {host}".format(host=server.hostname))
+
+	if patterns:
+		names = "\\( {names} \\) ".format(names=" -o ".join(
+			"-name {pattern}".format(pattern=shlex.quote(pattern)) for pattern in patterns))
+
+	else:
+		names = ""
+
+	command = FIND_COMMAND.format(directory=shlex.quote(str(directory)),
+								  depth=max_depth + 1,
+								  names=names,
+								  since="{since:.6f}".format(since=-1 if since is None else since))
+	stdin, stdout, stderr = client.exec_command(command, timeout=server.timeout)
+	output = stdout.read().decode().split()
+	error = stderr.read().decode().strip()
+	status = stdout.channel.recv_exit_status()
+	if status != 0 or len(output) != 5:
+		raise ScanError("Scan of {directory} on {host} failed: {error}".format(
+			directory=directory,
+			host=server.hostname,
+			error=error or "exit status {status}".format(status=status)))
+
+	if error:
+		logger.warning("Scan of {directory} on {host}: {error}".format(
+			directory=directory, host=server.hostname, error=error))
+
+	files, size, newest, arrived, arrived_size = output
+	return ScanResult(files=int(files),
+					  newest=None if int(files) == 0 else float(newest),
+					  size=int(size),
+					  arrived=None if since is None else int(arrived),
+					  arrived_size=None if since is None else int(arrived_size))
+
+def scan_agent(server:Server,
+			   directory:Path,
+			   patterns:Iterable[str]=None,
+			   max_depth:int=0,
+			   since:float=None) -> ScanResult:
+	"""Let the collector on `server` scan `directory` and return only the totals. Files
+	modified after `since` are counted as arrivals."""
+	response = run_agent(server, {"dataflows": [{"directory": str(directory),
+												 "patterns": patterns,
+												 "max_depth": max_depth,
+												 "since": since}]})
+	scan = response["dataflows"][0]
+	if "error" in scan:
+		raise AgentError(scan["error"])
+
+	return ScanResult(files=scan["files"],
+					  newest=scan["newest"],
+					  size=scan["size"],
+					  arrived=scan.get("arrived"),
+					  arrived_size=scan.get("arrived_size"))
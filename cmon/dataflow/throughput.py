@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""Throughput and arrival statistics for dataflows from the results of successive scans.
+
+Each scan adds a snapshot of (time, files, size, newest, arrived, arrived size) to the
+dataflow's saved history, so rates are worked out from a few hundred small records instead of
+rescanning any files.
+
+Rates count arrivals, the files modified after the newest file of the previous scan, kept as
+running totals so files being cleaned up do not cancel out new ones. Where a scan cannot count
+arrivals the increase in the number of files is used instead. Files delivered with an older
+modification time than files already there (for example copied with their times preserved) are
+not seen as arrivals.
+"""
+
+import time
+from typing import List
+from typing import Optional
+
+from ..context import Context
+from .dataflow import Dataflow
+from .scan import ScanResult
+
+# Snapshot fields
+TIME = 0
+FILES = 1
+SIZE = 2
+NEWEST = 3
+# running totals of files and bytes arrived since the history started
+ARRIVED = 4
+ARRIVED_SIZE = 5
+SNAPSHOT_FIELDS = 6
+
+# Most snapshots kept for a dataflow, older ones are thinned out beyond this
+MAX_SNAPSHOTS = 500
+
+class Throughput:
+	"""Dataflow activity over its window."""
+	def __init__(self,
+				 files_rate:float=None,
+				 bytes_rate:float=None,
+				 gaps:List[float]=None,
+				 baseline_rate:float=None):
+		"""Args:
+		- `files_rate`: New files per hour
+		- `bytes_rate`: New bytes per hour
+		- `gaps`: Seconds between successive newest files seen, oldest first
+		- `baseline_rate`: New files per hour over the baseline period before the window
+		"""
+		self.files_rate = files_rate
+		self.bytes_rate = bytes_rate
+		self.gaps = [] if gaps is None else gaps
+		self.baseline_rate = baseline_rate
+
+	def gap(self, q:float) -> Optional[float]:
+		"""Gap below which fraction `q` of gaps fall, or None if there are none."""
+		if len(self.gaps) == 0:
+			return None
+
+		ordered = sorted(self.gaps)
+		return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def rates(snapshots:List[list]) -> Optional[List[float]]:
+	"""Files and bytes arrived per hour across `snapshots`.
+
+	Returns None for less than two snapshots."""
+	if len(snapshots) < 2:
+		return None
+
+	hours = (snapshots[-1][TIME] - snapshots[0][TIME]) / 3600
+	if hours <= 0:
+		return None
+
+	files = snapshots[-1][ARRIVED] - snapshots[0][ARRIVED]
+	size = snapshots[-1][ARRIVED_SIZE] - snapshots[0][ARRIVED_SIZE]
+	return [files / hours, size / hours]
+
+def arrivals_since(dataflow:Dataflow, context:Context) -> Optional[float]:
+	"""Time after which files modified count as arrivals for the next scan of `dataflow`.
+
+	This is the newest file seen by the previous scan, 0 if it found no files, or None if
+	there was no previous scan."""
+	history = context.state.load(history_key(dataflow), [])
+	if len(history) == 0:
+		return None
+
+	newest = history[-1][NEWEST]
+	return 0 if newest is None else newest
+
+def next_snapshot(history:List[list], now:float, scanned:ScanResult) -> list:
+	"""Snapshot of `scanned` taken at `now`, adding its arrivals to the totals in `history`."""
+	if len(history) == 0:
+		return [now, scanned.files, scanned.size, scanned.newest, 0, 0]
+
+	last = history[-1]
+	if scanned.arrived is None:
+		# scanner cannot tell, so assume the files added since last time are new
+		arrived = max(0, scanned.files - last[FILES])
+		arrived_size = max(0, scanned.size - last[SIZE])
+
+	else:
+		arrived = scanned.arrived
+		arrived_size = scanned.arrived_size
+
+	return [now,
+			scanned.files,
+			scanned.size,
+			scanned.newest,
+			last[ARRIVED] + arrived,
+			last[ARRIVED_SIZE] + arrived_size]
+
+def thin(snapshots:List[list], limit:int=MAX_SNAPSHOTS) -> List[list]:
+	"""Drop every other snapshot from the older half of `snapshots` until there are at most
+	`limit`. Rates only need the snapshots at each end of a period so stay exact, but older
+	arrival gaps become coarser."""
+	while len(snapshots) > max(limit, 3):
+		half = len(snapshots) // 2
+		snapshots = snapshots[:half:2] + snapshots[half:]
+
+	return snapshots
+
+def history_key(dataflow:Dataflow) -> str:
+	"""State key holding the snapshots of `dataflow`."""
+	return "dataflow-history.{id}".format(id=dataflow.get_id())
+
+def arrival_gaps(snapshots:List[list]) -> List[float]:
+	"""Seconds between each newest file timestamp and the next one seen.
+
+	With several arrivals between two scans only the newest is seen, so each gap is an upper
+	bound on the real gaps in that interval."""
+	result = []
+	previous = None
+	for snapshot in snapshots:
+		newest = snapshot[NEWEST]
+		if newest is None:
+			continue
+
+		if previous is not None and newest > previous:
+			result.append(newest - previous)
+
+		if previous is None or newest > previous:
+			previous = newest
+
+	return result
+
+def dataflow_throughput(dataflow:Dataflow, scanned:ScanResult, context:Context) -> Throughput:
+	"""Add `scanned` to the saved history of `dataflow` and return its current throughput."""
+	key = history_key(dataflow)
+	now = time.time()
+	window = dataflow.window.total_seconds()
+	baseline = 0 if dataflow.baseline is None else dataflow.baseline.total_seconds()
+	# snapshots saved before arrivals were counted are dropped
+	history = [s for s in context.state.load(key, []) if len(s) == SNAPSHOT_FIELDS]
+	history.append(next_snapshot(history, now, scanned))
+	history = thin([s for s in history if s[TIME] >= now - window - baseline])
+	context.state.save(key, history)
+
+	recent = [s for s in history if s[TIME] >= now - window]
+	result = Throughput(gaps=arrival_gaps(recent))
+	recent_rates = rates(recent)
+	if recent_rates is not None:
+		result.files_rate, result.bytes_rate = recent_rates
+
+	# only compare against a baseline covering at least as long as the window
+	older = [s for s in history if s[TIME] <= now - window]
+	if len(older) >= 2 and older[-1][TIME] - older[0][TIME] >= window:
+		result.baseline_rate = rates(older)[0]
+
+	return result
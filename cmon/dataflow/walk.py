@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+"""Incremental recursive scanning of dataflow directory trees.
+
+Adding, removing or renaming a file changes the modification time of its directory, so a
+directory whose mtime is the same as at the last scan does not need listing again. The totals
+for each directory are saved between runs and only changed directories are listed, making
+the cost of a scan follow the amount of new data rather than the size of the archive.
+
+Files rewritten in place without being renamed do not change their directory so are only
+noticed when something else in the directory changes.
+"""
+
+import os
+import stat
+import time
+import logging
+import posixpath
+from fnmatch import fnmatch
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+from ..context import Context
+from .dataflow import Dataflow
+from .scan import ScanResult
+
+if TYPE_CHECKING:
+	import paramiko
+
+logger = logging.getLogger("dataflow")
+
+# Directories modified this recently (in seconds) are listed again next time, since more files
+# could arrive within the same mtime tick
+MTIME_SLACK = 2
+
+class Entry:
+	"""One directory entry read from a Filesystem."""
+	__slots__ = ("name", "is_dir", "mtime", "size")
+
+	def __init__(self, name:str, is_dir:bool, mtime:float, size:int):
+		self.name = name
+		self.is_dir = is_dir
+		self.mtime = mtime
+		self.size = size
+
+class Filesystem:
+	"""Minimal read only directory access needed by `Walk`."""
+	def mtime(self, path:str) -> float:
+		"""Modification time of `path`."""
+		raise NotImplementedError()
+
+	def entries(self, path:str) -> Iterator[Entry]:
+		"""All entries of directory `path`."""
+		raise NotImplementedError()
+
+class SFTPFilesystem(Filesystem):
+	"""Directories read over an SFTP session. Listings include attributes so each file costs
+	no extra round trip."""
+	def __init__(self, sftp:"paramiko.SFTPClient"):
+		self.sftp = sftp
+
+	def mtime(self, path:str) -> float:
+		return self.sftp.stat(path).st_mtime
+
+	def entries(self, path:str) -> Iterator[Entry]:
+		for attr in self.sftp.listdir_iter(path):
+			yield Entry(attr.filename, stat.S_ISDIR(attr.st_mode), attr.st_mtime, attr.st_size)
+
+class LocalEntry:
+	"""Entry from `os.scandir()`. The file is only stat'ed if its mtime or size is needed,
+	and the DirEntry caches the result."""
+	__slots__ = ("entry", "name", "is_dir")
+
+	def __init__(self, entry:os.DirEntry):
+		self.entry = entry
+		self.name = entry.name
+		# file type comes with the directory listing on most filesystems so costs nothing
+		self.is_dir = entry.is_dir(follow_symlinks=False)
+
+	@property
+	def mtime(self) -> float:
+		return self.entry.stat(follow_symlinks=False).st_mtime
+
+	@property
+	def size(self) -> int:
+		return self.entry.stat(follow_symlinks=False).st_size
+
+class LocalFilesystem(Filesystem):
+	"""Directories on the monitoring host, including network mounts, read without ssh."""
+	def mtime(self, path:str) -> float:
+		return os.stat(path).st_mtime
+
+	def entries(self, path:str) -> Iterator[LocalEntry]:
+		with os.scandir(path) as it:
+			for entry in it:
+				yield LocalEntry(entry)
+
+def matches(name:str, patterns:Iterable[str]) -> bool:
+	"""Test if `name` matches any of `patterns`, or if there are no patterns."""
+	return not patterns or any(fnmatch(name, pattern) for pattern in patterns)
+
+class Walk:
+	"""One incremental scan of a directory tree.
+
+	`previous` is the directory state saved by the last scan, which is a map of directory
+	path against:
+	- `mtime`: Directory mtime when it was listed, or None if it must be listed again
+	- `own`: (files, newest, size) of matching files directly inside the directory
+	- `dirs`: Names of subdirectories
+	- `tree`: (files, newest, size) for the whole subtree
+	- `latest`: Most recent file or directory mtime in the subtree
+	"""
+	def __init__(self,
+				 filesystem:Filesystem,
+				 patterns:Iterable[str],
+				 max_depth:int,
+				 previous:Dict[str, dict],
+				 now:float,
+				 settle:float=None,
+				 since:float=None):
+		"""Args:
+		- `max_depth`: Levels of subdirectories to descend into, 0 for just the top directory
+		- `now`: Current time as a UNIX timestamp
+		- `settle`: If set, subtrees with nothing newer than this many seconds are assumed
+			complete and are not checked at all, except for the most recently active
+			subdirectory at each level
+		- `since`: If set, files modified after this UNIX timestamp are counted as arrivals.
+			They can only be in directories which changed so cost nothing extra to find
+		"""
+		self.filesystem = filesystem
+		self.patterns = patterns
+		self.max_depth = max_depth
+		self.previous = previous
+		self.now = now
+		self.settle = settle
+		self.since = since
+		self.state = {}
+		# files and bytes modified after `since`
+		self.arrived = 0
+		self.arrived_size = 0
+		# directories listed, checked with a single stat, or skipped as settled
+		self.listed = 0
+		self.unchanged = 0
+		self.settled = 0
+
+	def run(self, root:str) -> ScanResult:
+		"""Scan the tree below `root`."""
+		tree, _ = self.visit(root, self.filesystem.mtime(root), 0)
+		if self.since is not None:
+			tree.arrived = self.arrived
+			tree.arrived_size = self.arrived_size
+
+		logger.debug("Scanned {root}: {listed} directories listed, {unchanged} unchanged, "
+					 "{settled} settled".format(root=root,
+												listed=self.listed,
+												unchanged=self.unchanged,
+												settled=self.settled))
+		return tree
+
+	def keep(self, path:str) -> None:
+		"""Carry the saved state of `path` and its subtree over to this scan."""
+		old = self.previous[path]
+		self.state[path] = old
+		for name in old["dirs"]:
+			child = posixpath.join(path, name)
+			if child in self.previous:
+				self.keep(child)
+
+	def is_settled(self, path:str, mtime:float) -> bool:
+		"""Test if the subtree at `path` is unchanged and has had nothing new for `settle`."""
+		old = self.previous.get(path)
+		return self.settle is not None and\
+			old is not None and\
+			old["mtime"] == mtime and\
+			old["latest"] < self.now - self.settle
+
+	def visit(self, path:str, mtime:float, depth:int) -> Tuple[ScanResult, float]:
+		"""Scan directory `path`, returning totals and the latest mtime for its subtree."""
+		old = self.previous.get(path)
+		unchanged = old is not None and old["mtime"] is not None and old["mtime"] == mtime
+		dirs = {}
+		if unchanged:
+			self.unchanged += 1
+			own = ScanResult(*old["own"])
+			if depth < self.max_depth:
+				for name in old["dirs"]:
+					try:
+						dirs[name] = self.filesystem.mtime(posixpath.join(path, name))
+					except FileNotFoundError:
+						pass
+
+		else:
+			self.listed += 1
+			own = ScanResult()
+			for entry in self.filesystem.entries(path):
+				if entry.is_dir:
+					if depth < self.max_depth:
+						dirs[entry.name] = entry.mtime
+
+				elif matches(entry.name, self.patterns):
+					own.add(entry.mtime, entry.size)
+					if self.since is not None and entry.mtime > self.since:
+						self.arrived += 1
+						self.arrived_size += entry.size
+
+		tree = ScanResult(own.files, own.newest, own.size)
+		latest = mtime if own.newest is None else max(mtime, own.newest)
+		# new data in date partitioned trees lands below the most recently active subdirectory,
+		# so that one is always checked even if it looks settled
+		active = max(dirs,
+					 key=lambda name: (self.previous.get(posixpath.join(path, name), {}).get("latest", 0),
+									   name),
+					 default=None)
+		for name, child_mtime in dirs.items():
+			child = posixpath.join(path, name)
+			if name != active and self.is_settled(child, child_mtime):
+				self.settled += 1
+				self.keep(child)
+				subtree = ScanResult(*self.previous[child]["tree"])
+				sublatest = self.previous[child]["latest"]
+
+			else:
+				subtree, sublatest = self.visit(child, child_mtime, depth + 1)
+
+			tree.merge(subtree)
+			latest = max(latest, sublatest)
+
+		self.state[path] = {
+			"mtime": mtime if mtime < self.now - MTIME_SLACK else None,
+			"own": [own.files, own.newest, own.size],
+			"dirs": list(dirs),
+			"tree": [tree.files, tree.newest, tree.size],
+			"latest": latest,
+		}
+		return tree, latest
+
+def walk_dataflow(filesystem:Filesystem,
+				  dataflow:Dataflow,
+				  context:Context,
+				  since:float=None) -> ScanResult:
+	"""Scan `dataflow` through `filesystem` using directory state saved by the previous run,
+	counting files modified after `since` as arrivals."""
+	key = "dataflow.{id}".format(id=dataflow.get_id())
+	settings = [str(dataflow.directory), dataflow.patterns, dataflow.max_depth]
+	saved = context.state.load(key)
+	if saved is None or saved["settings"] != settings:
+		previous = {}
+
+	else:
+		previous = saved["dirs"]
+
+	walk = Walk(filesystem,
+				patterns=dataflow.patterns,
+				max_depth=dataflow.max_depth,
+				previous=previous,
+				now=time.time(),
+				settle=None if dataflow.settle is None else dataflow.settle.total_seconds(),
+				since=since)
+	result = walk.run(str(dataflow.directory))
+	context.state.save(key, {"settings": settings, "dirs": walk.state})
+	return result
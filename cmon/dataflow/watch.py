@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+"""Implementation of DataflowWatcher and WatcherPool classes.
+
+For dataflows on the monitoring host itself, Linux inotify tells us about each file as it
+lands, so when cmon runs repeatedly in one process (by a program calling `System.run()` in a
+loop, the command line tool runs once) the outage test can answer from totals kept in memory
+instead of rescanning directories every time.
+
+Each watcher lists the tree once when it starts, keeping the mtime and size of every matching
+file, so later arrivals, rewrites and removals adjust the totals without listing anything.
+Events for files landing while that first listing runs wait in the kernel queue and are applied
+afterwards. The tree is only listed again by a new watcher if the queue overflows or the top
+directory is removed.
+"""
+
+import os
+import errno
+import ctypes
+import ctypes.util
+import atexit
+import select
+import struct
+import time
+import logging
+import threading
+from typing import Callable
+from typing import Optional
+
+from .dataflow import Dataflow
+from .scan import ScanResult
+from .walk import matches
+
+logger = logging.getLogger("dataflow")
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+			  IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+EVENT = struct.Struct("iIII")
+
+# Seconds between checks for the watcher being closed
+POLL_INTERVAL = 1
+
+# Seconds before trying again to watch a dataflow which could not be watched
+RETRY_INTERVAL = 600
+
+class WatchError(Exception):
+	pass
+
+def load_libc() -> Optional[ctypes.CDLL]:
+	"""Return the C library if it provides inotify, otherwise None."""
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		libc.inotify_init1
+		libc.inotify_add_watch
+		libc.inotify_rm_watch
+	except (OSError, AttributeError):
+		return None
+
+	libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+	return libc
+
+libc = load_libc()
+
+class DataflowWatcher:
+	"""Keep file count, size and newest mtime for a local dataflow up to date from inotify events.
+
+	`lost` is set when events were missed, after which `current()` returns None and the
+	watcher should be replaced.
+	"""
+	def __init__(self, dataflow:Dataflow):
+		if libc is None:
+			raise WatchError("inotify is not available")
+
+		self.dataflow = dataflow
+		self.lock = threading.Lock()
+		# wd : (directory path, depth)
+		self.watches = {}
+		# wd : {name : (mtime, size)} of the matching files in each watched directory
+		self.files = {}
+		self.totals = ScanResult()
+		# the newest file was removed or rewritten older so `totals.newest` must be found again
+		self.newest_stale = False
+		# files and bytes added since the last `current()`, None until it is first called
+		self.arrived = None
+		self.arrived_size = None
+		self.lost = False
+		self.closed = False
+		self.fd = libc.inotify_init1(IN_CLOEXEC)
+		if self.fd < 0:
+			raise WatchError("inotify_init1 failed: {e}".format(e=os.strerror(ctypes.get_errno())))
+
+		try:
+			self.add_tree(str(dataflow.directory), 0)
+		except Exception:
+			os.close(self.fd)
+			raise
+
+		self.thread = threading.Thread(target=self.read_events,
+									   name="watch-{id}".format(id=dataflow.get_id()),
+									   daemon=True)
+		self.thread.start()
+
+	def add_tree(self, path:str, depth:int) -> None:
+		"""Watch `path` and its subdirectories down to the dataflow `max_depth` and record the
+		files already there."""
+		wd = libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+		if wd < 0:
+			code = ctypes.get_errno()
+			if code == errno.ENOSPC:
+				raise WatchError("Too many inotify watches, raise fs.inotify.max_user_watches")
+
+			raise WatchError("Cannot watch {path}: {e}".format(path=path, e=os.strerror(code)))
+
+		self.watches[wd] = (path, depth)
+		found = []
+		with os.scandir(path) as it:
+			for entry in it:
+				if entry.is_dir(follow_symlinks=False):
+					if depth < self.dataflow.max_depth:
+						self.add_tree(entry.path, depth + 1)
+
+				elif matches(entry.name, self.dataflow.patterns):
+					try:
+						stat = entry.stat(follow_symlinks=False)
+					except FileNotFoundError:
+						continue
+
+					found.append((entry.name, stat.st_mtime, stat.st_size))
+
+		with self.lock:
+			for name, mtime, size in found:
+				self.set_file(wd, name, mtime, size)
+
+	def remove_tree(self, path:str) -> None:
+		"""Stop watching `path` and its subdirectories and forget their files."""
+		prefix = os.path.join(path, "")
+		for wd, (watched, _) in list(self.watches.items()):
+			if watched == path or watched.startswith(prefix):
+				with self.lock:
+					for name in list(self.files.get(wd, ())):
+						self.remove_file(wd, name)
+
+					self.files.pop(wd, None)
+
+				del self.watches[wd]
+				# fails harmlessly if the directory is already gone
+				libc.inotify_rm_watch(self.fd, wd)
+
+	def set_file(self, wd:int, name:str, mtime:float, size:int) -> None:
+		"""Record a new or rewritten file. Called with `lock` held."""
+		files = self.files.setdefault(wd, {})
+		old = files.get(name)
+		if old is None:
+			self.totals.files += 1
+			if self.arrived is not None:
+				self.arrived += 1
+				self.arrived_size += size
+
+		else:
+			self.totals.size -= old[1]
+			if mtime < old[0] and old[0] == self.totals.newest:
+				self.newest_stale = True
+
+		files[name] = (mtime, size)
+		self.totals.size += size
+		if self.totals.newest is None or mtime > self.totals.newest:
+			self.totals.newest = mtime
+
+	def remove_file(self, wd:int, name:str) -> None:
+		"""Forget a removed file. Called with `lock` held."""
+		old = self.files.get(wd, {}).pop(name, None)
+		if old is None:
+			return
+
+		self.totals.files -= 1
+		self.totals.size -= old[1]
+		if old[0] == self.totals.newest:
+			self.newest_stale = True
+
+	def current(self) -> Optional[ScanResult]:
+		"""Return the current totals with the files arrived since the last call, or None if
+		events were lost."""
+		with self.lock:
+			if self.lost:
+				return None
+
+			if self.newest_stale:
+				self.totals.newest = max((mtime
+										  for files in self.files.values()
+										  for mtime, _ in files.values()),
+										 default=None)
+				self.newest_stale = False
+
+			result = ScanResult(self.totals.files,
+								self.totals.newest,
+								self.totals.size,
+								self.arrived,
+								self.arrived_size)
+			self.arrived = 0
+			self.arrived_size = 0
+			return result
+
+	def invalidate(self, reason:str) -> None:
+		"""Give up on the totals so the next check does a full scan."""
+		logger.info("Watcher for {directory} needs a rescan: {reason}".format(
+			directory=self.dataflow.directory, reason=reason))
+		with self.lock:
+			self.lost = True
+
+	def read_events(self) -> None:
+		"""Thread body reading and handling events until `close()`."""
+		while not self.closed:
+			try:
+				ready, _, _ = select.select([self.fd], [], [], POLL_INTERVAL)
+				if not ready:
+					continue
+
+				data = os.read(self.fd, 65536)
+			except (OSError, ValueError):
+				break
+
+			offset = 0
+			while offset < len(data):
+				wd, mask, _, length = EVENT.unpack_from(data, offset)
+				offset += EVENT.size
+				name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+				offset += length
+				try:
+					self.handle(wd, mask, name)
+				except (OSError, WatchError) as e:
+					self.invalidate(str(e))
+
+	def handle(self, wd:int, mask:int, name:str) -> None:
+		"""Update totals for one event."""
+		if mask & IN_Q_OVERFLOW:
+			self.invalidate("event queue overflow")
+			return
+
+		if wd not in self.watches:
+			return
+
+		path, depth = self.watches[wd]
+		if mask & IN_IGNORED:
+			# the directory itself was removed
+			self.remove_tree(path)
+			if depth == 0:
+				self.invalidate("{path} was removed".format(path=path))
+
+			return
+
+		if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+			return
+
+		full = os.path.join(path, name)
+		if mask & IN_ISDIR:
+			if mask & (IN_CREATE | IN_MOVED_TO) and depth < self.dataflow.max_depth:
+				# files may have landed before the watch was added
+				self.add_tree(full, depth + 1)
+
+			elif mask & (IN_DELETE | IN_MOVED_FROM):
+				self.remove_tree(full)
+
+			return
+
+		if not matches(name, self.dataflow.patterns):
+			return
+
+		if mask & (IN_DELETE | IN_MOVED_FROM):
+			with self.lock:
+				self.remove_file(wd, name)
+
+		elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+			# files are counted once written, not when created empty
+			try:
+				stat = os.stat(full, follow_symlinks=False)
+			except FileNotFoundError:
+				# removed again already, its delete event follows
+				return
+
+			with self.lock:
+				self.set_file(wd, name, stat.st_mtime, stat.st_size)
+
+	def close(self) -> None:
+		"""Stop watching."""
+		self.closed = True
+		self.thread.join()
+		os.close(self.fd)
+
+class WatcherPool:
+	"""Process wide set of watchers for local dataflows, kept between runs."""
+	def __init__(self):
+		self.lock = threading.Lock()
+		# (directory, patterns, max_depth) : DataflowWatcher
+		self.watchers = {}
+		# (directory, patterns, max_depth) : lock held while a watcher is started
+		self.key_locks = {}
+		# (directory, patterns, max_depth) : time.monotonic() of the last failure to watch
+		self.failures = {}
+
+	def scan(self, dataflow:Dataflow, full_scan:Callable[[], ScanResult]) -> ScanResult:
+		"""Return the totals for `dataflow` from its watcher, calling `full_scan()` only if it
+		cannot be watched. A watcher which has lost track is replaced by a new one, and a
+		dataflow which could not be watched is tried again after `RETRY_INTERVAL`."""
+		key = (str(dataflow.directory), tuple(dataflow.patterns), dataflow.max_depth)
+		with self.lock:
+			key_lock = self.key_locks.setdefault(key, threading.Lock())
+			watcher = self.watchers.get(key)
+
+		# a new watcher lists the whole tree, so only scans of the same dataflow wait for it
+		if watcher is None or watcher.lost:
+			with key_lock:
+				watcher = self.start(key, dataflow)
+
+		if watcher is None:
+			return full_scan()
+
+		result = watcher.current()
+		if result is None:
+			return full_scan()
+
+		return result
+
+	def start(self, key:tuple, dataflow:Dataflow) -> Optional[DataflowWatcher]:
+		"""Return a working watcher for `key`, starting one if needed, or None if `dataflow`
+		cannot be watched. The caller holds the lock for `key`."""
+		with self.lock:
+			watcher = self.watchers.get(key)
+
+		if watcher is not None and not watcher.lost:
+			# started by another scan while we waited
+			return watcher
+
+		if watcher is not None:
+			# a new watcher lists the tree again
+			watcher.close()
+			watcher = None
+
+		failed = self.failures.get(key)
+		if failed is None or time.monotonic() - failed >= RETRY_INTERVAL:
+			try:
+				watcher = DataflowWatcher(dataflow)
+				self.failures.pop(key, None)
+			except (WatchError, OSError) as e:
+				logger.warning("Cannot watch {directory}, scanning instead: {e}".format(
+					directory=dataflow.directory, e=e))
+				self.failures[key] = time.monotonic()
+
+		with self.lock:
+			if watcher is None:
+				self.watchers.pop(key, None)
+
+			else:
+				self.watchers[key] = watcher
+
+		return watcher
+
+	def close(self) -> None:
+		"""Stop all watchers."""
+		with self.lock:
+			watchers = list(self.watchers.values())
+			self.watchers.clear()
+			self.failures.clear()
+
+		for watcher in watchers:
+			watcher.close()
+
+# Watchers shared by the whole process
+dataflow_watchers = WatcherPool()
+atexit.register(dataflow_watchers.close)
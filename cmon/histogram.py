@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Streaming histogram for latency percentiles."""
+
+import math
+
+class Histogram:
+	"""Streaming histogram of non-negative values with bounded relative error.
+
+	Values are counted in logarithmic buckets, so memory depends on the range of values
+	seen rather than how many were recorded, and any percentile is reported within
+	`precision` (as a fraction) of a real recorded value.
+	"""
+	def __init__(self, precision:float=0.01):
+		"""Args:
+		- `precision`: Maximum relative error of reported percentiles
+		"""
+		self.precision = precision
+		self.gamma = (1 + precision) / (1 - precision)
+		self.log_gamma = math.log(self.gamma)
+		self.buckets = {}
+		# values too small to bucket are counted as zero
+		self.zeros = 0
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+	def record(self, value:float) -> None:
+		"""Add one observation."""
+		self.count += 1
+		self.total += value
+		if self.min is None or value < self.min:
+			self.min = value
+
+		if self.max is None or value > self.max:
+			self.max = value
+
+		if value <= 1e-9:
+			self.zeros += 1
+
+		else:
+			index = math.ceil(math.log(value) / self.log_gamma)
+			self.buckets[index] = self.buckets.get(index, 0) + 1
+
+	def merge(self, other:"Histogram") -> None:
+		"""Add all observations from `other`, which must have the same precision."""
+		if other.gamma != self.gamma:
+			raise ValueError("Cannot merge histograms of different precision")
+
+		for index, count in other.buckets.items():
+			self.buckets[index] = self.buckets.get(index, 0) + count
+
+		self.zeros += other.zeros
+		self.count += other.count
+		self.total += other.total
+		for value in (other.min, other.max):
+			if value is not None:
+				self.min = value if self.min is None else min(self.min, value)
+				self.max = value if self.max is None else max(self.max, value)
+
+	@property
+	def mean(self) -> float:
+		if self.count == 0:
+			return None
+
+		return self.total / self.count
+
+	def percentile(self, q:float) -> float:
+		"""Value below which fraction `q` (0 to 1) of observations fall, or None if empty."""
+		if self.count == 0:
+			return None
+
+		rank = q * (self.count - 1)
+		seen = self.zeros
+		if rank < seen:
+			return 0.0
+
+		for index in sorted(self.buckets):
+			seen += self.buckets[index]
+			if rank < seen:
+				# midpoint of the bucket (gamma^(i-1), gamma^i], clamped to what was seen
+				value = 2 * self.gamma ** index / (self.gamma + 1)
+				return min(max(value, self.min), self.max)
+
+		return self.max
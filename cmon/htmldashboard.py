@@ -75,6 +75,7 @@ bootstrap_theme = Theme(
 		MeasurementState.FAILED: "badge rounded-pill text-bg-danger",
 		MeasurementState.ERROR: "badge rounded-pill text-bg-danger",
 		MeasurementState.MIXED: "badge rounded-pill text-bg-warning",
+		MeasurementState.SKIPPED: "badge rounded-pill text-bg-secondary",
 	},
 	icons={
 		# shield
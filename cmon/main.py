@@ -4,10 +4,13 @@
 
 # PYTHON_ARGCOMPLETE_OK enable argcomplete global completion
 
+import sys
 import logging
 import argparse
 import runpy
 from pathlib import Path
+from collections import defaultdict
+from datetime import datetime
 
 import dotenv
 import argcomplete
@@ -16,8 +19,10 @@ from .context import Context
 from .htmldashboard import html_dashboards
 from .log import init_log
 from .terminaldashboard import terminal_dashboards
+from .terminaldashboard import terminal_progress
 from .terminalprinter import TerminalPrinter
 from .result import result_lines
+from .storage import HistoryStore
 
 
 def main():
@@ -69,6 +74,37 @@ def main():
 	parser.add_argument("--include-subjects",
 						nargs="+",
 						help="Only run named subjects")
+	parser.add_argument("--jobs",
+						type=int,
+						default=1,
+						metavar="N",
+						help="Number of subjects to test in parallel")
+	parser.add_argument("--asyncio",
+						action="store_true",
+						dest="use_asyncio",
+						help=("Run all subjects on one asyncio event loop. Tests which are not "
+							  "coroutines run in a pool of --jobs threads"))
+	parser.add_argument("--timeout",
+						type=float,
+						metavar="SECONDS",
+						help=("Give up on any single test which takes longer than this (default no "
+							  "limit). The thread running it is abandoned, not cancelled, so "
+							  "anything it holds stays in use until it finishes"))
+	parser.add_argument("--deadline",
+						type=float,
+						metavar="SECONDS",
+						help=("Give up on all tests still running after this time from the start. "
+							  "Their threads are abandoned, not cancelled"))
+	parser.add_argument("--state-dir",
+						type=Path,
+						metavar="DIR",
+						help=("Directory for state kept between runs by incremental tests, for "
+							  "example ~/.cache/cmon/state. If not given state only lasts for "
+							  "this run"))
+	parser.add_argument("--history",
+						type=Path,
+						metavar="FILE",
+						help="Add all results to this SQLite result history database")
 	parser.add_argument("--logtest",
 						action="store_true",
 						help="To a quick test of logging system and quit")
@@ -120,16 +156,38 @@ def main():
 
 		parser.exit()
 
-	all_results = system.run(Context(simulate=False,
-									 verbose=args.verbose,
-									 include_tests=args.include_tests,
-									 include_subjects=args.include_subjects))
+	context = Context(simulate=False,
+					  verbose=args.verbose,
+					  include_tests=args.include_tests,
+					  include_subjects=args.include_subjects,
+					  jobs=args.jobs,
+					  use_asyncio=args.use_asyncio,
+					  timeout=args.timeout,
+					  deadline=args.deadline,
+					  state_dir=args.state_dir)
+	# show results as they arrive. The terminal dashboards need every result so only
+	# progress lines are shown until the run is complete
+	all_results = defaultdict(list)
+	output = TerminalPrinter()
+	progress = TerminalPrinter(target=sys.stderr)
+	for measurement in system.stream(context):
+		all_results[measurement.subject].append(measurement)
+		if args.output_result:
+			result_lines(output, measurement)
+			sys.stdout.flush()
+
+		elif args.output_terminal:
+			terminal_progress(progress, measurement)
+
+	if args.history:
+		history = HistoryStore(args.history)
+		history.record((result for subject_results in all_results.values() for result in subject_results),
+					   execution_start=context.execute_start,
+					   execution_stop=datetime.utcnow())
+		history.compact()
+		history.close()
 
 	if args.output_result:
-		for subject_results in all_results.values():
-			for result in subject_results:
-				result_lines(TerminalPrinter(), result)
-
 		parser.exit()
 
 	if args.output_terminal:
@@ -3,6 +3,7 @@
 """Implementation of measurement classes."""
 
 import logging
+import inspect
 from enum import Enum
 from typing import Iterable
 from typing import Union
@@ -27,6 +28,7 @@ class MeasurementState(Enum):
 	MIXED = "mixed"
 	IN_PROGRESS = "in progress"
 	EMPTY = "empty"
+	SKIPPED = "skipped"
 
 MeasurementState.GOOD.description = "Measurement was made and was successful"
 MeasurementState.NOT_APPLICABLE.description = "Measurement was skipped as not relevant"
@@ -34,6 +36,8 @@ MeasurementState.FAILED.description = "Measurement was made but a problem was de
 MeasurementState.ERROR.description = "Measurement could not be reliably made due to an error"
 MeasurementState.MIXED.description = "A mixure of good and bad results"
 MeasurementState.IN_PROGRESS.description = "The result is being processed"
+MeasurementState.SKIPPED.description = ("Measurement was not attempted because something it "
+										 "relies on failed")
 
 class MessageDescription:
 	"""Additional information that forms part of a measurement result."""
@@ -76,28 +80,68 @@ class MessageDescription:
 		self.multiple = multiple
 		self.template = template
 
+# Message attached by the test runner when a measurement could not be made at all
+message_description_error = MessageDescription(
+	name="error",
+	label="Error",
+	description="Reason the measurement could not be made")
+
+# Message attached by the test runner when a measurement was not attempted
+message_description_skipped = MessageDescription(
+	name="skipped",
+	label="Skipped",
+	description="Reason the measurement was not attempted")
+
 def measure(
 		label:str,
 		subject_type:type,
 		name:str=None,
 		description:str=None,
-		messages:Iterable[MessageDescription]=[]):
-	"""Decorator to declare a measurement used to test a subject."""
+		messages:Iterable[MessageDescription]=[],
+		prerequisite:Union[bool, Callable[[Testable], bool]]=False,
+		timeout:float=None):
+	"""Decorator to declare a measurement used to test a subject.
+
+	The test function may be a coroutine (`async def`), in which case the decorated
+	function is also a coroutine and `is_async` is set on it.
+
+	If `prerequisite` is set and the measurement fails, the remaining tests of the subject
+	and all tests of subjects which link to it are skipped. It may also be a function of the
+	subject, so subjects can opt in.
+
+	`timeout` is the maximum time in seconds the test may take, overriding the default
+	from the `Context`. A test which runs out of time is abandoned and gives an ERROR."""
 	def decorator_imp(func):
-		def func_imp(*args, **kwargs):
-			result = func(*args, **kwargs)
-			return result
+		if inspect.iscoroutinefunction(func):
+			async def func_imp(*args, **kwargs):
+				result = await func(*args, **kwargs)
+				return result
 
+		else:
+			def func_imp(*args, **kwargs):
+				result = func(*args, **kwargs)
+				return result
+
+		func_imp.is_async = inspect.iscoroutinefunction(func)
 		func_imp.label = label
 		func_imp.name = name
 		func_imp.subject_type = subject_type
 		func_imp.description = description
 		func_imp.messages = messages
+		func_imp.prerequisite = prerequisite
+		func_imp.timeout = timeout
 		func_imp.decorator = measure
 		return func_imp
 
 	return decorator_imp
 
+def is_prerequisite(test:callable, subject:Testable) -> bool:
+	"""Test if `test` is a prerequisite for `subject`."""
+	if callable(test.prerequisite):
+		return bool(test.prerequisite(subject))
+
+	return test.prerequisite
+
 class Message:
 	"""Give additional context to a test result."""
 	def __init__(self,
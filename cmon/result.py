@@ -4,6 +4,7 @@
 
 from .terminalprinter import TerminalPrinter
 from .measurement import Measurement
+from .measurement import Message
 
 def markup(in_str:str) -> str:
 	"""Make `in_str` safe for writing to dot delimited files.
@@ -20,6 +21,22 @@ def markup(in_str:str) -> str:
 
 	return res
 
+def result_key(measurement:Measurement, message:Message=None) -> str:
+	"""Dotted name identifying the state of `measurement`, or one of its messages.
+
+	These names are used both for `result_lines()` and as series names in the result history.
+	"""
+	key = "{classname}.{objectid}.{testname}".format(
+		classname=markup(type(measurement.subject).name),
+		objectid=markup(measurement.subject.get_id()),
+		testname=markup(measurement.test_fn.name))
+	if message is None:
+		return key
+
+	return "{key}.{messagename}{parameter}".format(
+		key=key,
+		messagename=message.name,
+		parameter="" if message.parameter is None else ".{param}".format(param=message.parameter))
 
 def result_lines(output:TerminalPrinter,
 				 measurement:Measurement) -> None:
@@ -36,33 +53,14 @@ def result_lines(output:TerminalPrinter,
 	(parameterised or dict messages)
 	classname.objectname.testname.messagename.parameter=value
 	"""
-	# print("write measurement", measurement, "subject", measurement.subject,
-		  # "subject label", measurement.subject.label, "subject name", measurement.subject.name)
-	output.write_line("{classname}.{objectid}.{testname}={result}".format(
-		classname=markup(type(measurement.subject).name),
-		objectid=markup(measurement.subject.get_id()),
-		testname=markup(measurement.test_fn.name),
-		result=measurement.state.name))
+	output.write_line("{key}={result}".format(key=result_key(measurement),
+											 result=measurement.state.name))
 	for message in measurement.messages:
 		# print("message", message, "description", message.description)
 		if message.error is None:
-			output.write_line(
-				"{classname}.{objectid}.{testname}.{messagename}{parameter}={value}".format(
-					classname=markup(type(measurement.subject).name),
-					objectid=markup(measurement.subject.get_id()),
-					testname=markup(measurement.test_fn.name),
-					messagename=message.name,
-					parameter="" if message.parameter is None else ".{param}".format(
-						param=message.parameter),
-					value=markup(message.value)))
+			output.write_line("{key}={value}".format(key=result_key(measurement, message),
+													 value=markup(message.value)))
 
 		else:
-			output.write_line(
-				"{classname}.{objectid}.{testname}.{messagename}{parameter}=ERROR: {error}".format(
-					classname=markup(type(measurement.subject).name),
-					objectid=markup(measurement.subject.get_id()),
-					testname=markup(measurement.test_fn.name),
-					messagename=message.name,
-					parameter="" if message.parameter is None else ".{param}".format(
-						param=message.parameter),
-					error=message.error))
+			output.write_line("{key}=ERROR: {error}".format(key=result_key(measurement, message),
+															error=message.error))
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+"""Implementation of Runner class."""
+
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from functools import partial
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from .context import Context
+from .measurement import Measurement
+from .measurement import MeasurementState
+from .measurement import Message
+from .measurement import is_prerequisite
+from .measurement import message_description_error
+from .measurement import message_description_skipped
+from .testable import Testable
+from .utils import is_listlike
+
+logger = logging.getLogger("runner")
+
+# States of a prerequisite test which cause dependent tests to be skipped
+FAILED_STATES = (MeasurementState.FAILED, MeasurementState.ERROR, MeasurementState.SKIPPED)
+
+class MeasurementTimeout(Exception):
+	"""A test did not finish within its time limit."""
+	def __init__(self, timeout:float):
+		super().__init__("timed out after {t:.3g}s".format(t=timeout))
+		self.timeout = timeout
+
+class DeadlineExceeded(Exception):
+	"""The run deadline passed before a test could start."""
+	def __init__(self, deadline:float):
+		super().__init__("not attempted, run deadline of {d:.3g}s exceeded".format(d=deadline))
+		self.deadline = deadline
+
+def call_with_timeout(func:callable, timeout:float=None) -> object:
+	"""Call `func` and return its result, waiting at most `timeout` seconds.
+
+	The call is made in a daemon thread. If it has not returned in time the thread is
+	abandoned and MeasurementTimeout is raised."""
+	if timeout is None:
+		return func()
+
+	outcome = {}
+
+	def target():
+		try:
+			outcome["result"] = func()
+		except BaseException as e:
+			outcome["error"] = e
+
+	thread = threading.Thread(target=target, daemon=True,
+							  name="{t}-timed".format(t=threading.current_thread().name))
+	thread.start()
+	thread.join(timeout)
+	if thread.is_alive():
+		raise MeasurementTimeout(timeout)
+
+	if "error" in outcome:
+		raise outcome["error"]
+
+	return outcome["result"]
+
+async def await_with_timeout(coro:object, timeout:float=None) -> object:
+	"""Await `coro` and return its result, cancelling it after `timeout` seconds.
+
+	Unlike `asyncio.wait_for()` a TimeoutError raised by `coro` itself is passed through
+	unchanged."""
+	if timeout is None:
+		return await coro
+
+	task = asyncio.ensure_future(coro)
+	done, _ = await asyncio.wait({task}, timeout=timeout)
+	if task not in done:
+		task.cancel()
+		raise MeasurementTimeout(timeout)
+
+	return task.result()
+
+class Runner:
+	"""Execute all tests of a System, testing several subjects concurrently.
+
+	There are two modes:
+	- threads (default): each worker thread takes one subject and runs its tests in order
+	- asyncio (`context.use_asyncio`): every subject is a task on a single event loop.
+	  `async def` tests run directly on the loop and normal tests are offloaded to a pool of
+	  `context.jobs` threads
+
+	In both modes the results for a subject are in the order the tests were configured.
+	If `on_result` is given it is called with each measurement as soon as it is finished, from
+	whichever thread made it, so outputs can start before the whole run is complete.
+
+	Subjects are scheduled after the subjects they link to (see `Testable.links()`).
+	If a `prerequisite` test of a linked subject failed, every test of the dependent subject
+	is skipped instead of being attempted.
+
+	Each test is limited to its own `timeout` or the default `context.timeout` and the whole
+	run to `context.deadline`. Tests which run out of time give an ERROR measurement."""
+	def __init__(self,
+				 system:"System",
+				 context:Context,
+				 on_result:Callable[[Measurement], None]=None):
+		"""Args:
+		- `system`: Source of subjects and tests
+		- `context`: Runtime options. `context.jobs` sets the size of the worker pool
+		- `on_result`: Function called with each measurement when it is finished
+		"""
+		self.system = system
+		self.context = context
+		self.on_result = on_result
+		self.executor = None
+		self.stop_time = None
+		if context.deadline is not None:
+			self.stop_time = time.monotonic() + context.deadline
+
+	def run(self) -> Dict[Testable, Iterable[Measurement]]:
+		"""Run all tests against all selected subjects."""
+		if self.context.use_asyncio:
+			return asyncio.run(self.run_async())
+
+		results = defaultdict(list)  # Subject : list(Measurement)
+		subjects = self.system.selected_subjects(self.context)
+		self.context.subjects = subjects
+		self.context.tests = {subject: self.system.subject_tests(subject) for subject in subjects}
+		dependencies = self.dependencies(subjects)
+		outcomes = {}  # Subject : list(Measurement) for finished subjects
+		with ThreadPoolExecutor(max_workers=max(1, self.context.jobs),
+								thread_name_prefix="cmon") as executor:
+			waiting = list(subjects)
+			running = {}  # Future : Subject
+			while len(waiting) > 0 or len(running) > 0:
+				# start every subject whose dependencies have all finished
+				ready = [s for s in waiting if all(d in outcomes for d in dependencies[s])]
+				for subject in ready:
+					waiting.remove(subject)
+					upstream = self.upstream_failure(dependencies[subject], outcomes)
+					running[executor.submit(self.run_subject, subject, upstream)] = subject
+
+				done, _ = wait(running, return_when=FIRST_COMPLETED)
+				for future in done:
+					outcomes[running.pop(future)] = future.result()
+
+		# collect in configuration order regardless of which subject finished first
+		for subject in subjects:
+			results[subject].extend(outcomes[subject])
+
+		return results
+
+	async def run_async(self) -> Dict[Testable, Iterable[Measurement]]:
+		"""Run all tests against all selected subjects on the current event loop."""
+		results = defaultdict(list)  # Subject : list(Measurement)
+		subjects = self.system.selected_subjects(self.context)
+		self.context.subjects = subjects
+		self.context.tests = {subject: self.system.subject_tests(subject) for subject in subjects}
+		dependencies = self.dependencies(subjects)
+		with ThreadPoolExecutor(max_workers=max(1, self.context.jobs),
+								thread_name_prefix="cmon") as executor:
+			self.executor = executor
+			# Each task waits for the tasks of its dependencies.
+			# All tasks are created before any of them starts so the lookups always succeed
+			tasks = {}  # Subject : Task
+			for subject in subjects:
+				tasks[subject] = asyncio.ensure_future(
+					self.run_subject_after(subject, dependencies[subject], tasks))
+
+			all_measurements = await asyncio.gather(*(tasks[subject] for subject in subjects))
+
+		self.executor = None
+		for subject, measurements in zip(subjects, all_measurements):
+			results[subject].extend(measurements)
+
+		return results
+
+	def dependencies(self, subjects:Iterable[Testable]) -> Dict[Testable, Iterable[Testable]]:
+		"""Map each of `subjects` to the other `subjects` it links to.
+
+		Links to subjects which are not being tested are ignored, as are links which
+		would make a cycle."""
+		selected = set(subjects)
+		result = {}
+		visiting = set()
+
+		def visit(subject):
+			if subject in result:
+				return
+
+			visiting.add(subject)
+			links = []
+			for link in subject.links():
+				for linked in link if is_listlike(link) else [link]:
+					if linked not in selected or linked in visiting:
+						continue
+
+					visit(linked)
+					if linked not in links:
+						links.append(linked)
+
+			visiting.discard(subject)
+			result[subject] = links
+
+		for subject in subjects:
+			visit(subject)
+
+		return result
+
+	def upstream_failure(self,
+						 dependencies:Iterable[Testable],
+						 outcomes:Dict[Testable, Iterable[Measurement]]) -> Optional[str]:
+		"""If a prerequisite test of any of `dependencies` failed, return a reason string."""
+		for dependency in dependencies:
+			for measurement in outcomes[dependency]:
+				if measurement.state in FAILED_STATES and\
+				   is_prerequisite(measurement.test_fn, dependency):
+					return "upstream {label} failed".format(label=dependency.label)
+
+		return None
+
+	def run_subject(self, subject:Testable, upstream:str=None) -> Iterable[Measurement]:
+		"""Run all tests configured for `subject`.
+
+		If `upstream` is given it is the reason all tests are to be skipped."""
+		logger.info("Subject {s}".format(s=subject.name))
+		measurements = []
+		for test in self.system.subject_tests(subject):
+			if upstream is not None:
+				measurements.append(self.finished(self.skipped_measurement(test, subject, upstream)))
+				continue
+
+			measurement = self.finished(self.run_test(test, subject))
+			measurements.append(measurement)
+			upstream = self.prerequisite_failure(test, subject, measurement)
+
+		return measurements
+
+	async def run_subject_after(self,
+								subject:Testable,
+								dependencies:Iterable[Testable],
+								tasks:Dict[Testable, asyncio.Task]) -> Iterable[Measurement]:
+		"""Wait for the tasks testing `dependencies` to finish then test `subject`."""
+		outcomes = {}
+		for dependency in dependencies:
+			outcomes[dependency] = await tasks[dependency]
+
+		return await self.run_subject_async(subject, self.upstream_failure(dependencies, outcomes))
+
+	async def run_subject_async(self, subject:Testable, upstream:str=None) -> Iterable[Measurement]:
+		"""Run all tests configured for `subject` as a coroutine."""
+		logger.info("Subject {s}".format(s=subject.name))
+		measurements = []
+		for test in self.system.subject_tests(subject):
+			if upstream is not None:
+				measurements.append(self.finished(self.skipped_measurement(test, subject, upstream)))
+				continue
+
+			measurement = self.finished(await self.run_test_async(test, subject))
+			measurements.append(measurement)
+			upstream = self.prerequisite_failure(test, subject, measurement)
+
+		return measurements
+
+	def finished(self, measurement:Measurement) -> Measurement:
+		"""Pass a completed `measurement` to `on_result`, if set, and return it."""
+		if self.on_result is not None:
+			self.on_result(measurement)
+
+		return measurement
+
+	def prerequisite_failure(self,
+							 test:callable,
+							 subject:Testable,
+							 measurement:Measurement) -> Optional[str]:
+		"""If `test` is a prerequisite for `subject` and `measurement` failed, return a reason
+		string."""
+		if measurement.state in FAILED_STATES and is_prerequisite(test, subject):
+			return "{label} failed".format(label=test.label)
+
+		return None
+
+	def time_limit(self, test:callable) -> Optional[float]:
+		"""Return the maximum time `test` may take if started now, or None if unlimited.
+
+		Raises DeadlineExceeded if the run deadline has already passed."""
+		timeout = test.timeout if test.timeout is not None else self.context.timeout
+		if self.stop_time is not None:
+			remaining = self.stop_time - time.monotonic()
+			if remaining <= 0:
+				raise DeadlineExceeded(self.context.deadline)
+
+			if timeout is None or remaining < timeout:
+				timeout = remaining
+
+		return timeout
+
+	def call_test(self, test:callable, subject:Testable) -> Measurement:
+		"""Call a test which is not a coroutine, within its time limit."""
+		return call_with_timeout(partial(test, subject=subject, context=self.context),
+								 self.time_limit(test))
+
+	def run_test(self, test:callable, subject:Testable) -> Measurement:
+		"""Run a single `test` against `subject`.
+
+		An exception from the test is recorded as an ERROR measurement so a single broken
+		subject cannot stop the rest of the run."""
+		logger.info("Test {t} of {s}".format(t=test.name, s=subject.name))
+		try:
+			if test.is_async:
+				timeout = self.time_limit(test)
+				measurement = asyncio.run(await_with_timeout(
+					test(subject=subject, context=self.context), timeout))
+
+			else:
+				measurement = self.call_test(test, subject)
+
+		except Exception as e:
+			measurement = self.error_measurement(test, subject, e)
+
+		return self.bind(test, subject, measurement)
+
+	async def run_test_async(self, test:callable, subject:Testable) -> Measurement:
+		"""Run a single `test` against `subject`, offloading normal functions to our executor."""
+		logger.info("Test {t} of {s}".format(t=test.name, s=subject.name))
+		try:
+			if test.is_async:
+				timeout = self.time_limit(test)
+				measurement = await await_with_timeout(
+					test(subject=subject, context=self.context), timeout)
+
+			else:
+				# the time limit is computed by the worker thread,
+				# so time spent waiting for a free thread is not counted against the test
+				measurement = await asyncio.get_running_loop().run_in_executor(
+					self.executor, partial(self.call_test, test, subject))
+
+		except Exception as e:
+			measurement = self.error_measurement(test, subject, e)
+
+		return self.bind(test, subject, measurement)
+
+	def error_measurement(self, test:callable, subject:Testable, e:Exception) -> Measurement:
+		"""Make an ERROR measurement recording the exception `e` raised by `test`."""
+		logger.warning("Test {t} of {s} raised {e}".format(
+			t=test.name, s=subject.name, e=repr(e)))
+		return Measurement(
+			state=MeasurementState.ERROR,
+			messages=[Message(name="error",
+							  value=str(e) or type(e).__name__,
+							  description=message_description_error)])
+
+	def skipped_measurement(self, test:callable, subject:Testable, reason:str) -> Measurement:
+		"""Make a SKIPPED measurement for `test` which was not attempted because of `reason`."""
+		logger.info("Test {t} of {s} skipped: {r}".format(t=test.name, s=subject.name, r=reason))
+		measurement = Measurement(
+			state=MeasurementState.SKIPPED,
+			messages=[Message(name="skipped",
+							  value=reason,
+							  description=message_description_skipped)])
+		return self.bind(test, subject, measurement)
+
+	def bind(self, test:callable, subject:Testable, measurement:Measurement) -> Measurement:
+		"""Link `measurement` to the `test` and `subject` which made it."""
+		assert isinstance(measurement, Measurement)
+		measurement.subject = subject
+		measurement.test_fn = test
+		for message in measurement.messages:
+			# print("binding message name", message.name, "value", message.value)
+			for message_description in test.messages:
+				# print(" against message description", message_description.name)
+				if message_description.name == message.name:
+					message.description = message_description
+
+		logger.debug("Result {r}".format(r=measurement))
+		return measurement
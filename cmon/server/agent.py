@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Implementation of the remote collector agent mode.
+
+The collector script (see `collector.py`) is uploaded to the target over SFTP and run
+with a single remote command which returns all requested facts as one JSON document.
+The uploaded file name includes a hash of its contents so it is only uploaded again when
+the collector changes.
+"""
+
+import io
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict
+
+from .server import Server
+from .server import ConnectionException
+
+logger = logging.getLogger("server")
+
+COLLECTOR_SOURCE = Path(__file__).parent.joinpath("collector.py").read_bytes()
+
+COLLECTOR_HASH = hashlib.sha256(COLLECTOR_SOURCE).hexdigest()[:16]
+
+# Remote location of the collector, relative to the ssh user home directory
+REMOTE_DIR = ".cache/cmon"
+REMOTE_PATH = "{dir}/collector-{hash}.py".format(dir=REMOTE_DIR, hash=COLLECTOR_HASH)
+
+# Exit code from the remote command if the collector has not been uploaded yet
+MISSING = 99
+
+class AgentError(Exception):
+	"""The remote collector could not be run or gave a bad response."""
+	pass
+
+def upload_collector(server:Server) -> None:
+	"""Copy the collector script to `server`."""
+	logger.info("Uploading collector {hash} to {server}".format(hash=COLLECTOR_HASH, server=server))
+	with server.ssh_sftp() as sftp:
+		path = ""
+		for part in REMOTE_DIR.split("/"):
+			path = part if len(path) == 0 else "{p}/{part}".format(p=path, part=part)
+			try:
+				sftp.stat(path)
+			except IOError:
+				sftp.mkdir(path)
+
+		# write to a temporary name first so a partial upload is never executed
+		sftp.putfo(io.BytesIO(COLLECTOR_SOURCE), REMOTE_PATH + ".part")
+		sftp.posix_rename(REMOTE_PATH + ".part", REMOTE_PATH)
+
+def run_agent(server:Server, request:Dict[str, object]) -> Dict[str, object]:
+	"""Run the collector on `server` and return its decoded response to `request`.
+
+	Normally a single remote command. The collector is uploaded first only if the
+	current version is not already present on the target.
+
+	Raises ConnectionException if there is no ssh connection
+	Raises AgentError if the collector fails
+	"""
+	client = server.ssh_connect()
+	if client is None:
+		raise ConnectionException("No ssh connection to {host}".format(host=server.hostname))
+
+	command = "test -f {path} || exit {missing}; exec python3 {path}".format(
+		path=REMOTE_PATH, missing=MISSING)
+	for attempt in range(2):
+		stdin, stdout, stderr = client.exec_command(command, timeout=server.timeout)
+		stdin.write(json.dumps(request))
+		stdin.channel.shutdown_write()
+		output = stdout.read()
+		error = stderr.read().decode().strip()
+		status = stdout.channel.recv_exit_status()
+		if status == MISSING and attempt == 0:
+			upload_collector(server)
+			continue
+
+		if status != 0:
+			raise AgentError("Collector on {host} failed with status {status}: {error}".format(
+				host=server.hostname, status=status, error=error))
+
+		try:
+			return json.loads(output.decode())
+		except ValueError as e:
+			raise AgentError("Bad collector response from {host}: {e}".format(
+				host=server.hostname, e=e)) from e
+
+	raise AgentError("Collector upload to {host} failed".format(host=server.hostname))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""Self contained collector run on a remote host by the cmon agent mode.
+
+This file is uploaded to the target host and executed there, so it must only use the
+Python standard library and keep working with old Python 3 versions.
+
+A JSON request is read from stdin:
+
+{"facts": ["os", "cpu", "memory", "mounts", "docker"],
+ "dataflows": [{"directory": "/data/in", "patterns": ["*.nc"], "max_depth": 0,
+				"since": 1690000000.0}]}
+
+and a single JSON document is written to stdout:
+
+{"os": "Debian GNU/Linux 12 (bookworm)",
+ "cpu": 8,
+ "memtotal": 16663400448, "memfree": 10209271808,
+ "mounts": [{"filesystem": "/dev/sda1", "mountpoint": "/", "total": 1, "used": 1, "free": 1}],
+ "docker": [{"name": "web", "image": "nginx", "created": 1700000000}],
+ "dataflows": [{"files": 12, "newest": 1700000000.0, "size": 123456,
+				"arrived": 2, "arrived_size": 20576}],
+ "errors": {"docker": "[Errno 13] Permission denied"}}
+
+Values are read directly from /proc, statvfs() and the docker socket so no other
+processes are spawned.
+"""
+
+import os
+import sys
+import json
+import socket
+from fnmatch import fnmatch
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+# Filesystem types which never hold user data
+PSEUDO_FILESYSTEMS = ("proc", "sysfs", "devpts", "cgroup", "cgroup2", "securityfs", "pstore",
+					  "debugfs", "tracefs", "mqueue", "hugetlbfs", "configfs", "fusectl",
+					  "binfmt_misc", "autofs", "bpf", "nsfs", "rpc_pipefs")
+
+def read_os():
+	"""Return the pretty name from /etc/os-release."""
+	with open("/etc/os-release") as handle:
+		for line in handle:
+			key, _, value = line.strip().partition("=")
+			if key == "PRETTY_NAME":
+				return value.strip("\"")
+
+	return None
+
+def read_memory():
+	"""Return total and available memory in bytes from /proc/meminfo."""
+	values = {}
+	with open("/proc/meminfo") as handle:
+		for line in handle:
+			key, _, value = line.partition(":")
+			values[key] = int(value.split()[0]) * 1024
+
+	return values["MemTotal"], values.get("MemAvailable", values["MemFree"])
+
+def read_mounts():
+	"""Return size information for each real mounted filesystem."""
+	result = []
+	seen = set()
+	with open("/proc/mounts") as handle:
+		for line in handle:
+			cells = line.split()
+			filesystem, mountpoint, fstype = cells[0], cells[1], cells[2]
+			# /proc/mounts escapes spaces in paths as octal
+			mountpoint = mountpoint.replace("\\040", " ")
+			if fstype in PSEUDO_FILESYSTEMS or mountpoint in seen:
+				continue
+
+			try:
+				stat = os.statvfs(mountpoint)
+			except OSError:
+				continue
+
+			if stat.f_blocks == 0:
+				continue
+
+			seen.add(mountpoint)
+			result.append({"filesystem": filesystem,
+						   "mountpoint": mountpoint,
+						   "total": stat.f_blocks * stat.f_frsize,
+						   "used": (stat.f_blocks - stat.f_bfree) * stat.f_frsize,
+						   "free": stat.f_bavail * stat.f_frsize})
+
+	return result
+
+def read_docker():
+	"""Return running containers by asking the docker daemon over its unix socket."""
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.settimeout(10)
+	sock.connect(DOCKER_SOCKET)
+	sock.sendall(b"GET /containers/json HTTP/1.0\r\nHost: docker\r\n\r\n")
+	chunks = []
+	while True:
+		chunk = sock.recv(65536)
+		if not chunk:
+			break
+
+		chunks.append(chunk)
+
+	sock.close()
+	_, _, body = b"".join(chunks).partition(b"\r\n\r\n")
+	result = []
+	for container in json.loads(body.decode()):
+		result.append({"name": container["Names"][0].lstrip("/"),
+					   "image": container["Image"],
+					   "created": container["Created"]})
+
+	return result
+
+def scan_dataflow(directory, patterns=None, max_depth=0, since=None):
+	"""Return count, newest modification time and total size of files in `directory` and
+	up to `max_depth` levels of subdirectories which match any of `patterns`, and if `since`
+	is given the count and size of those modified after it."""
+	files = 0
+	newest = None
+	size = 0
+	arrived = 0
+	arrived_size = 0
+	pending = [(directory, 0)]
+	while pending:
+		path, depth = pending.pop()
+		for entry in os.scandir(path):
+			if entry.is_dir(follow_symlinks=False):
+				if depth < max_depth:
+					pending.append((entry.path, depth + 1))
+
+				continue
+
+			if patterns and not any(fnmatch(entry.name, pattern) for pattern in patterns):
+				continue
+
+			stat = entry.stat(follow_symlinks=False)
+			files += 1
+			size += stat.st_size
+			if newest is None or stat.st_mtime > newest:
+				newest = stat.st_mtime
+
+			if since is not None and stat.st_mtime > since:
+				arrived += 1
+				arrived_size += stat.st_size
+
+	result = {"files": files, "newest": newest, "size": size}
+	if since is not None:
+		result["arrived"] = arrived
+		result["arrived_size"] = arrived_size
+
+	return result
+
+def collect(request):
+	"""Build the response document for `request`."""
+	result = {"errors": {}}
+	readers = {
+		"os": lambda: {"os": read_os()},
+		"cpu": lambda: {"cpu": os.cpu_count()},
+		"memory": lambda: dict(zip(("memtotal", "memfree"), read_memory())),
+		"mounts": lambda: {"mounts": read_mounts()},
+		"docker": lambda: {"docker": read_docker()},
+	}
+	for fact in request.get("facts", []):
+		try:
+			result.update(readers[fact]())
+		except Exception as e:
+			result["errors"][fact] = str(e)
+
+	dataflows = []
+	for dataflow in request.get("dataflows", []):
+		try:
+			dataflows.append(scan_dataflow(dataflow["directory"],
+										   dataflow.get("patterns"),
+										   dataflow.get("max_depth", 0),
+										   dataflow.get("since")))
+		except Exception as e:
+			dataflows.append({"error": str(e)})
+
+	result["dataflows"] = dataflows
+	return result
+
+def main():
+	"""Command line entry point."""
+	request = json.load(sys.stdin)
+	json.dump(collect(request), sys.stdout, separators=(",", ":"))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""Implementation of HostFacts class and host_facts() function.
+
+All the information the server tests need from a host is read with a single composite
+remote command. Each part of the output is preceeded by a marker line so it can be split
+up again and parsed.
+
+If the server is configured with `agent=True` the facts are read by the remote collector
+agent instead, which returns them as structured JSON.
+"""
+
+import logging
+from math import ceil
+from datetime import datetime
+from typing import Dict
+from typing import Iterable
+from typing import Tuple
+
+import humanize
+
+from ..context import Context
+from .server import Server
+from .agent import run_agent
+from .df import decode_df
+from .df import MountInfo
+
+logger = logging.getLogger("server")
+
+NEWLINE = "\n"
+
+# Start of line separating sections of the composite command output
+MARKER = "@@cmon:"
+
+# Remote command for each section
+SECTIONS = {
+	"os": "cat /etc/os-release",
+	"cpu": "lscpu",
+	"memory": "free -b",
+	"mounts": "df",
+	"docker": "docker ps --format \"{{.Names}},{{.Image}},{{.RunningFor}}\"",
+}
+
+class HostFacts:
+	"""System information read from a server."""
+	def __init__(self,
+				 os:str=None,
+				 cpu:int=None,
+				 memtotal:int=None,
+				 memfree:int=None,
+				 mounts:Dict[str, MountInfo]=None,
+				 docker:Iterable[Tuple[str, str, str]]=None):
+		"""Args:
+		- `os`: Operating system pretty name
+		- `cpu`: Number of CPU cores
+		- `memtotal`: Total memory in bytes
+		- `memfree`: Memory available for new processes in bytes
+		- `mounts`: Mounted partitions by mountpoint
+		- `docker`: Running containers as (container name, image name, age) tuples
+		"""
+		self.os = os
+		self.cpu = cpu
+		self.memtotal = memtotal
+		self.memfree = memfree
+		self.mounts = {} if mounts is None else mounts
+		self.docker = [] if docker is None else docker
+
+def facts_command(sections:Iterable[str]) -> str:
+	"""Make a single shell command which reads all of `sections`."""
+	parts = []
+	for section in sections:
+		parts.append("echo '{marker}{section}'; {cmd} 2>/dev/null".format(
+			marker=MARKER, section=section, cmd=SECTIONS[section]))
+
+	return "; ".join(parts)
+
+def split_sections(output:str) -> Dict[str, Iterable[str]]:
+	"""Split the output of `facts_command()` into lines for each section."""
+	result = {}
+	lines = None
+	for line in output.split(NEWLINE):
+		if line.startswith(MARKER):
+			lines = []
+			result[line[len(MARKER):]] = lines
+
+		elif lines is not None:
+			lines.append(line)
+
+	return result
+
+def parse_facts(sections:Dict[str, Iterable[str]]) -> HostFacts:
+	"""Decode the output of each section."""
+	result = HostFacts()
+	for line in sections.get("os", []):
+		if len(line) == 0 or "=" not in line:
+			continue
+
+		key, _, value = line.partition("=")
+		if key == "PRETTY_NAME":
+			result.os = value.strip("\"")
+
+	for line in sections.get("cpu", []):
+		key, _, value = line.partition(":")
+		if key == "CPU(s)":
+			result.cpu = int(value.strip())
+
+	for line in sections.get("memory", []):
+		cells = line.split()
+		# columns are total, used, free, shared, buff/cache, available
+		if len(cells) > 3 and cells[0] == "Mem:":
+			result.memtotal = int(cells[1])
+			result.memfree = int(cells[6] if len(cells) > 6 else cells[3])
+
+	if "mounts" in sections:
+		result.mounts = decode_df(sections["mounts"])
+
+	for line in sections.get("docker", []):
+		if len(line) == 0:
+			continue
+
+		cells = line.split(",")
+		if len(cells) != 3:
+			logger.warning("Ignoring unexpected docker output: {line}".format(line=line))
+			continue
+
+		result.docker.append(tuple(cells))
+
+	return result
+
+def agent_facts(server:Server, sections:Iterable[str]) -> HostFacts:
+	"""Read `sections` from `server` using the remote collector agent."""
+	response = run_agent(server, {"facts": sections})
+	for section, error in response["errors"].items():
+		logger.warning("Agent on {server} could not read {section}: {error}".format(
+			server=server, section=section, error=error))
+
+	mounts = {}
+	for mount in response.get("mounts", []):
+		size = mount["used"] + mount["free"]
+		mounts[mount["mountpoint"]] = MountInfo(
+			filesystem=mount["filesystem"],
+			total=mount["total"],
+			used=mount["used"],
+			free=mount["free"],
+			percent="{p}%".format(p=ceil(100 * mount["used"] / size) if size > 0 else 0),
+			mountpoint=mount["mountpoint"])
+
+	now = datetime.utcnow()
+	docker = []
+	for container in response.get("docker", []):
+		docker.append((container["name"],
+					   container["image"],
+					   humanize.naturaldelta(now - datetime.utcfromtimestamp(container["created"]))))
+
+	return HostFacts(os=response.get("os"),
+					 cpu=response.get("cpu"),
+					 memtotal=response.get("memtotal"),
+					 memfree=response.get("memfree"),
+					 mounts=mounts,
+					 docker=docker)
+
+def collect_facts(server:Server) -> HostFacts:
+	"""Read facts from `server` in a single round trip.
+
+	Returns None if `server` has no ssh connection configured.
+	Raises ConnectionException if the connection fails."""
+	client = server.ssh_connect()
+	if client is None:
+		return None
+
+	sections = ["os", "cpu", "memory"]
+	if server.mounts is not None:
+		sections.append("mounts")
+
+	if server.docker_containers is not None:
+		sections.append("docker")
+
+	logger.debug("Reading {sections} from {server}".format(sections=sections, server=server))
+	if server.agent:
+		return agent_facts(server, sections)
+
+	stdin, stdout, stderr = client.exec_command(facts_command(sections), timeout=server.timeout)
+	return parse_facts(split_sections(stdout.read().decode()))
+
+def host_facts(server:Server, context:Context) -> HostFacts:
+	"""Return facts for `server`, read once per run and shared by all tests."""
+	return context.cached(("facts", server), lambda: collect_facts(server))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""Implementation of the concurrent reachability prober.
+
+All servers in a run are pinged together in one pass, each by its own `ping` process
+running concurrently under asyncio. The round trip time, packet loss and jitter are
+decoded from the ping summary output.
+
+The pass runs in its own thread rather than in the thread of the first test which needs it,
+so a test which times out waiting does not abandon the pass for everyone else.
+"""
+
+import re
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict
+from typing import Iterable
+
+from ..context import Context
+from .server import Server
+
+logger = logging.getLogger("server")
+
+# Packets sent to each host
+PING_COUNT = 3
+
+# Seconds between packets (the lowest allowed for unprivileged users)
+PING_INTERVAL = 0.2
+
+# Maximum seconds to wait for each reply
+PING_WAIT = 2
+
+# Maximum number of ping processes running at once
+PING_CONCURRENCY = 512
+
+# "3 packets transmitted, 3 received, 0% packet loss, time 401ms" (iputils)
+# "3 packets transmitted, 3 packets received, 0% packet loss" (busybox, BSD)
+PACKETS = re.compile(r"(\d+) packets transmitted, (\d+) (?:packets )?received")
+LOSS = re.compile(r"([\d.]+)% packet loss")
+# "rtt min/avg/max/mdev = 0.045/0.060/0.071/0.010 ms" (iputils)
+# "round-trip min/avg/max = 0.045/0.060/0.071 ms" (busybox)
+# "round-trip min/avg/max/stddev = 0.045/0.060/0.071/0.010 ms" (BSD)
+RTT = re.compile(r"= ([\d.]+)/([\d.]+)/([\d.]+)(?:/([\d.]+))? ms")
+
+class PingResult:
+	"""Decoded summary of pinging a single host."""
+	def __init__(self,
+				 sent:int=0,
+				 received:int=0,
+				 loss:float=None,
+				 rtt_min:float=None,
+				 rtt_avg:float=None,
+				 rtt_max:float=None,
+				 jitter:float=None,
+				 error:str=None,
+				 local_error:bool=False):
+		"""Args:
+		- `sent`: Packets transmitted
+		- `received`: Replies received
+		- `loss`: Packet loss in percent
+		- `rtt_min`, `rtt_avg`, `rtt_max`: Round trip times in ms
+		- `jitter`: Standard deviation of round trip times in ms, if ping reports it
+		- `error`: Reason the ping could not be made or got no reply
+		- `local_error`: The `error` is a problem on this host, such as no `ping` command,
+			and says nothing about the remote host
+		"""
+		self.sent = sent
+		self.received = received
+		self.loss = loss
+		self.rtt_min = rtt_min
+		self.rtt_avg = rtt_avg
+		self.rtt_max = rtt_max
+		self.jitter = jitter
+		self.error = error
+		self.local_error = local_error
+
+def parse_ping(output:str) -> PingResult:
+	"""Decode the summary lines of `ping` output."""
+	result = PingResult()
+	match = PACKETS.search(output)
+	if match is not None:
+		result.sent = int(match.group(1))
+		result.received = int(match.group(2))
+
+	match = LOSS.search(output)
+	if match is not None:
+		result.loss = float(match.group(1))
+
+	match = RTT.search(output)
+	if match is not None:
+		result.rtt_min = float(match.group(1))
+		result.rtt_avg = float(match.group(2))
+		result.rtt_max = float(match.group(3))
+		if match.group(4) is not None:
+			result.jitter = float(match.group(4))
+
+	if result.received == 0:
+		result.error = "no reply"
+
+	return result
+
+async def ping_host(hostname:str,
+					wait:float,
+					semaphore:asyncio.Semaphore) -> PingResult:
+	"""Ping a single host, waiting at most `wait` seconds for each reply."""
+	wait = max(1, round(wait))
+	async with semaphore:
+		try:
+			proc = await asyncio.create_subprocess_exec(
+				"ping", "-n", "-q",
+				"-c", str(PING_COUNT),
+				"-i", str(PING_INTERVAL),
+				"-W", str(wait),
+				hostname,
+				stdout=asyncio.subprocess.PIPE,
+				stderr=asyncio.subprocess.PIPE)
+		except OSError as e:
+			return PingResult(error=str(e), local_error=True)
+
+		try:
+			stdout, stderr = await asyncio.wait_for(
+				proc.communicate(), timeout=PING_COUNT * (PING_INTERVAL + wait) + wait)
+		except asyncio.TimeoutError:
+			proc.kill()
+			await proc.wait()
+			return PingResult(error="ping command timed out")
+
+	result = parse_ping(stdout.decode(errors="replace"))
+	if result.sent == 0:
+		result.error = stderr.decode(errors="replace").strip() or "ping command failed"
+
+	return result
+
+async def ping_into(hosts:Dict[str, float],
+					futures:Dict[str, Future],
+					concurrency:int=PING_CONCURRENCY) -> None:
+	"""Ping all `hosts` concurrently, setting the result of each in `futures` as soon as it
+	is known."""
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def ping_one(hostname):
+		try:
+			futures[hostname].set_result(await ping_host(hostname, hosts[hostname], semaphore))
+		except Exception as e:
+			futures[hostname].set_exception(e)
+
+	await asyncio.gather(*(ping_one(hostname) for hostname in hosts))
+
+def sweep(servers:Iterable[Server]) -> Dict[str, Future]:
+	"""Start pinging all `servers` in a single pass in a background thread.
+
+	Returns a future for each hostname, resolved as soon as that host has been pinged, so
+	callers only wait for their own host."""
+	hosts = {}
+	for server in servers:
+		hosts[server.hostname] = min(server.timeout, PING_WAIT)
+
+	futures = {hostname: Future() for hostname in hosts}
+
+	def run():
+		try:
+			asyncio.run(ping_into(hosts, futures))
+		except Exception as e:
+			for future in futures.values():
+				if not future.done():
+					future.set_exception(e)
+
+	logger.info("Pinging {cc} hosts".format(cc=len(hosts)))
+	threading.Thread(target=run, name="cmon-ping", daemon=True).start()
+	return futures
+
+def reachability(server:Server, context:Context, test:callable) -> PingResult:
+	"""Return the ping result for `server`.
+
+	On first use all servers in the run which have `test` are pinged together, and the
+	results shared by later callers."""
+	futures = context.cached("ping", lambda: sweep(
+		[s for s in context.subjects if isinstance(s, Server) and test in context.tests.get(s, ())]
+		+ [server]))
+	future = futures.get(server.hostname)
+	if future is None:
+		# not known when the sweep was made
+		future = sweep([server])[server.hostname]
+
+	return future.result()
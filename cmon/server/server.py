@@ -2,6 +2,7 @@
 
 """Implementation of Server class."""
 
+import socket
 import logging
 from typing import Dict
 from typing import Optional
@@ -13,11 +14,15 @@ import paramiko
 from ..testable import Testable
 from ..mount import Mount
 from ..utils import is_listlike
+from .sshpool import ssh_pool
 
 # paramiko is very verbose on the debug level
 logging.getLogger("paramiko").setLevel(logging.WARNING)
 logger = logging.getLogger("server")
 
+# Names for the host we are running on
+LOCAL_HOSTNAMES = ("localhost", "127.0.0.1", "::1")
+
 class ConnectionException(Exception):
 	"""Network cannot find required server."""
 	pass
@@ -39,7 +44,10 @@ class Server(Testable):
 				 # ssh_config:Union[str, Iterable[str]]=None,
 				 mounts:Iterable[Mount]=None,
 				 important:bool=True,
-				 docker_containers:Iterable[str]=None):
+				 docker_containers:Iterable[str]=None,
+				 timeout:float=10,
+				 agent:bool=False,
+				 ping_prerequisite:bool=False):
 		"""
 		Args:
 		- `hostname`: Network hostname for connections
@@ -49,6 +57,11 @@ class Server(Testable):
 		- `mounts`: Mounted directories for testing
 		- `important`: If the server is not `important` then a test failure in this server does not
 			result in the whoel test suite failing
+		- `timeout`: Network timeout in seconds for ping, ssh connection and remote commands
+		- `agent`: Read server information by uploading and running a small Python collector
+			instead of parsing the output of command line tools. Requires python3 on the server
+		- `ping_prerequisite`: If the server does not answer ping, skip its other tests and the
+			tests of subjects which link to it. Only set for hosts which answer ICMP
 		"""
 		super().__init__(label=label,
 						 name=name,
@@ -77,10 +90,12 @@ class Server(Testable):
 		self.ssh_hack = ssh_hack
 
 		self.mounts = mounts
-		self.ssh_user_client = None
 		# self.ssh_user_clients = {}
 		# self.ssh_config_clients = {}
 		self.docker_containers = docker_containers
+		self.timeout = timeout
+		self.agent = agent
+		self.ping_prerequisite = ping_prerequisite
 		# self.ssh_password = ssh_password
 
 	def __str__(self):
@@ -123,7 +138,7 @@ class Server(Testable):
 					# ssh_config:str=None
 					# ) -> Optional[paramiko.client.SSHClient]:
 					) -> paramiko.client.SSHClient:
-		"""Return an ssh connection.
+		"""Return an ssh connection, shared with other users of the same host and user.
 
 		With no paramereters the best connection is selected.
 
@@ -156,37 +171,33 @@ class Server(Testable):
 			# no ssh connection configured
 			return None
 
-		# cached failure
-		if self.ssh_user_client is False:
-			return None
-
-		if self.ssh_user_client is not None:
-			return self.ssh_user_client
+		options = {}
+		if self.ssh_hack == "disabled_algorithms_pubkeys_rsa_sha2_256_rsa_sha2_512":
+			options["disabled_algorithms"] = {'pubkeys': ['rsa-sha2-256', 'rsa-sha2-512']}
 
-		result = paramiko.client.SSHClient()
-		# result.load_system_host_keys()
-		result.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-		# pkey = paramiko.RSAKey.from_private_key_file("/tcenas/home/elson/.ssh/id_rsa")
 		try:
-			logger.info("ssh connect as {user} to {host}".format(host=self.hostname, user=self.ssh_user))
-			if self.ssh_hack is None:
-				result.connect(self.hostname, username=self.ssh_user)
+			return ssh_pool.connect(self.hostname,
+									username=self.ssh_user,
+									timeout=self.timeout,
+									options=options)
+		except paramiko.ssh_exception.AuthenticationException as e:
+			raise ConnectionException(str(e)) from e
 
-			elif self.ssh_hack == "disabled_algorithms_pubkeys_rsa_sha2_256_rsa_sha2_512":
-				result.connect(self.hostname,
-							   username=self.ssh_user,
-							   disabled_algorithms={'pubkeys': ['rsa-sha2-256', 'rsa-sha2-512']})
+	def is_local(self) -> bool:
+		"""Test if this server is the host we are running on, so its files can be read
+		directly."""
+		local = socket.gethostname()
+		return self.hostname in LOCAL_HOSTNAMES or self.hostname in (local, local.split(".")[0])
 
-				# , pkey=pkey)
-			# , look_for_keys=False)
+	def ssh_sftp(self):
+		"""Return a context manager giving exclusive use of the shared SFTP session to us.
 
-		except paramiko.ssh_exception.AuthenticationException as e:
-			logger.warn("ssh connect failed {e}".format(e=e))
-			self.ssh_user_client = False
-			raise ConnectionException(str(e)) from e
+		Raises ConnectionException if no ssh connection is available."""
+		client = self.ssh_connect()
+		if client is None:
+			raise ConnectionException("No ssh connection to {host}".format(host=self.hostname))
 
-		self.ssh_user_client = result
-		return result
+		return ssh_pool.sftp(client, timeout=self.timeout)
 
 	def get_id(self) -> str:
 		if self.name:
@@ -2,7 +2,6 @@
 
 """Implementation of tests against a server."""
 
-import time
 import logging
 from copy import copy
 
@@ -16,9 +15,8 @@ from ..measurement import Message
 from .server import Server
 from .server import ConnectionException
 from ..context import Context
-from ..shell import shell
-from ..shell import shell_validate
-from .df import decode_df
+from .facts import host_facts
+from .ping import reachability
 from ..utils import is_listlike
 
 logger = logging.getLogger()
@@ -28,9 +26,10 @@ NEWLINE = "\n"
 @measure(
 	label="Ping",
 	name="ping",
-	description=("Check we can ping the server. Failed only indicates a lack of ICMP response "
-				 "and does not mean the server itself is down"),
+	description=("Check we can ping the server. For servers with `ping_prerequisite` set, if it "
+				 "does not answer the tests of subjects which link to it are skipped"),
 	subject_type=Server,
+	prerequisite=lambda server: server.ping_prerequisite,
 	messages=[
 		MessageDescription(
 			name="ip",
@@ -40,13 +39,29 @@ NEWLINE = "\n"
 			sf=4,
 			datatype=float,
 			multiple=dict),
+		MessageDescription(
+			name="loss",
+			label="Packet loss",
+			description="Percentage of pings without a reply",
+			unit="%",
+			datatype=float,
+			multiple=dict),
+		MessageDescription(
+			name="jitter",
+			label="Jitter",
+			description="Standard deviation of response times",
+			unit="ms",
+			sf=3,
+			datatype=float,
+			multiple=dict),
 	]
 )
 def measure_server_ping(subject:Server, context:Context):
 	"""Check the server responds to ping.
 
-	Requires a response to an ICMP packet and failure to ping doesn't
-	necessarily mean the server is down."""
+	Requires a response to an ICMP packet. Only servers with `ping_prerequisite` set have
+	their other tests skipped when it fails, so hosts which filter ICMP just report FAILED here.
+	All servers with this test are pinged concurrently the first time it is used."""
 	# if len(subject.ssh_config) > 0 or len(subject.ssh_user) > 0:
 		# print(subject.ssh_config)
 		# print(subject.ssh_user)
@@ -57,30 +72,28 @@ def measure_server_ping(subject:Server, context:Context):
 		logger.info("Simulating a ping of {s}".format(s=target))
 		return
 
-	start_time = time.time()
-	shelled = shell("ping -c 1 " + subject.hostname)
-	duration = time.time() - start_time
-	# result = shell("ping -c 1 " + subject.hostname, verbose=True, echo=True)
-	# logger.info("Ping status code {c}".format(c=result.returncode))
-	valid = shell_validate(shelled)
-	# logger.info("Successful ping of " + subject.hostname)
-	if context.verbose:
-		logger.info(shelled.stdout)
-
-	if valid is True:
-		result = Measurement(state=MeasurementState.GOOD,
-							 messages=[
-								 Message(name="ip",
-										 parameter=subject.hostname,
-										 # seconds to ms with 1 d.p.
-										 value=duration*1000)])
-		# result.add_message("host", subject.hostname)
+	ping = reachability(subject, context, measure_server_ping)
+	if ping.error is None:
+		result = Measurement(state=MeasurementState.GOOD)
+		result.add_message(Message(name="ip", parameter=subject.hostname, value=ping.rtt_avg))
+		result.add_message(Message(name="loss", parameter=subject.hostname, value=ping.loss))
+		if ping.jitter is not None:
+			result.add_message(Message(name="jitter", parameter=subject.hostname, value=ping.jitter))
+
 		return result
 
-	result = Measurement(state="FAILED")
+	# a local problem such as a missing ping command says nothing about the server
+	result = Measurement(state="ERROR" if ping.local_error else "FAILED")
 	result.add_message(Message(name="ip",
 							   parameter=subject.hostname,
-							   error="ping command failed"))
+							   error=ping.error))
+	if ping.loss is not None:
+		result.add_message(Message(name="loss", parameter=subject.hostname, value=ping.loss))
+
+	else:
+		# ping could not be run so the loss is unknown
+		result.add_message(Message(name="loss", parameter=subject.hostname, error=ping.error))
+
 	return result
 
 
@@ -149,19 +162,15 @@ def measure_server_ssh_mountpoints(subject:Server, context:Context) -> Measureme
 		return Measurement("NOT_APPLICABLE")
 
 	try:
-		client = subject.ssh_connect()
+		facts = host_facts(subject, context)
 	except ConnectionException as e:
 		return Measurement(state=MeasurementState.FAILED)#, message=str(e))
 
 	# probably no ssh connection configured
-	if client is None:
+	if facts is None:
 		return Measurement("NOT_APPLICABLE")
 
-	stdin, stdout, stderr = client.exec_command("df")
-	error = stderr.read().decode().strip()
-
-	# Use helper to decode actual df output
-	found_mounts = decode_df(stdout.read().decode().split(NEWLINE))
+	found_mounts = facts.mounts
 
 	result = Measurement()
 	good = 0
@@ -221,7 +230,7 @@ def measure_server_ssh_mountpoints(subject:Server, context:Context) -> Measureme
 	]
 )
 def measure_server_ssh_sysinfo(subject:Server, context:Context):
-	"""Retreive system info as measurement messages.
+	"""Retreive system info as measurement messages, from the shared host facts.
 
 	Reads:
 	- OS
@@ -236,46 +245,23 @@ def measure_server_ssh_sysinfo(subject:Server, context:Context):
 	logger.debug("Server sysinfo for {name} ssh user {user}".format(
 		name=subject, user=subject.ssh_user))
 	try:
-		client = subject.ssh_connect()
+		facts = host_facts(subject, context)
 	except ConnectionException as e:
 		return Measurement(MeasurementState.NOT_APPLICABLE)
 
-	if client is None:
+	if facts is None:
 		return Measurement(state=MeasurementState.NOT_APPLICABLE)
 
-	# Find OS from /etc/os-release file
-	sftp = client.open_sftp()
-	handle = sftp.open("/etc/os-release")
 	result = Measurement(MeasurementState.GOOD)
-	for line in handle.read().decode().split(NEWLINE):
-		if len(line) == 0 or "=" not in line:
-			continue
-
-		key, _, value = line.partition("=")
-		# print("len",len(line),"key",key,"value",value)
-		if key == "PRETTY_NAME":
-			result.add_message(Message("os", value.strip("\"")))
-
-	# CPU
-	stdin, stdout, stderr = client.exec_command("lscpu")
-	for line in stdout.read().decode().split(NEWLINE):
-		key, _, value = line.partition(":")
-		value = value.lstrip(" ")
-		# print("lscpu key",key,"value",value)
-		if key == "CPU(s)":
-			result.add_message(Message("cpu", value))
-
-	# Memory
-	stdin, stdout, stderr = client.exec_command("free")
-	for line in stdout.read().decode().split(NEWLINE):
-		# print("cells", line.split())
-		cells = line.split()
-		if len(cells) == 0:
-			continue
-
-		if cells[0] == "Mem:":
-			result.add_message(Message("memtotal", cells[1]))
-			result.add_message(Message("memfree", cells[2]))
+	if facts.os is not None:
+		result.add_message(Message("os", facts.os))
+
+	if facts.cpu is not None:
+		result.add_message(Message("cpu", facts.cpu))
+
+	if facts.memtotal is not None:
+		result.add_message(Message("memtotal", facts.memtotal))
+		result.add_message(Message("memfree", facts.memfree))
 
 	return result
 
@@ -312,25 +298,18 @@ def measure_server_ssh_sysinfo(subject:Server, context:Context):
 def measure_server_ssh_docker(subject:Server, context:Context):
 	"""Retrieve information about running docker containers.
 
-	Uses primary ssh connection and docker command line tool."""
+	Uses the shared host facts, read with the docker command line tool."""
 	# Check we have ssh connections configured
 	if subject.docker_containers is None:
 		return Measurement(MeasurementState.NOT_APPLICABLE)
 
 	# If ssh connection is not available for some reason then skip
-	client = subject.ssh_connect()
-	if client is None:
+	facts = host_facts(subject, context)
+	if facts is None:
 		return Measurement(MeasurementState.NOT_APPLICABLE)
 
 	result = Measurement(MeasurementState.GOOD)
-	stdin, stdout, stderr = client.exec_command(
-		"docker ps --format \"{{.Names}},{{.Image}},{{.RunningFor}}\"")
-
-	for line in stdout.read().decode().split(NEWLINE):
-		if len(line) == 0:
-			continue
-
-		container_name, image_name, age = line.split(",")
+	for container_name, image_name, age in facts.docker:
 		if image_name.startswith("harbor.opscloud.eumetsat.int/"):
 			image_name = image_name[len("harbor.opscloud.eumetsat.int/"):]
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""Implementation of SSHPool class."""
+
+import time
+import atexit
+import logging
+import threading
+from typing import Dict
+from typing import Optional
+from contextlib import contextmanager
+
+import paramiko
+
+logger = logging.getLogger("server")
+
+class SSHPool:
+	"""Process wide cache of ssh connections shared by all Server objects and tests.
+
+	Connections are keyed by (hostname, user, options) so the handshake and authentication
+	for a host is paid once no matter how many Server objects or tests use it.
+	Each command runs in its own channel multiplexed over the shared transport and a single
+	SFTP session per connection is reused.
+	"""
+	def __init__(self, keepalive:int=30, retry_failed:float=300):
+		"""Args:
+		- `keepalive`: Seconds between ssh keepalive packets on idle connections
+		- `retry_failed`: Seconds before trying again to log in to a host where authentication
+			failed, so a long running process recovers once keys are fixed
+		"""
+		self.keepalive = keepalive
+		self.retry_failed = retry_failed
+		self.lock = threading.Lock()
+		# key : SSHClient
+		self.clients = {}
+		# key : time.monotonic() when authentication failed
+		self.failures = {}
+		# key : Lock, held while connecting so different hosts can connect in parallel
+		self.connect_locks = {}
+		# SSHClient : (SFTPClient, Lock)
+		self.sftps = {}
+
+	def connect(self,
+				hostname:str,
+				username:str,
+				timeout:float=None,
+				options:Dict[str, object]=None) -> Optional[paramiko.client.SSHClient]:
+		"""Return a connected client to `hostname` as `username`, reusing an existing one if possible.
+
+		`options` are additional arguments to `SSHClient.connect()`.
+		Returns None if authentication failed less than `retry_failed` seconds ago.
+
+		Raises:
+		paramiko.ssh_exception.AuthenticationException on authentication failure
+		socket or paramiko exceptions for network errors
+		"""
+		if options is None:
+			options = {}
+
+		key = (hostname, username, repr(sorted(options.items())))
+		with self.lock:
+			connect_lock = self.connect_locks.setdefault(key, threading.Lock())
+
+		with connect_lock:
+			failed = self.failures.get(key)
+			if failed is not None:
+				if time.monotonic() - failed < self.retry_failed:
+					return None
+
+				del self.failures[key]
+
+			with self.lock:
+				client = self.clients.get(key)
+
+			if client is not None:
+				transport = client.get_transport()
+				if transport is not None and transport.is_active():
+					return client
+
+				logger.info("ssh connection to {host} was lost".format(host=hostname))
+				self.discard(key)
+
+			client = paramiko.client.SSHClient()
+			# client.load_system_host_keys()
+			client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+			logger.info("ssh connect as {user} to {host}".format(host=hostname, user=username))
+			try:
+				client.connect(hostname,
+							   username=username,
+							   timeout=timeout,
+							   banner_timeout=timeout,
+							   auth_timeout=timeout,
+							   **options)
+			except paramiko.ssh_exception.AuthenticationException as e:
+				logger.warning("ssh connect failed {e}".format(e=e))
+				self.failures[key] = time.monotonic()
+				client.close()
+				raise
+
+			except Exception:
+				client.close()
+				raise
+
+			client.get_transport().set_keepalive(self.keepalive)
+			with self.lock:
+				self.clients[key] = client
+
+			return client
+
+	@contextmanager
+	def sftp(self,
+			 client:paramiko.client.SSHClient,
+			 timeout:float=None) -> paramiko.sftp_client.SFTPClient:
+		"""Context manager giving exclusive use of the SFTP session of `client`.
+
+		The session is opened on first use and kept for the lifetime of the connection."""
+		with self.lock:
+			if client not in self.sftps:
+				self.sftps[client] = (None, threading.Lock())
+
+			_, sftp_lock = self.sftps[client]
+
+		with sftp_lock:
+			with self.lock:
+				sftp, _ = self.sftps.get(client, (None, sftp_lock))
+
+			if sftp is None or sftp.get_channel().closed:
+				sftp = client.open_sftp()
+				with self.lock:
+					self.sftps[client] = (sftp, sftp_lock)
+
+			sftp.get_channel().settimeout(timeout)
+			yield sftp
+
+	def discard(self, key:tuple) -> None:
+		"""Forget and close the connection for `key`."""
+		with self.lock:
+			client = self.clients.pop(key, None)
+			if client is None:
+				return
+
+			sftp, _ = self.sftps.pop(client, (None, None))
+
+		if sftp is not None:
+			sftp.close()
+
+		client.close()
+
+	def close(self) -> None:
+		"""Close all connections."""
+		with self.lock:
+			keys = list(self.clients.keys())
+
+		for key in keys:
+			try:
+				self.discard(key)
+			except Exception as e:
+				logger.debug("Error closing ssh connection {e}".format(e=e))
+
+# Connections shared by the whole process
+ssh_pool = SSHPool()
+atexit.register(ssh_pool.close)
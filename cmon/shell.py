@@ -8,7 +8,8 @@ logger = logging.getLogger()
 def shell(cmd:str,
 		  verbose=False,
 		  echo=False,
-		  capture_stdout=False) -> subprocess.CompletedProcess:
+		  capture_stdout=False,
+		  timeout:float=None) -> subprocess.CompletedProcess:
 	if verbose:
 		logger.info("Cmd: {cmd}".format(cmd=cmd))
 
@@ -17,7 +18,7 @@ def shell(cmd:str,
 	capture_output = True
 
 	cmd_split = cmd.split(" ")
-	result = subprocess.run(cmd_split, capture_output=capture_output)
+	result = subprocess.run(cmd_split, capture_output=capture_output, timeout=timeout)
 	if echo:
 		logger.info(result.stdout)
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""Implementation of StateStore class."""
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from decimal import Decimal
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+logger = logging.getLogger("state")
+
+def encode(obj:object) -> object:
+	"""JSON encoder hook for the extra types tests keep in their state."""
+	# datetime is a subclass of date so must be checked first
+	if isinstance(obj, datetime):
+		return {"__datetime__": obj.isoformat()}
+
+	if isinstance(obj, date):
+		return {"__date__": obj.isoformat()}
+
+	if isinstance(obj, timedelta):
+		return {"__timedelta__": obj.total_seconds()}
+
+	if isinstance(obj, Decimal):
+		# as a string so no precision is lost
+		return {"__decimal__": str(obj)}
+
+	raise TypeError("Cannot store {t} in state".format(t=type(obj).__name__))
+
+def decode(obj:dict) -> object:
+	"""JSON decoder hook reversing `encode()`."""
+	if "__datetime__" in obj:
+		return datetime.fromisoformat(obj["__datetime__"])
+
+	if "__date__" in obj:
+		return date.fromisoformat(obj["__date__"])
+
+	if "__timedelta__" in obj:
+		return timedelta(seconds=obj["__timedelta__"])
+
+	if "__decimal__" in obj:
+		return Decimal(obj["__decimal__"])
+
+	return obj
+
+class StateStore:
+	"""Small documents kept between runs so tests can work incrementally.
+
+	Each key is stored as one JSON file in `directory`, written atomically so an interrupted
+	run never leaves a half written file. If `directory` is None state is only kept in memory
+	for the current process.
+	"""
+	def __init__(self, directory:Path=None):
+		self.directory = None if directory is None else Path(directory)
+		self.lock = threading.Lock()
+		# key : value, for everything loaded or saved so far
+		self.values = {}
+
+	def path(self, key:str) -> Path:
+		"""File holding `key`."""
+		return self.directory.joinpath("{key}.json".format(key=key.replace(os.sep, "_")))
+
+	def load(self, key:str, default:object=None) -> object:
+		"""Return the value saved for `key` by this or an earlier run, or `default`."""
+		with self.lock:
+			if key not in self.values and self.directory is not None:
+				try:
+					with self.path(key).open() as handle:
+						self.values[key] = json.load(handle, object_hook=decode)
+
+				except FileNotFoundError:
+					pass
+
+				except ValueError:
+					logger.warning("Ignoring unreadable state file {path}".format(path=self.path(key)))
+
+			return self.values.get(key, default)
+
+	def save(self, key:str, value:object) -> None:
+		"""Keep `value` for `key` for later runs.
+
+		If `directory` cannot be written a warning is logged and the value only lasts for this
+		run."""
+		with self.lock:
+			self.values[key] = value
+			if self.directory is None:
+				return
+
+			path = self.path(key)
+			temp = path.with_name("{name}.{pid}.part".format(name=path.name, pid=os.getpid()))
+			try:
+				self.directory.mkdir(parents=True, exist_ok=True)
+				with temp.open("w") as handle:
+					json.dump(value, handle, default=encode)
+
+				os.replace(temp, path)
+			except OSError as e:
+				# the value is still kept for this run
+				logger.warning("Cannot save state to {path}: {e}".format(path=path, e=e))
@@ -1,25 +1,426 @@
 #!/usr/bin/env python3
 
+"""Implementation of HistoryStore class.
+
+Every run adds the state of each measurement and the value of each message to a SQLite
+database, so results can be compared across runs. Series are named as in `result_lines()`
+output and the names are interned into integer keycodes, so each sample row holds just a
+time, a keycode, a run number and a value:
+
+CREATE TABLE keycodes (keycode INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE history_runs (run INTEGER PRIMARY KEY, execution_start REAL, execution_stop REAL);
+CREATE TABLE history_state (time REAL, keycode INTEGER, run INTEGER, value INTEGER);
+CREATE TABLE history_int (time REAL, keycode INTEGER, run INTEGER, value INTEGER);
+CREATE TABLE history_float (time REAL, keycode INTEGER, run INTEGER, value REAL);
+CREATE TABLE history_text (time REAL, keycode INTEGER, run INTEGER, value TEXT);
+
+Times are UNIX timestamps. All samples of a run share the run start time and are written in a
+single transaction.
+
+To stop the history growing without bound `compact()` ages it in tiers:
+- Raw rows are kept for `keep_raw`
+- Older state, integer and float samples are moved into one `history_blocks` row per series per
+	day, encoded by `codec.encode_series()` to a few bytes per sample, and kept for `keep_blocks`.
+	The run number is dropped and text samples are deleted. Blocks hold float64 values, so
+	integers beyond 2**53 are left as raw rows, kept as long as blocks, to stay exact
+- Numeric samples are also summarised as they are saved into count, total, minimum and maximum
+	per 5 minutes (`history_rollup_5m`, kept for `keep_5m`) and per hour (`history_rollup_1h`,
+	kept for `keep_1h`) so range queries over long periods only read a few rows
 """
-CREATE TABLE message_description (
-	keycode INT,
-	description STRING
-);
-
-CREATE TABLE keycodes (
-	keycode INT,
-	name STRING,
-);
-
-CREATE TABLE history_runs (
-	ID int,
-	execution_start TIMESTAMP,
-	execution_stop TIMESTAMP,
-
-CREATE TABLE history_int (
-	sensing_time TIMESTAMP,
-	keycode INT,
-	value INT,
-	run INT
-);
-"""
+
+import logging
+import time
+import sqlite3
+import calendar
+import threading
+from pathlib import Path
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .measurement import Measurement
+from .measurement import MeasurementState
+from .result import result_key
+from .codec import encode_series
+from .codec import decode_series
+
+logger = logging.getLogger("storage")
+
+# Stored value for each state. Never renumber these, only add new ones
+STATE_CODES = {
+	MeasurementState.GOOD: 0,
+	MeasurementState.NOT_APPLICABLE: 1,
+	MeasurementState.FAILED: 2,
+	MeasurementState.ERROR: 3,
+	MeasurementState.MIXED: 4,
+	MeasurementState.IN_PROGRESS: 5,
+	MeasurementState.EMPTY: 6,
+	MeasurementState.SKIPPED: 7,
+}
+
+STATES = {code: state for state, code in STATE_CODES.items()}
+
+SAMPLE_TABLES = ("history_state", "history_int", "history_float", "history_text")
+
+SCHEMA = [
+	"CREATE TABLE IF NOT EXISTS keycodes (keycode INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+	("CREATE TABLE IF NOT EXISTS history_runs (run INTEGER PRIMARY KEY, "
+	 "execution_start REAL NOT NULL, execution_stop REAL)"),
+]
+# Sample tables which are compressed into blocks, and the kind number recorded for each block
+BLOCK_KINDS = {"history_state": 0, "history_int": 1, "history_float": 2}
+
+# Largest integer a float64 block value holds exactly
+MAX_EXACT_INT = 2 ** 53
+
+# Condition on the samples of each table which may be moved into blocks
+BLOCK_CONDITIONS = {"history_int": "abs(value) <= {max}".format(max=MAX_EXACT_INT)}
+
+# Rollup period in seconds : table
+ROLLUP_TABLES = {300: "history_rollup_5m", 3600: "history_rollup_1h"}
+
+DAY = 86400
+
+for table, value_type in zip(SAMPLE_TABLES, ("INTEGER", "INTEGER", "REAL", "TEXT")):
+	SCHEMA.append(("CREATE TABLE IF NOT EXISTS {table} (time REAL NOT NULL, "
+				   "keycode INTEGER NOT NULL, run INTEGER NOT NULL, value {type})").format(
+					   table=table, type=value_type))
+	SCHEMA.append("CREATE INDEX IF NOT EXISTS {table}_keycode_time ON {table} (keycode, time)".format(
+		table=table))
+
+for table in ROLLUP_TABLES.values():
+	SCHEMA.append(("CREATE TABLE IF NOT EXISTS {table} (keycode INTEGER NOT NULL, time REAL NOT NULL, "
+				   "count INTEGER NOT NULL, total REAL NOT NULL, minimum REAL NOT NULL, "
+				   "maximum REAL NOT NULL, PRIMARY KEY (keycode, time)) WITHOUT ROWID").format(table=table))
+
+SCHEMA.append(("CREATE TABLE IF NOT EXISTS history_blocks (keycode INTEGER NOT NULL, "
+			   "kind INTEGER NOT NULL, time REAL NOT NULL, count INTEGER NOT NULL, data BLOB NOT NULL, "
+			   "PRIMARY KEY (keycode, kind, time))"))
+SCHEMA.append("CREATE TABLE IF NOT EXISTS history_meta (name TEXT PRIMARY KEY, value)")
+
+# SQLite limit on the number of parameters to a single statement is 999 in older versions
+MAX_PARAMETERS = 900
+
+def to_timestamp(value:datetime) -> float:
+	"""UNIX timestamp for `value`, taking naive datetimes as UTC like the rest of cmon."""
+	if value.tzinfo is None:
+		return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+	return value.timestamp()
+
+def sample_table(value:object) -> Tuple[str, object]:
+	"""Return the table to store `value` in and the value converted for storage."""
+	if isinstance(value, MeasurementState):
+		return "history_state", STATE_CODES[value]
+
+	if isinstance(value, (bool, int)):
+		return "history_int", int(value)
+
+	if isinstance(value, float):
+		return "history_float", value
+
+	if isinstance(value, timedelta):
+		return "history_float", value.total_seconds()
+
+	if isinstance(value, datetime):
+		return "history_float", to_timestamp(value)
+
+	return "history_text", str(value)
+
+def block_value(kind:int, value:float) -> object:
+	"""Convert a value decoded from a block of `kind` back to its stored type."""
+	if kind == BLOCK_KINDS["history_state"]:
+		return STATES[int(value)]
+
+	if kind == BLOCK_KINDS["history_int"]:
+		return int(value)
+
+	return value
+
+class HistoryStore:
+	"""Time series of all results, kept in a SQLite database file."""
+	def __init__(self,
+				 path:Path,
+				 keep_raw:timedelta=timedelta(days=7),
+				 keep_blocks:timedelta=timedelta(days=400),
+				 keep_5m:timedelta=timedelta(days=30),
+				 keep_1h:timedelta=None):
+		"""Args:
+		- `path`: Database file, created if needed
+		- `keep_raw`: Age at which samples are compressed into blocks
+		- `keep_blocks`: Age at which compressed samples are deleted
+		- `keep_5m`: Age at which 5 minute rollups are deleted
+		- `keep_1h`: Age at which hourly rollups are deleted, or None to keep them forever
+		"""
+		self.path = Path(path)
+		self.keep_raw = keep_raw
+		self.keep_blocks = keep_blocks
+		self.keep_5m = keep_5m
+		self.keep_1h = keep_1h
+		self.lock = threading.Lock()
+		self.conn = None
+		# name : keycode, for all keycodes read or created so far
+		self.keycodes = {}
+
+	def connect(self) -> sqlite3.Connection:
+		"""Open the database on first use, creating tables if needed."""
+		if self.conn is None:
+			self.path.parent.mkdir(parents=True, exist_ok=True)
+			# several cmon processes may share one history file
+			self.conn = sqlite3.connect(self.path, timeout=60)
+			self.conn.execute("PRAGMA journal_mode=WAL")
+			self.conn.execute("PRAGMA synchronous=NORMAL")
+			with self.conn:
+				for statement in SCHEMA:
+					self.conn.execute(statement)
+
+			self.keycodes = dict(self.conn.execute("SELECT name, keycode FROM keycodes"))
+
+		return self.conn
+
+	def intern(self, names:Iterable[str]) -> Dict[str, int]:
+		"""Return keycodes for `names`, allocating any new ones.
+
+		Must be called inside a transaction."""
+		new = sorted(set(name for name in names if name not in self.keycodes))
+		if len(new) > 0:
+			# another process may have added some of them since we last looked
+			self.conn.executemany("INSERT OR IGNORE INTO keycodes (name) VALUES (?)",
+								  ((name,) for name in new))
+			for i in range(0, len(new), MAX_PARAMETERS):
+				chunk = new[i:i + MAX_PARAMETERS]
+				self.keycodes.update(self.conn.execute(
+					"SELECT name, keycode FROM keycodes WHERE name IN ({marks})".format(
+						marks=",".join("?" * len(chunk))),
+					chunk))
+
+		return self.keycodes
+
+	def record(self,
+			   measurements:Iterable[Measurement],
+			   execution_start:datetime,
+			   execution_stop:datetime=None) -> int:
+		"""Save `measurements` as one run and return its run number.
+
+		Messages with an error instead of a value are not stored."""
+		start = to_timestamp(execution_start)
+		samples = []  # (name, value)
+		for measurement in measurements:
+			samples.append((result_key(measurement), measurement.state))
+			for message in measurement.messages:
+				if message.error is None and message.value is not None:
+					samples.append((result_key(measurement, message), message.value))
+
+		with self.lock:
+			conn = self.connect()
+			with conn:
+				run = conn.execute(
+					"INSERT INTO history_runs (execution_start, execution_stop) VALUES (?, ?)",
+					(start, None if execution_stop is None else to_timestamp(execution_stop))).lastrowid
+				keycodes = self.intern(name for name, _ in samples)
+				rows = {table: [] for table in SAMPLE_TABLES}
+				for name, value in samples:
+					table, stored = sample_table(value)
+					rows[table].append((start, keycodes[name], run, stored))
+
+				for table, table_rows in rows.items():
+					conn.executemany(
+						"INSERT INTO {table} (time, keycode, run, value) VALUES (?, ?, ?, ?)".format(
+							table=table),
+						table_rows)
+
+				self.add_rollups(rows["history_int"] + rows["history_float"])
+
+		logger.info("Saved {count} samples to {path} as run {run}".format(
+			count=len(samples), path=self.path, run=run))
+		return run
+
+	def add_rollups(self, rows:List[tuple]) -> None:
+		"""Add (time, keycode, run, value) `rows` to the rollup tables.
+
+		Must be called inside a transaction."""
+		for period, table in ROLLUP_TABLES.items():
+			buckets = {}  # (keycode, bucket start) : [count, total, minimum, maximum]
+			for sample_time, keycode, _, value in rows:
+				key = (keycode, sample_time // period * period)
+				bucket = buckets.get(key)
+				if bucket is None:
+					buckets[key] = [1, value, value, value]
+
+				else:
+					bucket[0] += 1
+					bucket[1] += value
+					bucket[2] = min(bucket[2], value)
+					bucket[3] = max(bucket[3], value)
+
+			self.conn.executemany(
+				("INSERT INTO {table} (keycode, time, count, total, minimum, maximum) "
+				 "VALUES (?, ?, ?, ?, ?, ?) "
+				 "ON CONFLICT (keycode, time) DO UPDATE SET "
+				 "count = count + excluded.count, total = total + excluded.total, "
+				 "minimum = min(minimum, excluded.minimum), "
+				 "maximum = max(maximum, excluded.maximum)").format(table=table),
+				(key + tuple(bucket) for key, bucket in buckets.items()))
+
+	def find_keycode(self, name:str) -> Optional[int]:
+		"""Return the keycode for series `name`, or None if it has never been saved."""
+		keycode = self.keycodes.get(name)
+		if keycode is None:
+			row = self.conn.execute("SELECT keycode FROM keycodes WHERE name = ?", (name,)).fetchone()
+			if row is not None:
+				keycode = self.keycodes[name] = row[0]
+
+		return keycode
+
+	def series(self,
+			   name:str,
+			   start:datetime=None,
+			   stop:datetime=None) -> List[Tuple[float, object]]:
+		"""Return (time, value) for each sample of series `name` between `start` and `stop`.
+
+		States are returned as MeasurementState values and all other values as stored, so
+		timedeltas come back as seconds and datetimes as UNIX timestamps."""
+		low = float("-inf") if start is None else to_timestamp(start)
+		high = float("inf") if stop is None else to_timestamp(stop)
+		with self.lock:
+			conn = self.connect()
+			keycode = self.find_keycode(name)
+			if keycode is None:
+				return []
+
+			result = []
+			for table in SAMPLE_TABLES:
+				rows = conn.execute(
+					"SELECT time, value FROM {table} WHERE keycode = ? AND time >= ? AND time <= ?".format(
+						table=table),
+					(keycode, low, high))
+				if table == "history_state":
+					result.extend((sample_time, STATES[value]) for sample_time, value in rows)
+
+				else:
+					result.extend(rows)
+
+			# each block holds one day starting at its time
+			for kind, data in conn.execute(
+					"SELECT kind, data FROM history_blocks WHERE keycode = ? AND time > ? AND time <= ?",
+					(keycode, low - DAY, high)):
+				result.extend((sample_time, block_value(kind, value))
+							  for sample_time, value in decode_series(data)
+							  if low <= sample_time <= high)
+
+		result.sort(key=lambda sample: sample[0])
+		return result
+
+	def rollups(self,
+				name:str,
+				period:int=3600,
+				start:datetime=None,
+				stop:datetime=None) -> List[Tuple[float, int, float, float, float]]:
+		"""Return (time, count, minimum, mean, maximum) for each `period` second interval of
+		numeric series `name` between `start` and `stop`.
+
+		`period` is 300 or 3600. Each time is the start of the interval."""
+		table = ROLLUP_TABLES[period]
+		with self.lock:
+			conn = self.connect()
+			keycode = self.find_keycode(name)
+			if keycode is None:
+				return []
+
+			return [(bucket, count, minimum, total / count, maximum)
+					for bucket, count, total, minimum, maximum in conn.execute(
+						("SELECT time, count, total, minimum, maximum FROM {table} "
+						 "WHERE keycode = ? AND time >= ? AND time <= ? ORDER BY time").format(table=table),
+						(keycode,
+						 float("-inf") if start is None else to_timestamp(start),
+						 float("inf") if stop is None else to_timestamp(stop)))]
+
+	def compact(self, now:datetime=None) -> None:
+		"""Age the history as described in the module documentation.
+
+		The work is done at most once per day, so this can be called after every run."""
+		now = time.time() if now is None else to_timestamp(now)
+		today = now // DAY * DAY
+		with self.lock:
+			conn = self.connect()
+			row = conn.execute("SELECT value FROM history_meta WHERE name = 'compacted'").fetchone()
+			if row is not None and row[0] >= today:
+				return
+
+			start = time.time()
+			keycodes = [row[0] for row in conn.execute("SELECT keycode FROM keycodes")]
+			# whole days only, so each block is written once
+			raw_cutoff = (now - self.keep_raw.total_seconds()) // DAY * DAY
+			with conn:
+				moved = 0
+				for table, kind in BLOCK_KINDS.items():
+					for keycode in keycodes:
+						rows = conn.execute(
+							("SELECT time, value FROM {table} WHERE keycode = ? AND time < ? AND {cond} "
+							 "ORDER BY time").format(table=table,
+													 cond=BLOCK_CONDITIONS.get(table, "1=1")),
+							(keycode, raw_cutoff)).fetchall()
+						if len(rows) > 0:
+							self.add_blocks(keycode, kind, rows)
+							moved += len(rows)
+
+				blocks_cutoff = now - self.keep_blocks.total_seconds()
+				for table in SAMPLE_TABLES:
+					self.delete_before(table, keycodes, raw_cutoff, BLOCK_CONDITIONS.get(table))
+
+				# integers too large for blocks are kept raw as long as blocks are
+				self.delete_before("history_int", keycodes, blocks_cutoff)
+				self.delete_before("history_blocks", keycodes, blocks_cutoff)
+				for period, keep in ((300, self.keep_5m), (3600, self.keep_1h)):
+					if keep is not None:
+						self.delete_before(ROLLUP_TABLES[period], keycodes, now - keep.total_seconds())
+
+				conn.execute("INSERT OR REPLACE INTO history_meta (name, value) VALUES ('compacted', ?)",
+							 (today,))
+
+		logger.info("Compacted {path}: {moved} samples moved to blocks in {elapsed:.1f}s".format(
+			path=self.path, moved=moved, elapsed=time.time() - start))
+
+	def add_blocks(self, keycode:int, kind:int, rows:List[Tuple[float, float]]) -> None:
+		"""Encode (time, value) `rows` into one block per day, merging with any existing blocks.
+
+		Must be called inside a transaction."""
+		days = {}  # day start : rows
+		for sample_time, value in rows:
+			days.setdefault(sample_time // DAY * DAY, []).append((sample_time, value))
+
+		for day, samples in days.items():
+			old = self.conn.execute(
+				"SELECT data FROM history_blocks WHERE keycode = ? AND kind = ? AND time = ?",
+				(keycode, kind, day)).fetchone()
+			if old is not None:
+				# late samples for a day already compacted
+				samples = sorted(decode_series(old[0]) + samples)
+
+			self.conn.execute(
+				("INSERT OR REPLACE INTO history_blocks (keycode, kind, time, count, data) "
+				 "VALUES (?, ?, ?, ?, ?)"),
+				(keycode, kind, day, len(samples), encode_series(samples)))
+
+	def delete_before(self,
+					  table:str,
+					  keycodes:Iterable[int],
+					  cutoff:float,
+					  condition:str=None) -> None:
+		"""Delete rows of `table` older than `cutoff` which match SQL `condition` if given, one
+		series at a time so the (keycode, time) index is used."""
+		self.conn.executemany(
+			"DELETE FROM {table} WHERE keycode = ? AND time < ? AND {cond}".format(
+				table=table, cond="1=1" if condition is None else condition),
+			((keycode, cutoff) for keycode in keycodes))
+
+	def close(self) -> None:
+		"""Close the database."""
+		with self.lock:
+			if self.conn is not None:
+				self.conn.close()
+				self.conn = None
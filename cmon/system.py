@@ -2,10 +2,13 @@
 
 """Implementation of the System class."""
 
+import queue
 import logging
+import threading
+from typing import Callable
 from typing import Iterable
+from typing import Iterator
 from typing import Dict
-from collections import defaultdict
 from fnmatch import fnmatch
 
 from .dashboard import Dashboard
@@ -13,7 +16,7 @@ from .context import Context
 from .measurement import Measurement
 from .measurement import measure
 from .testable import Testable
-from .testable import Testable
+from .runner import Runner
 
 logger = logging.getLogger("dashboards")
 
@@ -51,10 +54,15 @@ class System:
 
 		return subjects
 
-	def run(self, context:Context) -> Dict[Testable, Iterable[Measurement]]:
-		"""Run all tests against all subjects and return a flat list of results."""
-		results = defaultdict(list)  # Subject : list(Measurement)
+	def selected_subjects(self, context:Context) -> Iterable[Testable]:
+		"""Return all subjects not excluded by the `include_subjects` option in `context`.
+
+		A subject which appears in several test suites is only returned once."""
+		subjects = []
 		for subject in self.all_subjects():
+			if subject in subjects:
+				continue
+
 			if context.include_subjects is not None:
 				# print("test if subject excluded")
 				include = False
@@ -69,34 +77,64 @@ class System:
 					# logger.info("  excluded")
 					continue
 
-			logger.info("Subject {s}".format(s=subject.name))
-
-			# check if this subject has a unique list of tests defined in the config file
-			if subject.tests:
-				tests = subject.tests
-
-			# otherwise use the normal tests for this subject type
-			else:
-				tests = self.standard_tests[type(subject)]
-
-			for test in tests:
-				if getattr(test, "decorator", None) is not measure:
-					raise ValueError("Subject {s} has invalid test {t}".format(
-						s=subject, t=test))
-
-				logger.info("Test {t}".format(t=test.name))
-				measurement = test(subject=subject, context=context)
-				assert isinstance(measurement, Measurement)
-				measurement.subject = subject
-				measurement.test_fn = test
-				for message in measurement.messages:
-					# print("binding message name", message.name, "value", message.value)
-					for message_description in test.messages:
-						# print(" against message description", message_description.name)
-						if message_description.name == message.name:
-							message.description = message_description
-
-				results[subject].append(measurement)
-				logger.debug("Result {r}".format(r=measurement))
-
-		return results
+			subjects.append(subject)
+
+		return subjects
+
+	def subject_tests(self, subject:Testable) -> Iterable[Measurement]:
+		"""Return the list of tests to be run against `subject`."""
+		# check if this subject has a unique list of tests defined in the config file
+		if subject.tests:
+			tests = subject.tests
+
+		# otherwise use the normal tests for this subject type
+		else:
+			tests = self.standard_tests[type(subject)]
+
+		for test in tests:
+			if getattr(test, "decorator", None) is not measure:
+				raise ValueError("Subject {s} has invalid test {t}".format(
+					s=subject, t=test))
+
+		return tests
+
+	def run(self,
+			context:Context,
+			on_result:Callable[[Measurement], None]=None) -> Dict[Testable, Iterable[Measurement]]:
+		"""Run all tests against all subjects and return their results, grouped by subject in
+		configuration order.
+
+		Up to `context.jobs` subjects are tested in parallel. If `on_result` is given it is
+		called with each measurement as soon as it finishes, possibly from a worker thread."""
+		return Runner(system=self, context=context, on_result=on_result).run()
+
+	def stream(self, context:Context) -> Iterator[Measurement]:
+		"""Run all tests against all subjects, yielding each measurement as soon as it finishes.
+
+		Measurements come in the order they complete. The tests run in a background thread,
+		which carries on if the caller stops iterating early."""
+		finished = queue.Queue()
+		outcome = {}
+
+		def target():
+			try:
+				self.run(context, on_result=finished.put)
+			except BaseException as e:
+				outcome["error"] = e
+
+			finally:
+				# end marker
+				finished.put(None)
+
+		thread = threading.Thread(target=target, name="cmon-run", daemon=True)
+		thread.start()
+		while True:
+			measurement = finished.get()
+			if measurement is None:
+				break
+
+			yield measurement
+
+		thread.join()
+		if "error" in outcome:
+			raise outcome["error"]
@@ -14,6 +14,15 @@ from .measurement import traffic_light
 from .testable import Testable
 from .system import System
 
+def terminal_progress(output:TerminalPrinter, measurement:Measurement) -> None:
+	"""Show a single line for a test as soon as it finishes, before the full dashboards."""
+	output.write_line("{targettype} {label}: Test {testname}: {state}".format(
+		targettype=measurement.subject.__class__.__name__,
+		label=measurement.subject.label,
+		testname=measurement.test_fn.label,
+		state=measurement.state.value))
+	output.target.flush()
+
 def terminal_dashboards(output:TerminalPrinter,
 						# dashboards:Dict[str, Dashboard],
 						system: System,
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""Implementation of HTTPPool class."""
+
+import ssl
+import atexit
+import logging
+import threading
+import importlib.util
+from typing import Union
+
+import httpx
+
+logger = logging.getLogger("website")
+
+class HTTPPool:
+	"""Process wide cache of keep-alive HTTP clients shared by all Website tests.
+
+	One `httpx.Client` is kept per origin (scheme, host, port) and connection settings,
+	so repeated requests to a site reuse open connections instead of paying for a new TCP
+	connection and TLS handshake each time. All clients share one SSL context so the
+	certificate store is only loaded once.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		# (scheme, host, port, http2, max_connections) : Client
+		self.clients = {}
+		self.ssl_context = None
+		self.http2_available = importlib.util.find_spec("h2") is not None
+
+	def get_ssl_context(self) -> ssl.SSLContext:
+		"""Return the shared SSL context, creating it on first use."""
+		with self.lock:
+			if self.ssl_context is None:
+				self.ssl_context = ssl.create_default_context()
+
+			return self.ssl_context
+
+	def client(self,
+			   url:Union[str, httpx.URL],
+			   http2:bool=False,
+			   max_connections:int=10) -> httpx.Client:
+		"""Return the shared client for the origin of `url`.
+
+		Args:
+		- `http2`: Allow HTTP/2 if the server supports it. Needs the `h2` package,
+			otherwise HTTP/1.1 is used
+		- `max_connections`: Maximum open connections to the origin
+		"""
+		if http2 and not self.http2_available:
+			logger.warning("HTTP/2 requested but the h2 package is not installed")
+			http2 = False
+
+		url = httpx.URL(url)
+		key = (url.scheme, url.host, url.port, http2, max_connections)
+		ssl_context = self.get_ssl_context()
+		with self.lock:
+			client = self.clients.get(key)
+			if client is None:
+				logger.debug("New HTTP client for {scheme}://{host}".format(
+					scheme=url.scheme, host=url.host))
+				client = httpx.Client(
+					verify=ssl_context,
+					http2=http2,
+					limits=httpx.Limits(max_connections=max_connections,
+										max_keepalive_connections=max_connections))
+				self.clients[key] = client
+
+			return client
+
+	def close(self) -> None:
+		"""Close all clients and their connections."""
+		with self.lock:
+			for client in self.clients.values():
+				client.close()
+
+			self.clients.clear()
+
+# Clients shared by the whole process
+http_pool = HTTPPool()
+atexit.register(http_pool.close)
@@ -2,19 +2,39 @@
 
 """Measurement tests to be run against websites."""
 
+import time
+import asyncio
 import logging
+import threading
+from typing import Tuple
+from typing import Union
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from ..utils import is_listlike
 from ..context import Context
+from ..server.server import ConnectionException
 from .website import Website
+from .website import URL
+from .website import Fetched
+from .website import LoadTest
+from .httppool import http_pool
+from ..histogram import Histogram
 from ..measurement import Measurement
 from ..measurement import MeasurementState
 from ..measurement import Message
 from ..measurement import measure
 from ..measurement import MessageDescription
 
+import httpx
+
 logger = logging.getLogger("webtests")
 
+# Maximum requests in flight across all websites
+WEB_CONCURRENCY = 32
+
+web_semaphore = threading.BoundedSemaphore(WEB_CONCURRENCY)
+
 @measure(
 	label="Web requests",
 	name="web",
@@ -28,16 +48,56 @@ logger = logging.getLogger("webtests")
 			unit="ms",
 			sf=4,
 			multiple=dict,
+			datatype=float),
+		MessageDescription(
+			name="size",
+			label="Size",
+			description="Bytes of response body read",
+			unit="bytes",
+			humanize=True,
+			multiple=dict,
+			datatype=int),
+		MessageDescription(
+			name="truncated",
+			label="Truncated",
+			description="Response body was larger than the website max_bytes limit",
+			multiple=dict,
+			datatype=bool),
+	] + [
+		MessageDescription(
+			name=phase,
+			label=label,
+			description=description,
+			unit="ms",
+			sf=3,
+			multiple=dict,
 			datatype=float)
+		for phase, label, description in (
+			("dns", "DNS", "Time of a separate lookup of the hostname made before each request "
+			 "and not counted in the response time, as the HTTP client does not report its own"),
+			("connect", "Connect", "TCP connection time including the client's own hostname "
+			 "lookup, for new connections only"),
+			("tls", "TLS", "TLS handshake time, for new HTTPS connections only"),
+			("ttfb", "TTFB", "Time from sending the request to receiving response headers"),
+			("download", "Download", "Time to read the response body"),
+		)
 	]
 )
 def measure_web_urls(subject:Website, context:Context):
+	"""Fetch all URLs of `subject`.
+
+	Up to `subject.concurrency` URLs of the site are fetched at once, and no more than
+	`WEB_CONCURRENCY` across all sites being tested in parallel."""
 	# logger.info("Retrieving from {url}".format(url=target.url))
 	result = Measurement(MeasurementState.GOOD)
-	for url in subject.urls:
-		response = subject.get(url)
-		check = subject.validate(response)
-		if check is True:
+	if not subject.urls:
+		return result
+
+	with ThreadPoolExecutor(max_workers=max(1, min(subject.concurrency, len(subject.urls))),
+							thread_name_prefix="web") as executor:
+		# map() gives results in the same order as our `urls`
+		fetched = executor.map(partial(fetch, subject), subject.urls)
+		for url, (page, check) in zip(subject.urls, fetched):
 			if isinstance(url, str):
 				display_url = url
 
@@ -47,14 +107,144 @@ def measure_web_urls(subject:Website, context:Context):
 			if display_url.endswith("/"):
 				display_url = display_url[:-1]
 
-			result.add_message(Message("response",
-									   response.elapsed.total_seconds() * 1000,
-									   parameter=display_url))
+			if check is True:
+				result.add_message(Message("response",
+										   page.elapsed.total_seconds() * 1000,
+										   parameter=display_url))
+
+			else:
+				result.add_message(Message("response",
+										   error=check,
+										   parameter=display_url))
+				result.state = MeasurementState.FAILED
+
+			if page is None:
+				# no response to report on
+				continue
+
+			result.add_message(Message("size", page.size, parameter=display_url))
+			result.add_message(Message("truncated", page.truncated, parameter=display_url))
+			for phase, seconds in page.timings.items():
+				result.add_message(Message(phase, seconds * 1000, parameter=display_url))
+
+	return result
+
+def fetch(subject:Website, url:Union[URL, str]) -> Tuple[Fetched, Union[bool, str]]:
+	"""Retrieve and validate a single `url`, within the global concurrency limit.
+
+	If the request itself fails no response is returned, just the error, so one bad URL
+	does not lose the results of the others."""
+	with web_semaphore:
+		try:
+			fetched = subject.get(url)
+		except (ConnectionException, httpx.HTTPError, httpx.InvalidURL) as e:
+			return None, "{name}: {e}".format(name=type(e).__name__, e=e)
+
+		return fetched, subject.validate(fetched)
+
+@measure(
+	label="Web load",
+	name="webload",
+	description="Measure website capacity under concurrent requests",
+	subject_type=Website,
+	messages=[
+		MessageDescription(
+			name="throughput",
+			label="Throughput",
+			description="Successful requests completed per second",
+			unit="req/s",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="error_rate",
+			label="Error rate",
+			description="Percentage of requests which failed or returned an error code",
+			unit="%",
+			sf=3,
+			datatype=float),
+		MessageDescription(
+			name="requests",
+			label="Requests",
+			description="Total requests made",
+			datatype=int),
+	] + [
+		MessageDescription(
+			name=name,
+			label=name,
+			description="{pc}th percentile response time".format(pc=name[1:]),
+			unit="ms",
+			sf=3,
+			datatype=float)
+		for name in ("p50", "p95", "p99")
+	]
+)
+async def measure_web_load(subject:Website, context:Context):
+	"""Keep `load_test.concurrency` requests in flight against one URL for `load_test.duration`
+	seconds."""
+	load_test = subject.load_test
+	if load_test is None:
+		return Measurement(MeasurementState.NOT_APPLICABLE)
+
+	latencies = Histogram()
+	counts = {"requests": 0, "errors": 0}
+	limits = httpx.Limits(max_connections=load_test.concurrency,
+						  max_keepalive_connections=load_test.concurrency)
+	http2 = subject.http2
+	if http2 and not http_pool.http2_available:
+		logger.warning("HTTP/2 requested but the h2 package is not installed")
+		http2 = False
+
+	async with httpx.AsyncClient(limits=limits,
+								 timeout=load_test.timeout,
+								 http2=http2) as client:
+		start = time.perf_counter()
+		stop = start + load_test.duration
+		await asyncio.gather(*(load_worker(client, str(load_test.url), stop, latencies, counts)
+							   for _ in range(load_test.concurrency)))
+		elapsed = time.perf_counter() - start
+
+	return load_result(load_test, latencies, counts, elapsed)
+
+async def load_worker(client:httpx.AsyncClient,
+					  url:str,
+					  stop:float,
+					  latencies:Histogram,
+					  counts:dict) -> None:
+	"""Request `url` repeatedly until time `stop`, recording into `latencies` and `counts`."""
+	while time.perf_counter() < stop:
+		counts["requests"] += 1
+		sent = time.perf_counter()
+		try:
+			async with client.stream("GET", url) as response:
+				# read and discard the body so timing includes the transfer
+				async for _ in response.aiter_raw():
+					pass
+
+		except httpx.HTTPError:
+			counts["errors"] += 1
+			continue
+
+		if httpx.codes.is_success(response.status_code):
+			latencies.record((time.perf_counter() - sent) * 1000)
 
 		else:
-			result.add_message(Message("response",
-									   error="Request failed",
-									   parameter=url))
-			result.state = MeasurementState.FAILED
+			counts["errors"] += 1
+
+def load_result(load_test:LoadTest, latencies:Histogram, counts:dict, elapsed:float) -> Measurement:
+	"""Make a measurement from load test results, failed if any of the limits were breached."""
+	result = Measurement(MeasurementState.GOOD)
+	throughput = latencies.count / elapsed
+	error_rate = counts["errors"] / counts["requests"] if counts["requests"] > 0 else 0
+	result.add_message(Message("throughput", throughput))
+	result.add_message(Message("error_rate", error_rate * 100))
+	result.add_message(Message("requests", counts["requests"]))
+	for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+		result.add_message(Message(name, latencies.percentile(q)))
+
+	p99 = latencies.percentile(0.99)
+	if (load_test.max_error_rate is not None and error_rate > load_test.max_error_rate) or\
+	   (load_test.min_throughput is not None and throughput < load_test.min_throughput) or\
+	   (load_test.max_p99 is not None and (p99 is None or p99 > load_test.max_p99)):
+		result.state = MeasurementState.FAILED
 
 	return result
@@ -2,18 +2,36 @@
 
 """Implementation of Website class."""
 
+import time
+import socket
 import logging
 from typing import Iterable
 from typing import Union
-import ssl
 
 from ..testable import Testable
 from ..server.server import ConnectionException
+from .httppool import http_pool
 
 import httpx
 
 logger = logging.getLogger("website")
 
+# Fragments of page content which show the server failed even if it returned 200
+ERROR_SIGNATURES = (
+	b"Traceback (most recent call last)",
+	b"Internal Server Error",
+	b"Fatal error:</b>",
+	b"Parse error:</b>",
+	b"Whitelabel Error Page",
+	b"Service Unavailable",
+	b"Bad Gateway",
+	b"Gateway Time-out",
+	b"Error establishing a database connection",
+)
+
+# Bytes kept between chunks so a signature split across two chunks is still found
+SIGNATURE_OVERLAP = max(len(s) for s in ERROR_SIGNATURES) - 1
+
 class URL:
 	"""A labelled URL string."""
 	def __init__(self,
@@ -21,16 +39,127 @@ class URL:
 				 label:str=None,
 				 http_user:str=None,
 				 http_password:str=None,
-				 required:bool=True):
+				 required:bool=True,
+				 timeout:float=None,
+				 http2:bool=None,
+				 max_connections:int=None):
+		"""Args:
+		- `timeout`: Network timeout in seconds for this URL, if different from the website
+		- `http2`: Allow HTTP/2 for this URL, if different from the website
+		- `max_connections`: Connection limit for this URL's origin, if different from the website
+		"""
 		self.url = url
 		self.label = label
 		self.http_user = http_user
 		self.http_password = http_password
+		self.timeout = timeout
+		self.http2 = http2
+		self.max_connections = max_connections
 		self.required = required
 
 	def __str__(self):
 		return self.url
 
+class LoadTest:
+	"""Settings for an HTTP load test of a website."""
+	def __init__(self,
+				 url:Union[URL, str],
+				 concurrency:int=10,
+				 duration:float=10,
+				 timeout:float=10,
+				 max_error_rate:float=None,
+				 max_p99:float=None,
+				 min_throughput:float=None):
+		"""Args:
+		- `url`: Address to request repeatedly
+		- `concurrency`: Number of requests kept in flight
+		- `duration`: Seconds to keep sending requests for. The whole load test must fit
+			inside the test timeout
+		- `timeout`: Network timeout in seconds for each request
+		- `max_error_rate`: Fail if more than this fraction of requests fail
+		- `max_p99`: Fail if the 99th percentile response time is above this many ms
+		- `min_throughput`: Fail if fewer than this many requests per second complete
+		"""
+		self.url = url
+		self.concurrency = concurrency
+		self.duration = duration
+		self.timeout = timeout
+		self.max_error_rate = max_error_rate
+		self.max_p99 = max_p99
+		self.min_throughput = min_throughput
+
+class PhaseTimer:
+	"""Time the phases of one request from httpcore trace events.
+
+	`connect` and `tls` are only seen when a new connection is opened, so requests over a
+	reused keep-alive connection report just `ttfb` and `download`.
+	httpcore resolves the hostname inside its TCP connect and does not report it, so `dns` is
+	an independent probe, see `resolve()`."""
+	def __init__(self):
+		self.marks = {}
+
+	def resolve(self, url:str) -> None:
+		"""Time our own lookup of the host of `url`.
+
+		This is made before the request starts so it is not part of the response time. The
+		connection still does its own lookup, which is counted in `connect` (usually answered
+		from the resolver cache our probe has just filled)."""
+		parsed = httpx.URL(url)
+		self.marks["dns.started"] = time.perf_counter()
+		try:
+			socket.getaddrinfo(parsed.host, parsed.port or (443 if parsed.scheme == "https" else 80),
+							   type=socket.SOCK_STREAM)
+		except OSError:
+			return
+
+		self.marks["dns.complete"] = time.perf_counter()
+
+	def trace(self, event:str, info:dict) -> None:
+		"""Callback for the httpx `trace` request extension."""
+		# events are named like "connection.connect_tcp.started", "http11.send_request_headers.complete"
+		_, _, event = event.partition(".")
+		# only the first of repeated events (e.g. one body chunk each) matters
+		self.marks.setdefault(event, time.perf_counter())
+
+	def finish(self) -> None:
+		"""Mark the end of reading the response body."""
+		self.marks["finished"] = time.perf_counter()
+
+	def between(self, start:str, end:str) -> float:
+		"""Seconds between events `start` and `end`, or None if either did not happen."""
+		if start in self.marks and end in self.marks:
+			return self.marks[end] - self.marks[start]
+
+		return None
+
+	def durations(self) -> dict:
+		"""Map of phase name against seconds for all phases that were seen."""
+		result = {
+			"dns": self.between("dns.started", "dns.complete"),
+			"connect": self.between("connect_tcp.started", "connect_tcp.complete"),
+			"tls": self.between("start_tls.started", "start_tls.complete"),
+			"ttfb": self.between("send_request_headers.started", "receive_response_headers.complete"),
+			"download": self.between("receive_response_headers.complete", "finished"),
+		}
+		return {k: v for k, v in result.items() if v is not None}
+
+class Fetched:
+	"""Summary of a retrieved URL, built while the body is streamed.
+
+	The body itself is not kept, only the response headers and what we learned
+	reading it."""
+	def __init__(self, response:httpx.Response):
+		self.response = response
+		self.status_code = response.status_code
+		self.size = 0
+		self.truncated = False
+		self.problem = None
+		self.timings = {}
+
+	@property
+	def elapsed(self):
+		return self.response.elapsed
+
 class Website(Testable):
 	"""Representation of a website to be tested."""
 	name = "website"
@@ -44,34 +173,93 @@ class Website(Testable):
 				 server:Iterable["Server"]=None,
 				 http_user:str=None,
 				 http_password:str=None,
+				 timeout:float=10,
+				 http2:bool=False,
+				 max_connections:int=10,
+				 concurrency:int=4,
+				 max_bytes:int=1024*1024,
+				 load_test:LoadTest=None,
 				 ):
+		"""Args:
+		- `timeout`: Network timeout in seconds for each request
+		- `http2`: Use HTTP/2 if the server supports it (requires the `h2` package)
+		- `max_connections`: Maximum connections open to each origin
+		- `concurrency`: Maximum number of our URLs fetched at the same time
+		- `max_bytes`: Stop reading each response body after this many bytes
+		- `load_test`: Settings for the optional load test
+		"""
 		super().__init__(label=label)
 		self.database = database
 		self.urls = urls
 		self.server = server
 		self.http_user = http_user
 		self.http_password = http_password
+		self.timeout = timeout
+		self.http2 = http2
+		self.max_connections = max_connections
+		self.concurrency = concurrency
+		self.max_bytes = max_bytes
+		self.load_test = load_test
+
+	def url_option(self, url:Union[URL, str], name:str) -> object:
+		"""Return setting `name` for `url`, which may override our own value."""
+		value = getattr(url, name, None)
+		return getattr(self, name) if value is None else value
+
+	def get(self, url) -> Fetched:
+		"""Retrieve `url`, streaming the body and checking it as it arrives.
 
-	def get(self, url):
+		Reading stops after `max_bytes`, so an accidental huge download is never held
+		in memory."""
 		# data = {'username': username, 'password': password}
 		params = None
 		cookies = None
 		auth = None
-		# disable ssl checks because we have self signed certs
-		context = ssl.create_default_context()
-
+		timeout = self.url_option(url, "timeout")
+		http2 = self.url_option(url, "http2")
+		max_connections = self.url_option(url, "max_connections")
 		if isinstance(url, URL):
 			url = url.url
 
+		# keep-alive client shared by all requests to the same origin
+		client = http_pool.client(url, http2=http2, max_connections=max_connections)
+		phases = PhaseTimer()
 		try:
-			response = httpx.get(url, verify=context)
+			phases.resolve(url)
+			with client.stream("GET",
+							   url,
+							   timeout=timeout,
+							   extensions={"trace": phases.trace}) as response:
+				fetched = Fetched(response)
+				tail = b""
+				for chunk in response.iter_bytes():
+					if fetched.size + len(chunk) > self.max_bytes:
+						chunk = chunk[:self.max_bytes - fetched.size]
+						fetched.truncated = True
+
+					fetched.size += len(chunk)
+					if fetched.problem is None:
+						window = tail + chunk
+						for signature in ERROR_SIGNATURES:
+							if signature in window:
+								fetched.problem = "Found \"{sig}\"".format(sig=signature.decode())
+								break
+
+						tail = window[-SIGNATURE_OVERLAP:]
+
+					if fetched.truncated:
+						break
+
+				phases.finish()
+				fetched.timings = phases.durations()
+
 		except httpx.ConnectError as e:
 			raise ConnectionException(url) from e
 
-		return response
+		return fetched
 
-	def validate(self, response):
-		"""Check `response` and return true if it looks good, otherwise an error string.
+	def validate(self, fetched:Fetched):
+		"""Check `fetched` and return true if it looks good, otherwise an error string.
 
 		Checks are:
 		- server response code
@@ -81,13 +269,20 @@ class Website(Testable):
 		- I guess we could run it through a headless server and check for render or javascript
 		errors
 		"""
-		if not httpx.codes.is_success(response.status_code):
-			return "Bad code {cc} ({name})".format(cc=response.status_code,
-												   name=httpx.codes(response.status_code))
+		if not httpx.codes.is_success(fetched.status_code):
+			return "Bad code {cc} ({name})".format(cc=fetched.status_code,
+												   name=httpx.codes(fetched.status_code))
+
+		logger.info("web test validate code {code} len {len}{trunc}".format(
+			code=fetched.status_code,
+			len=fetched.size,
+			trunc=" (truncated)" if fetched.truncated else ""))
+
+		if fetched.problem is not None:
+			return fetched.problem
 
-		body = response.text
-		logger.info("web test validate code {code} len {len}".format(
-			code=response.status_code, len=len(body)))
+		if fetched.size == 0 and fetched.status_code != httpx.codes.NO_CONTENT:
+			return "Empty response"
 
 		return True
 
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Time incremental dataflow scans of a directory of many files.
+
+Not part of the test suite, run directly with cmon installed:
+
+	python3 tests/benchmark_walk.py --files 100000
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from cmon.server.server import Server
+from cmon.dataflow.walk import Filesystem
+from cmon.dataflow.walk import LocalFilesystem
+from cmon.dataflow.walk import SFTPFilesystem
+from cmon.dataflow.walk import Walk
+
+def benchmark(label:str, filesystem:Filesystem, directory:str, mtime:float) -> None:
+	"""Print times for a first scan of `directory`, a rescan with nothing changed and a
+	rescan after one new file arrives. `directory` must have been modified at `mtime`."""
+	state = {}
+	new = os.path.join(directory, "new.dat")
+	for run in ("cold", "unchanged", "one new file"):
+		if run == "one new file":
+			open(new, "w").close()
+			os.utime(directory, (mtime + 1, mtime + 1))
+
+		walk = Walk(filesystem, patterns=["*.dat"], max_depth=0, previous=state, now=time.time())
+		start = time.perf_counter()
+		result = walk.run(directory)
+		elapsed = time.perf_counter() - start
+		state = walk.state
+		print("{label:6} {run:13} {files:8} files {elapsed:8.3f}s".format(
+			label=label, run=run, files=result.files, elapsed=elapsed))
+
+	os.remove(new)
+	os.utime(directory, (mtime, mtime))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Time dataflow scans of a directory of many files")
+	parser.add_argument("--files", type=int, default=100000, help="Number of files to create")
+	parser.add_argument("--host",
+						help=("Also time scans over SFTP to this host, which must see the same "
+							  "directories as us"))
+	parser.add_argument("--user", help="ssh user for --host")
+	parser.add_argument("--dir", help="Create the test directory inside this one")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+		for i in range(args.files):
+			open(os.path.join(directory, "file{i:07}.dat".format(i=i)), "w").close()
+
+		# let the directory mtime age so unchanged scans can trust it
+		mtime = time.time() - 60
+		os.utime(directory, (mtime, mtime))
+		benchmark("local", LocalFilesystem(), directory, mtime)
+		if args.host is not None:
+			server = Server(hostname=args.host, label=args.host, ssh_user=args.user)
+			with server.ssh_sftp() as sftp:
+				benchmark("sftp", SFTPFilesystem(sftp), directory, mtime)
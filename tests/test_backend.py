@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""Test the incremental backend jobs query and the state it keeps between runs."""
+
+from decimal import Decimal
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+import sqlalchemy
+
+from cmon.context import Context
+from cmon.state import StateStore
+from cmon.backend.backend import Backend
+from cmon.backend.backend_tests import measure_backend_jobs
+from cmon.database.database import Database
+
+class SQLiteDatabase(Database):
+	"""In memory SQLite database holding a jobs table."""
+	def __init__(self):
+		super().__init__(dialect="sqlite", host=None, label="Jobs")
+		self.sqlite = sqlalchemy.create_engine("sqlite://", poolclass=sqlalchemy.pool.StaticPool)
+		with self.sqlite.begin() as conn:
+			conn.execute(sqlalchemy.text(
+				"CREATE TABLE jobs (id INTEGER PRIMARY KEY, activity TEXT, gen_time TIMESTAMP, "
+				"status TEXT)"))
+
+	def engine(self):
+		return self.sqlite
+
+	def add(self, activity, gen_time, status="COMPLETED"):
+		with self.sqlite.begin() as conn:
+			conn.execute(sqlalchemy.text(
+				"INSERT INTO jobs (activity, gen_time, status) VALUES (:a, :t, :s)"),
+						 {"a": activity, "t": gen_time, "s": status})
+
+	def update(self, status):
+		with self.sqlite.begin() as conn:
+			conn.execute(sqlalchemy.text("UPDATE jobs SET status=:s"), {"s": status})
+
+def totals(result):
+	"""Message values by (name, parameter)."""
+	return {(m.name, m.parameter): m.value for m in result.messages}
+
+def run(backend, state_dir, now):
+	"""Run the jobs test as if at time `now`."""
+	context = Context(state_dir=state_dir)
+	context.execute_start = now
+	return totals(measure_backend_jobs(subject=backend, context=context)), context
+
+def test_jobs(tmp_path):
+	now = datetime.utcnow()
+	database = SQLiteDatabase()
+	database.add("INGEST", now - timedelta(days=2))
+	database.add("INGEST", now - timedelta(hours=2))
+	database.add("INGEST", now - timedelta(hours=1, minutes=30), status="FAILED")
+	database.add("REPORT", now - timedelta(hours=3))
+	backend = Backend(database=database,
+					  label="Backend",
+					  expected_jobs=[{"activity": "INGEST", "field": "gen_time"},
+									 {"activity": "REPORT", "field": "gen_time"}])
+
+	# the first run only counts jobs inside the window
+	messages, context = run(backend, tmp_path, now)
+	assert messages["total", "INGEST"] == 2
+	assert messages["failed", "INGEST"] == 1
+	assert messages["total", "REPORT"] == 1
+	state = context.state.load("backend-jobs.{id}".format(id=backend.get_id()))
+	assert [group["mark"] for group in state.values()] == [now - timedelta(hours=1)]
+
+	# later runs read jobs after the mark saved by the last one
+	database.add("INGEST", now)
+	later = now + timedelta(minutes=10)
+	messages, context = run(backend, tmp_path, later)
+	assert messages["total", "INGEST"] == 3
+	assert messages["failed", "INGEST"] == 1
+	assert messages["total", "REPORT"] == 1
+	state = context.state.load("backend-jobs.{id}".format(id=backend.get_id()))
+	assert [group["mark"] for group in state.values()] == [later - timedelta(hours=1)]
+
+def test_jobs_settle(tmp_path):
+	"""Jobs are read again until they settle, so late changes and late commits are seen."""
+	now = datetime.utcnow()
+	database = SQLiteDatabase()
+	database.add("INGEST", now - timedelta(minutes=20), status="RUNNING")
+	backend = Backend(database=database,
+					  label="Backend",
+					  expected_jobs=[{"activity": "INGEST", "field": "gen_time"}])
+	messages, _ = run(backend, tmp_path, now)
+	assert (messages["total", "INGEST"], messages["failed", "INGEST"]) == (1, 0)
+
+	# the job fails after it was first counted, and an earlier job is committed late
+	database.update("FAILED")
+	database.add("INGEST", now - timedelta(minutes=30))
+	messages, _ = run(backend, tmp_path, now + timedelta(minutes=10))
+	assert (messages["total", "INGEST"], messages["failed", "INGEST"]) == (2, 1)
+
+	# once settled they are kept in the saved counts and not read again
+	messages, _ = run(backend, tmp_path, now + timedelta(hours=2))
+	assert (messages["total", "INGEST"], messages["failed", "INGEST"]) == (2, 1)
+	messages, _ = run(backend, tmp_path, now + timedelta(hours=3))
+	assert (messages["total", "INGEST"], messages["failed", "INGEST"]) == (2, 1)
+
+def test_state(tmp_path):
+	value = {"when": datetime(2024, 1, 2, 3, 4, 5),
+			 "day": date(2024, 1, 2),
+			 "window": timedelta(hours=6),
+			 "mark": Decimal("12345678901234567890.5"),
+			 "list": [1, "two", None]}
+	StateStore(tmp_path).save("key", value)
+	assert StateStore(tmp_path).load("key") == value
+	assert StateStore(tmp_path).load("missing", 7) == 7
+
+def test_state_unwritable(tmp_path):
+	"""State is still kept for this run if it cannot be saved."""
+	blocked = tmp_path.joinpath("file")
+	blocked.write_text("")
+	store = StateStore(blocked)
+	store.save("key", 1)
+	assert store.load("key") == 1
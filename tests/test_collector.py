@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""Test the collector run by agent mode, here on the local host."""
+
+import os
+
+from cmon.server import collector
+from cmon.server.collector import collect
+from cmon.server.collector import scan_dataflow
+
+def tree(root):
+	"""Files at depths 0, 1 and 2 below `root`, with mtimes 100, 200 and 300."""
+	for depth, directory in enumerate((root, root / "a", root / "a" / "b")):
+		directory.mkdir(exist_ok=True)
+		for name, size in (("x.dat", 10), ("y.txt", 1)):
+			path = directory / name
+			path.write_bytes(b"x" * size)
+			os.utime(path, (100 * (depth + 1), 100 * (depth + 1)))
+
+def test_scan_depth(tmp_path):
+	tree(tmp_path)
+	assert scan_dataflow(str(tmp_path)) == {"files": 2, "newest": 100, "size": 11}
+	assert scan_dataflow(str(tmp_path), max_depth=1) == {"files": 4, "newest": 200, "size": 22}
+	assert scan_dataflow(str(tmp_path), max_depth=5) == {"files": 6, "newest": 300, "size": 33}
+
+def test_scan_patterns(tmp_path):
+	tree(tmp_path)
+	assert scan_dataflow(str(tmp_path), patterns=["*.dat"], max_depth=2) ==\
+		{"files": 3, "newest": 300, "size": 30}
+	assert scan_dataflow(str(tmp_path), patterns=["*.dat", "*.txt"], max_depth=2)["files"] == 6
+	assert scan_dataflow(str(tmp_path), patterns=["*.nc"]) == {"files": 0, "newest": None, "size": 0}
+
+def test_scan_since(tmp_path):
+	tree(tmp_path)
+	result = scan_dataflow(str(tmp_path), patterns=["*.dat"], max_depth=2, since=150)
+	assert (result["arrived"], result["arrived_size"]) == (2, 20)
+	assert "arrived" not in scan_dataflow(str(tmp_path))
+
+def test_collect(tmp_path, monkeypatch):
+	tree(tmp_path)
+	monkeypatch.setattr(collector, "DOCKER_SOCKET", str(tmp_path / "missing.sock"))
+	result = collect({"facts": ["cpu", "docker", "memory"],
+					  "dataflows": [{"directory": str(tmp_path / "missing")},
+									{"directory": str(tmp_path), "patterns": ["*.dat"]}]})
+	# one fact or dataflow failing does not stop the others
+	assert list(result["errors"]) == ["docker"]
+	assert "docker" not in result
+	assert result["cpu"] == os.cpu_count()
+	assert result["memtotal"] >= result["memfree"] > 0
+	assert "error" in result["dataflows"][0]
+	assert result["dataflows"][1] == {"files": 1, "newest": 100, "size": 10}
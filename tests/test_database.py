@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+"""Test the database tests which need no database server."""
+
+from cmon.context import Context
+from cmon.measurement import MeasurementState
+from cmon.database.database import Database
+from cmon.database.db_tests import measure_db_size
+from cmon.database.db_tests import measure_db_health
+
+def test_not_postgres():
+	"""Statistics are only read from Postgres, other databases are not applicable."""
+	database = Database(dialect="sqlite", host=None, label="SQLite")
+	for test in (measure_db_size, measure_db_health):
+		assert test(subject=database, context=Context()).state is MeasurementState.NOT_APPLICABLE
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""Test decoding the output of the composite host facts command."""
+
+from cmon.server.facts import facts_command
+from cmon.server.facts import parse_facts
+from cmon.server.facts import split_sections
+
+OUTPUT = """@@cmon:os
+PRETTY_NAME="Debian GNU/Linux 12 (bookworm)"
+NAME="Debian GNU/Linux"
+VERSION_ID="12"
+
+@@cmon:cpu
+Architecture:                       x86_64
+CPU op-mode(s):                     32-bit, 64-bit
+CPU(s):                             8
+On-line CPU(s) list:                0-7
+@@cmon:memory
+               total        used        free      shared  buff/cache   available
+Mem:     16663400448  5236785152  3128123392   389427200  8298491904 10209271808
+Swap:     1023406080           0  1023406080
+@@cmon:mounts
+Filesystem      1K-blocks       Used  Available Use% Mounted on
+/dev/nvme0n1p2 1237425072  907315824  271957300  77% /
+tmpfs            16298180      51324   16246856   1% /dev/shm
+@@cmon:docker
+web,nginx:1.25,3 days ago
+db,postgres:16,2 weeks ago
+"""
+
+def test_command():
+	command = facts_command(["os", "docker"])
+	assert command.startswith("echo '@@cmon:os'; cat /etc/os-release 2>/dev/null; ")
+	assert "echo '@@cmon:docker'; docker ps" in command
+
+def test_facts():
+	facts = parse_facts(split_sections(OUTPUT))
+	assert facts.os == "Debian GNU/Linux 12 (bookworm)"
+	assert facts.cpu == 8
+	assert (facts.memtotal, facts.memfree) == (16663400448, 10209271808)
+	assert sorted(facts.mounts) == ["/", "/dev/shm"]
+	root = facts.mounts["/"]
+	assert (root.total, root.used, root.percent) == (1237425072 * 1024, 907315824 * 1024, "77%")
+	assert facts.docker == [("web", "nginx:1.25", "3 days ago"), ("db", "postgres:16", "2 weeks ago")]
+
+def test_missing_section():
+	# output before the first marker is ignored and sections not read are left unset
+	sections = split_sections("motd banner\n@@cmon:cpu\nCPU(s): 2\n")
+	assert list(sections) == ["cpu"]
+	facts = parse_facts(sections)
+	assert facts.cpu == 2
+	assert facts.os is None
+	assert facts.memtotal is None
+	assert facts.mounts == {}
+	assert facts.docker == []
+
+def test_docker_failed():
+	# errors go to /dev/null so a failed docker command leaves its section empty, and anything
+	# else it prints is skipped
+	for docker in ("", "permission denied\n"):
+		facts = parse_facts(split_sections("@@cmon:os\nPRETTY_NAME=Alpine\n@@cmon:docker\n" +
+										   docker))
+		assert facts.os == "Alpine"
+		assert facts.docker == []
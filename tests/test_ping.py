@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Test decoding of ping output and the shared ping pass."""
+
+from cmon.context import Context
+from cmon.measurement import MeasurementState
+from cmon.server import ping
+from cmon.server.ping import PingResult
+from cmon.server.ping import parse_ping
+from cmon.server.ping import reachability
+from cmon.server.server import Server
+from cmon.server.server_tests import measure_server_ping
+
+IPUTILS = """PING 10.0.0.1 (10.0.0.1) 56(84) bytes of data.
+
+--- 10.0.0.1 ping statistics ---
+3 packets transmitted, 3 received, 0% packet loss, time 401ms
+rtt min/avg/max/mdev = 0.045/0.060/0.071/0.010 ms
+"""
+
+BUSYBOX = """PING 10.0.0.1 (10.0.0.1): 56 data bytes
+
+--- 10.0.0.1 ping statistics ---
+3 packets transmitted, 2 packets received, 33% packet loss
+round-trip min/avg/max = 0.045/0.060/0.071 ms
+"""
+
+LOST = """PING 10.0.0.9 (10.0.0.9) 56(84) bytes of data.
+
+--- 10.0.0.9 ping statistics ---
+3 packets transmitted, 0 received, 100% packet loss, time 2044ms
+"""
+
+def test_iputils():
+	result = parse_ping(IPUTILS)
+	assert (result.sent, result.received, result.loss) == (3, 3, 0)
+	assert (result.rtt_min, result.rtt_avg, result.rtt_max) == (0.045, 0.060, 0.071)
+	assert result.jitter == 0.010
+	assert result.error is None
+
+def test_busybox():
+	result = parse_ping(BUSYBOX)
+	assert (result.sent, result.received, result.loss) == (3, 2, 33)
+	assert result.rtt_avg == 0.060
+	assert result.jitter is None
+	assert result.error is None
+
+def test_no_reply():
+	result = parse_ping(LOST)
+	assert (result.sent, result.received, result.loss) == (3, 0, 100)
+	assert result.rtt_avg is None
+	assert result.error == "no reply"
+
+def test_no_output():
+	result = parse_ping("")
+	assert result.sent == 0
+	assert result.loss is None
+	assert result.error == "no reply"
+
+def servers():
+	return [Server(hostname="ping{n}".format(n=n), label="Ping {n}".format(n=n)) for n in range(3)]
+
+def test_sweep_only_ping_subjects(monkeypatch):
+	pinged = []
+
+	async def fake_ping_host(hostname, wait, semaphore):
+		pinged.append(hostname)
+		return PingResult(sent=3, received=3, loss=0)
+
+	monkeypatch.setattr(ping, "ping_host", fake_ping_host)
+	context = Context()
+	context.subjects = servers()
+	context.tests = {context.subjects[0]: [measure_server_ping],
+					 context.subjects[1]: [measure_server_ping],
+					 context.subjects[2]: []}
+	assert reachability(context.subjects[0], context, measure_server_ping).loss == 0
+	assert reachability(context.subjects[1], context, measure_server_ping).loss == 0
+	assert sorted(pinged) == ["ping0", "ping1"]
+
+def test_missing_command(monkeypatch):
+	async def no_ping(*args, **kwargs):
+		raise FileNotFoundError("No such file or directory: 'ping'")
+
+	monkeypatch.setattr(ping.asyncio, "create_subprocess_exec", no_ping)
+	context = Context()
+	context.subjects = servers()
+	context.tests = {subject: [measure_server_ping] for subject in context.subjects}
+	result = measure_server_ping(subject=context.subjects[0], context=context)
+	assert result.state is MeasurementState.ERROR
+	assert "ping" in result.messages[0].error
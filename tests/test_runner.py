@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""Test scheduling of subjects and tests by the Runner."""
+
+import time
+import asyncio
+
+import pytest
+
+from cmon.context import Context
+from cmon.dashboard import Dashboard
+from cmon.measurement import Measurement
+from cmon.measurement import MeasurementState
+from cmon.measurement import measure
+from cmon.system import System
+from cmon import testable
+from cmon.testsuite import TestSuite as Suite
+
+class Thing(testable.Testable):
+	"""Subject which takes `delay` seconds to test and may fail or link to other things."""
+	name = "thing"
+	label = "Thing"
+
+	def __init__(self, label, delay=0, fail=False, links=()):
+		super().__init__(label=label)
+		self.delay = delay
+		self.fail = fail
+		self.linked = list(links)
+
+	def links(self):
+		return self.linked
+
+@measure(label="First", name="first", subject_type=Thing)
+def first(subject, context):
+	time.sleep(subject.delay)
+	return Measurement(MeasurementState.FAILED if subject.fail else MeasurementState.GOOD)
+
+@measure(label="Second", name="second", subject_type=Thing)
+def second(subject, context):
+	return Measurement(MeasurementState.GOOD)
+
+@measure(label="Awaited", name="awaited", subject_type=Thing)
+async def awaited(subject, context):
+	await asyncio.sleep(subject.delay)
+	return Measurement(MeasurementState.GOOD)
+
+@measure(label="Gate", name="gate", subject_type=Thing, prerequisite=True)
+def gate(subject, context):
+	return Measurement(MeasurementState.FAILED if subject.fail else MeasurementState.GOOD)
+
+def make_system(things, tests=(first, second)):
+	"""System testing `things` with `tests`."""
+	return System(standard_tests={Thing: list(tests)},
+				  dashboards={"d": Dashboard(label="D",
+											 test_suites={"s": Suite(label="S", subjects=things)})})
+
+def outline(results):
+	"""Results as [(subject label, [test names])] in the order returned."""
+	return [(subject.label, [m.test_fn.name for m in measurements])
+			for subject, measurements in results.items()]
+
+def test_order():
+	# later subjects finish first but results stay in configuration order
+	things = {"t{i}".format(i=i): Thing("t{i}".format(i=i), delay=0.2 - 0.05 * i) for i in range(4)}
+	start = time.monotonic()
+	results = make_system(things).run(Context(jobs=4))
+	assert time.monotonic() - start < 0.5
+	assert outline(results) == [("t{i}".format(i=i), ["first", "second"]) for i in range(4)]
+
+def test_asyncio():
+	# coroutine tests of all subjects overlap on one loop, plain tests run in the pool
+	things = {"t{i}".format(i=i): Thing("t{i}".format(i=i), delay=0.3) for i in range(10)}
+	start = time.monotonic()
+	results = make_system(things, tests=(awaited, second)).run(Context(jobs=2, use_asyncio=True))
+	assert time.monotonic() - start < 1
+	assert outline(results) == [("t{i}".format(i=i), ["awaited", "second"]) for i in range(10)]
+	assert all(m.state is MeasurementState.GOOD for ms in results.values() for m in ms)
+
+def test_skip_upstream():
+	# subjects are tested after the things they link to, and skipped if those fail a prerequisite
+	down = Thing("down", fail=True)
+	up = Thing("up", delay=0.1)
+	things = {"front": Thing("front", links=[down]),
+			  "back": Thing("back", links=[up]),
+			  "down": down,
+			  "up": up}
+	results = make_system(things, tests=(gate, second)).run(Context(jobs=4))
+	states = {subject.label: [m.state for m in measurements]
+			  for subject, measurements in results.items()}
+	assert states == {
+		"front": [MeasurementState.SKIPPED, MeasurementState.SKIPPED],
+		"back": [MeasurementState.GOOD, MeasurementState.GOOD],
+		"down": [MeasurementState.FAILED, MeasurementState.SKIPPED],
+		"up": [MeasurementState.GOOD, MeasurementState.GOOD]}
+	assert results[things["front"]][0].messages[0].value == "upstream down failed"
+
+@measure(label="Opt in gate", name="opt_in", subject_type=Thing,
+		 prerequisite=lambda thing: thing.delay == 0)
+def opt_in(subject, context):
+	return Measurement(MeasurementState.FAILED)
+
+def test_prerequisite_opt_in():
+	# the failing gate only skips the tests of subjects it is a prerequisite for
+	things = {"gated": Thing("gated"), "open": Thing("open", delay=0.01)}
+	results = make_system(things, tests=(opt_in, second)).run(Context())
+	states = {subject.label: [m.state for m in measurements]
+			  for subject, measurements in results.items()}
+	assert states == {"gated": [MeasurementState.FAILED, MeasurementState.SKIPPED],
+					  "open": [MeasurementState.FAILED, MeasurementState.GOOD]}
+
+@measure(label="Hang", name="hang", subject_type=Thing, timeout=0.2)
+def hang(subject, context):
+	time.sleep(5)
+	return Measurement(MeasurementState.GOOD)
+
+@measure(label="Hang async", name="hang_async", subject_type=Thing, timeout=0.2)
+async def hang_async(subject, context):
+	await asyncio.sleep(5)
+	return Measurement(MeasurementState.GOOD)
+
+def test_timeout():
+	for use_asyncio in (False, True):
+		things = {"t": Thing("t")}
+		start = time.monotonic()
+		results = make_system(things, tests=(hang, hang_async, second)).run(
+			Context(use_asyncio=use_asyncio))
+		assert time.monotonic() - start < 1
+		hung, hung_async, after = results[things["t"]]
+		assert hung.state is MeasurementState.ERROR
+		assert hung.messages[0].value == "timed out after 0.2s"
+		assert hung_async.state is MeasurementState.ERROR
+		assert after.state is MeasurementState.GOOD
+
+def test_deadline():
+	# a test running at the deadline is cut short and later tests are not attempted
+	things = {"slow": Thing("slow", delay=0.4), "late": Thing("late")}
+	results = make_system(things).run(Context(jobs=1, deadline=0.2))
+	slow, late = results.values()
+	assert [m.state for m in slow] == [MeasurementState.ERROR, MeasurementState.ERROR]
+	assert slow[0].messages[0].value.startswith("timed out after")
+	assert [m.state for m in late] == [MeasurementState.ERROR, MeasurementState.ERROR]
+	assert late[0].messages[0].value == "not attempted, run deadline of 0.2s exceeded"
+
+@measure(label="Broken", name="broken", subject_type=Thing)
+def broken(subject, context):
+	raise RuntimeError("broken test")
+
+def test_stream():
+	# measurements come out as they complete, not in configuration order
+	things = {"t{i}".format(i=i): Thing("t{i}".format(i=i), delay=0.3 - 0.1 * i) for i in range(3)}
+	streamed = [(m.subject.label, m.test_fn.name)
+				for m in make_system(things, tests=(first,)).stream(Context(jobs=3))]
+	assert streamed == [("t2", "first"), ("t1", "first"), ("t0", "first")]
+
+def test_stream_errors():
+	# a test which raises is streamed as an ERROR and the others carry on
+	things = {"t{i}".format(i=i): Thing("t{i}".format(i=i)) for i in range(3)}
+	streamed = list(make_system(things, tests=(broken, second)).stream(Context(jobs=2)))
+	assert len(streamed) == 6
+	assert {m.state for m in streamed if m.test_fn.name == "broken"} == {MeasurementState.ERROR}
+
+	# an error in a worker thread outside any test is raised by the consumer, which does not hang
+	system = make_system(things)
+	system.standard_tests[Thing].append(lambda subject, context: None)
+	for use_asyncio in (False, True):
+		start = time.monotonic()
+		with pytest.raises(ValueError):
+			list(system.stream(Context(jobs=2, use_asyncio=use_asyncio)))
+
+		assert time.monotonic() - start < 5
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""Test the shared ssh connection pool without a network."""
+
+import socket
+
+import paramiko
+import pytest
+
+from cmon.server import sshpool
+from cmon.server.sshpool import SSHPool
+
+class Client:
+	"""Stand-in for paramiko's SSHClient whose connect fails with `error`."""
+	made = []
+
+	def __init__(self, error):
+		self.error = error
+		self.closed = False
+		Client.made.append(self)
+
+	def set_missing_host_key_policy(self, policy):
+		pass
+
+	def connect(self, hostname, **kwargs):
+		raise self.error
+
+	def close(self):
+		self.closed = True
+
+def failing(monkeypatch, error):
+	Client.made = []
+	monkeypatch.setattr(sshpool.paramiko.client, "SSHClient", lambda: Client(error))
+
+def test_network_error(monkeypatch):
+	failing(monkeypatch, socket.timeout("timed out"))
+	pool = SSHPool()
+	with pytest.raises(socket.timeout):
+		pool.connect("host", "user")
+
+	assert [client.closed for client in Client.made] == [True]
+	assert pool.clients == {}
+
+def test_auth_retry(monkeypatch):
+	failing(monkeypatch, paramiko.ssh_exception.AuthenticationException("denied"))
+	pool = SSHPool(retry_failed=0.05)
+	with pytest.raises(paramiko.ssh_exception.AuthenticationException):
+		pool.connect("host", "user")
+
+	# a recent failure is not retried
+	assert pool.connect("host", "user") is None
+	assert len(Client.made) == 1
+	pool.failures = {key: failed - 1 for key, failed in pool.failures.items()}
+	with pytest.raises(paramiko.ssh_exception.AuthenticationException):
+		pool.connect("host", "user")
+
+	assert len(Client.made) == 2
+	assert all(client.closed for client in Client.made)
+	pool.close()
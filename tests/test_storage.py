@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""Test saving results to the SQLite result history."""
+
+from datetime import datetime
+from datetime import timedelta
+
+from cmon.measurement import Measurement
+from cmon.measurement import MeasurementState
+from cmon.measurement import Message
+from cmon.dataflow.dataflow import Dataflow
+from cmon.dataflow.dataflow_tests import measure_dataflow_outage
+from cmon.storage import HistoryStore
+from cmon.codec import encode_series
+from cmon.codec import decode_series
+
+def outage(state, files, newest):
+	"""Make a dataflow outage measurement."""
+	subject = Dataflow(label="Inbound", directory="/tmp")
+	subject.name = "inbound"
+	return Measurement(state=state,
+					   subject=subject,
+					   test_fn=measure_dataflow_outage,
+					   messages=[Message("files", files),
+								 Message("newest", newest),
+								 Message("gap", 1.5, parameter="p50"),
+								 Message("size", error="unreadable")])
+
+def test_history(tmp_path):
+	start = datetime(2024, 1, 1)
+	store = HistoryStore(tmp_path.joinpath("history.db"))
+	first = store.record([outage(MeasurementState.GOOD, 10, start)], execution_start=start)
+	second = store.record([outage(MeasurementState.FAILED, 12, start)],
+						  execution_start=start + timedelta(minutes=5))
+	assert second == first + 1
+	store.close()
+
+	# keycodes and samples are read back by a new store
+	store = HistoryStore(tmp_path.joinpath("history.db"))
+	assert [value for _, value in store.series("dataflow.inbound.outage")] ==\
+		[MeasurementState.GOOD, MeasurementState.FAILED]
+	assert [value for _, value in store.series("dataflow.inbound.outage.files")] == [10, 12]
+	assert store.series("dataflow.inbound.outage.gap.p50")[0] == (1704067200.0, 1.5)
+	assert store.series("dataflow.inbound.outage.size") == []
+	assert len(store.series("dataflow.inbound.outage.files",
+							start=start + timedelta(minutes=1))) == 1
+	assert len(store.keycodes) == 4
+	store.close()
+
+def test_codec():
+	samples = [(1704067200.0 + 300 * i, float(v)) for i, v in enumerate([3, 3, 3.5, -1e9, 0, 17])]
+	samples.append((1704069000.123, 0.1))
+	data = encode_series(samples)
+	assert decode_series(data) == samples
+	# regular times and repeated values cost two bytes
+	assert len(encode_series([(300.0 * i, 5.0) for i in range(100)])) < 220
+
+def test_compact(tmp_path):
+	start = datetime(2024, 1, 1)
+	store = HistoryStore(tmp_path.joinpath("history.db"), keep_raw=timedelta(days=1),
+						 keep_5m=timedelta(days=2))
+	for i in range(0, 3 * 24 * 12):
+		store.record([outage(MeasurementState.GOOD, i, start)],
+					 execution_start=start + timedelta(minutes=5 * i))
+
+	before = store.series("dataflow.inbound.outage.files")
+	store.compact(now=start + timedelta(days=3))
+	assert store.series("dataflow.inbound.outage.files") == before
+	assert store.series("dataflow.inbound.outage")[0] == (1704067200.0, MeasurementState.GOOD)
+	# the first two days are now in blocks and only the last day is raw
+	assert store.conn.execute("SELECT count(*) FROM history_int").fetchone()[0] == 24 * 12
+	assert store.conn.execute("SELECT count(*) FROM history_blocks").fetchone()[0] == 2 * 4
+
+	hourly = store.rollups("dataflow.inbound.outage.files", period=3600)
+	assert len(hourly) == 3 * 24
+	assert hourly[0] == (1704067200.0, 12, 0, 5.5, 11)
+	assert len(store.rollups("dataflow.inbound.outage.files", period=300)) == 2 * 24 * 12
+	store.close()
+
+def test_compact_large_int(tmp_path):
+	# integers beyond 2**53 are not exact as float64 so stay raw until blocks expire
+	start = datetime(2024, 1, 1)
+	store = HistoryStore(tmp_path.joinpath("history.db"), keep_raw=timedelta(days=1),
+						 keep_blocks=timedelta(days=10))
+	for i, files in enumerate((2 ** 60 + 1, 7)):
+		store.record([outage(MeasurementState.GOOD, files, start)],
+					 execution_start=start + timedelta(minutes=5 * i))
+
+	store.compact(now=start + timedelta(days=3))
+	assert [value for _, value in store.series("dataflow.inbound.outage.files")] == [2 ** 60 + 1, 7]
+	assert store.conn.execute("SELECT count(*) FROM history_int").fetchone()[0] == 1
+	store.compact(now=start + timedelta(days=12))
+	assert store.series("dataflow.inbound.outage.files") == []
+	store.close()
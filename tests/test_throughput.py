@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""Test dataflow throughput worked out from saved scan snapshots."""
+
+import os
+from datetime import timedelta
+
+from cmon.context import Context
+from cmon.dataflow import throughput
+from cmon.dataflow.dataflow import Dataflow
+from cmon.dataflow.scan import ScanResult
+from cmon.dataflow.throughput import dataflow_throughput
+from cmon.dataflow.throughput import arrivals_since
+from cmon.dataflow.throughput import thin
+from cmon.dataflow.walk import LocalFilesystem
+from cmon.dataflow.walk import walk_dataflow
+
+HOUR = 3600
+
+def run(dataflow, context, monkeypatch, now, scanned):
+	"""Record `scanned` as the scan made at time `now`."""
+	monkeypatch.setattr(throughput.time, "time", lambda: now)
+	return dataflow_throughput(dataflow, scanned, context)
+
+def test_cleanup(monkeypatch):
+	# 10 files arrive each hour and files over an hour old are removed, so the count stays
+	# the same but the rate must not read as zero
+	dataflow = Dataflow(label="Inbound", directory="/in", window=timedelta(hours=3))
+	context = Context()
+	start = 1000 * HOUR
+	assert arrivals_since(dataflow, context) is None
+	run(dataflow, context, monkeypatch, start, ScanResult(10, start, 100))
+	assert arrivals_since(dataflow, context) == start
+	for hour in range(1, 4):
+		now = start + hour * HOUR
+		result = run(dataflow, context, monkeypatch, now,
+					 ScanResult(10, now, 100, arrived=10, arrived_size=100))
+
+	assert result.files_rate == 10
+	assert result.bytes_rate == 100
+	assert result.gaps == [HOUR, HOUR, HOUR]
+
+def test_no_arrivals_counted(monkeypatch):
+	# scans which cannot count arrivals fall back to increases in the file count
+	dataflow = Dataflow(label="Inbound", directory="/in", window=timedelta(hours=2))
+	context = Context()
+	for hour, files in enumerate((5, 9, 4)):
+		result = run(dataflow, context, monkeypatch, hour * HOUR + HOUR, ScanResult(files, 1, files))
+
+	assert result.files_rate == 2
+
+def test_baseline(monkeypatch):
+	dataflow = Dataflow(label="Inbound", directory="/in", window=timedelta(hours=2),
+						baseline=timedelta(hours=4))
+	context = Context()
+	for hour in range(7):
+		# 6 files an hour for the baseline then 1 an hour
+		arrived = 6 if hour <= 4 else 1
+		result = run(dataflow, context, monkeypatch, hour * HOUR + HOUR,
+					 ScanResult(20, hour, 0, arrived=arrived, arrived_size=0))
+
+	assert result.files_rate == 1
+	assert result.baseline_rate == 6
+
+def test_thin():
+	snapshots = [[i, 0, 0, None, i, 0] for i in range(2000)]
+	thinned = thin(snapshots, limit=100)
+	assert len(thinned) <= 100
+	# both ends are kept so rates over the whole history are unchanged
+	assert thinned[0] == snapshots[0]
+	assert thinned[-1] == snapshots[-1]
+	assert thinned == sorted(thinned)
+
+def test_walk_arrivals(tmp_path):
+	for name in ("a.dat", "b.dat"):
+		tmp_path.joinpath(name).write_bytes(b"x" * 10)
+		os.utime(tmp_path.joinpath(name), (1000, 1000))
+
+	dataflow = Dataflow(label="Inbound", directory=tmp_path, pattern="*.dat")
+	context = Context()
+	assert walk_dataflow(LocalFilesystem(), dataflow, context).arrived is None
+	# one old file cleaned up and one new file arrives
+	tmp_path.joinpath("a.dat").unlink()
+	tmp_path.joinpath("c.dat").write_bytes(b"x" * 5)
+	os.utime(tmp_path, (1100, 1100))
+	scanned = walk_dataflow(LocalFilesystem(), dataflow, context, since=1000)
+	assert (scanned.files, scanned.arrived, scanned.arrived_size) == (2, 1, 5)
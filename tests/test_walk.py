@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""Test incremental scanning of dataflow trees."""
+
+import posixpath
+
+from cmon.dataflow.walk import Entry
+from cmon.dataflow.walk import Filesystem
+from cmon.dataflow.walk import Walk
+
+# Time of the scans, files are much older
+NOW = 1000000.0
+DAY = 86400
+
+class MemoryFilesystem(Filesystem):
+	"""Directory tree held in memory, recording which directories are listed."""
+	def __init__(self):
+		# path : mtime
+		self.dirs = {}
+		# path : [Entry] of the files in the directory
+		self.files = {}
+		self.listings = []
+
+	def add_dir(self, path, mtime):
+		self.dirs[path] = mtime
+		self.files[path] = []
+
+	def add_file(self, path, mtime, size=10):
+		directory = posixpath.dirname(path)
+		self.files[directory].append(Entry(posixpath.basename(path), False, mtime, size))
+		# like a real directory, adding a file changes its mtime
+		self.dirs[directory] = mtime
+
+	def mtime(self, path):
+		if path not in self.dirs:
+			raise FileNotFoundError(path)
+
+		return self.dirs[path]
+
+	def entries(self, path):
+		self.listings.append(path)
+		for child, mtime in self.dirs.items():
+			if posixpath.dirname(child) == path and child != path:
+				yield Entry(posixpath.basename(child), True, mtime, 0)
+
+		yield from self.files[path]
+
+def archive():
+	"""Date partitioned tree /d/<year>/<day> with one file per day."""
+	filesystem = MemoryFilesystem()
+	filesystem.add_dir("/d", NOW - 10 * DAY)
+	for year in ("2023", "2024"):
+		filesystem.add_dir(posixpath.join("/d", year), NOW - 10 * DAY)
+		for day in ("01", "02"):
+			path = posixpath.join("/d", year, day)
+			filesystem.add_dir(path, NOW - 10 * DAY)
+			mtime = NOW - (10 if year == "2023" else 5) * DAY - int(day)
+			filesystem.add_file(posixpath.join(path, "f.dat"), mtime)
+
+	return filesystem
+
+def scan(filesystem, previous, settle=None, patterns=("*.dat",)):
+	walk = Walk(filesystem, patterns=list(patterns), max_depth=2, previous=previous, now=NOW,
+				settle=settle)
+	result = walk.run("/d")
+	return walk, result
+
+def test_unchanged():
+	filesystem = archive()
+	walk, result = scan(filesystem, {})
+	assert (result.files, result.size) == (4, 40)
+	assert walk.listed == 7
+	# nothing changed, so every directory costs a stat and none is listed
+	filesystem.listings.clear()
+	walk, again = scan(filesystem, walk.state)
+	assert (again.files, again.newest, again.size) == (result.files, result.newest, result.size)
+	assert (walk.listed, walk.unchanged, walk.settled) == (0, 7, 0)
+	assert filesystem.listings == []
+
+def test_new_file():
+	filesystem = archive()
+	walk, _ = scan(filesystem, {})
+	filesystem.add_file("/d/2024/02/g.dat", NOW - DAY)
+	filesystem.add_file("/d/2024/02/skip.txt", NOW - DAY)
+	filesystem.listings.clear()
+	walk, result = scan(filesystem, walk.state)
+	assert filesystem.listings == ["/d/2024/02"]
+	assert (result.files, result.newest) == (5, NOW - DAY)
+
+def test_settle():
+	filesystem = archive()
+	walk, _ = scan(filesystem, {}, settle=DAY)
+	filesystem.listings.clear()
+	walk, result = scan(filesystem, walk.state, settle=DAY)
+	# only the most recently active branch is checked, 2023 is settled and kept whole
+	assert walk.settled == 2
+	assert result.files == 4
+	assert sorted(walk.state) == ["/d", "/d/2023", "/d/2023/01", "/d/2023/02", "/d/2024",
+								  "/d/2024/01", "/d/2024/02"]
+	assert walk.state["/d/2023/01"]["tree"][0] == 1
+
+	# a settled subtree whose top directory changes is checked again
+	filesystem.add_dir("/d/2023/03", NOW - 2 * DAY)
+	filesystem.add_file("/d/2023/03/late.dat", NOW - 2 * DAY)
+	filesystem.dirs["/d/2023"] = NOW - 2 * DAY
+	filesystem.listings.clear()
+	walk, result = scan(filesystem, walk.state, settle=DAY)
+	assert filesystem.listings == ["/d/2023", "/d/2023/03"]
+	assert result.files == 5
+
+def test_recent_mtime():
+	# a directory modified within MTIME_SLACK may get more files in the same tick
+	filesystem = archive()
+	filesystem.add_file("/d/2024/02/now.dat", NOW)
+	walk, _ = scan(filesystem, {})
+	assert walk.state["/d/2024/02"]["mtime"] is None
+	filesystem.listings.clear()
+	scan(filesystem, walk.state)
+	assert filesystem.listings == ["/d/2024/02"]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""Test following local dataflows with inotify."""
+
+import os
+import time
+import errno
+import threading
+
+import pytest
+
+from cmon.dataflow import watch
+from cmon.dataflow.dataflow import Dataflow
+from cmon.dataflow.scan import ScanResult
+from cmon.dataflow.watch import DataflowWatcher
+from cmon.dataflow.watch import WatcherPool
+from cmon.dataflow.watch import IN_CLOSE_WRITE
+from cmon.dataflow.watch import IN_CREATE
+from cmon.dataflow.watch import IN_DELETE
+from cmon.dataflow.watch import IN_ISDIR
+from cmon.dataflow.watch import IN_MOVED_FROM
+from cmon.dataflow.watch import IN_Q_OVERFLOW
+
+@pytest.fixture(autouse=True)
+def fast_close(monkeypatch):
+	"""Let watcher threads notice they are closed quickly."""
+	monkeypatch.setattr(watch, "POLL_INTERVAL", 0.05)
+
+def write(path, size, mtime):
+	path.write_bytes(b"x" * size)
+	os.utime(path, (mtime, mtime))
+
+def stopped(directory, max_depth=0):
+	"""Watcher for `directory` whose events are only handled when the test calls `handle()`."""
+	watcher = DataflowWatcher(Dataflow(label="Inbound",
+									   directory=directory,
+									   pattern="*.dat",
+									   max_depth=max_depth))
+	watcher.closed = True
+	watcher.thread.join()
+	return watcher
+
+def totals(watcher):
+	result = watcher.current()
+	return (result.files, result.size, result.newest, result.arrived, result.arrived_size)
+
+def test_files(tmp_path):
+	write(tmp_path.joinpath("a.dat"), 10, 1000)
+	watcher = stopped(tmp_path)
+	root = next(iter(watcher.watches))
+	assert totals(watcher) == (1, 10, 1000, None, None)
+
+	write(tmp_path.joinpath("b.dat"), 5, 2000)
+	write(tmp_path.joinpath("b.txt"), 5, 3000)
+	watcher.handle(root, IN_CREATE, "b.dat")
+	watcher.handle(root, IN_CLOSE_WRITE, "b.dat")
+	watcher.handle(root, IN_CLOSE_WRITE, "b.txt")
+	assert totals(watcher) == (2, 15, 2000, 1, 5)
+
+	# a rewrite changes the size but is not a new arrival
+	write(tmp_path.joinpath("b.dat"), 7, 1500)
+	watcher.handle(root, IN_CLOSE_WRITE, "b.dat")
+	assert totals(watcher) == (2, 17, 1500, 0, 0)
+
+	# removals are applied without a rescan
+	tmp_path.joinpath("b.dat").rename(tmp_path.joinpath("b.old"))
+	watcher.handle(root, IN_MOVED_FROM, "b.dat")
+	tmp_path.joinpath("a.dat").unlink()
+	watcher.handle(root, IN_DELETE, "a.dat")
+	assert totals(watcher) == (0, 0, None, 0, 0)
+	os.close(watcher.fd)
+
+def test_directories(tmp_path):
+	watcher = stopped(tmp_path, max_depth=1)
+	root = next(iter(watcher.watches))
+	assert totals(watcher) == (0, 0, None, None, None)
+	sub = tmp_path.joinpath("2024")
+	sub.mkdir()
+	write(sub.joinpath("a.dat"), 10, 1000)
+	write(sub.joinpath("b.dat"), 10, 2000)
+	watcher.handle(root, IN_CREATE | IN_ISDIR, "2024")
+	assert totals(watcher) == (2, 20, 2000, 2, 20)
+	assert len(watcher.watches) == 2
+
+	for path in sub.iterdir():
+		path.unlink()
+
+	sub.rmdir()
+	watcher.handle(root, IN_DELETE | IN_ISDIR, "2024")
+	assert totals(watcher) == (0, 0, None, 0, 0)
+	assert len(watcher.watches) == 1
+	os.close(watcher.fd)
+
+def test_overflow(tmp_path):
+	write(tmp_path.joinpath("a.dat"), 10, 1000)
+	watcher = stopped(tmp_path)
+	watcher.handle(-1, IN_Q_OVERFLOW, "")
+	assert watcher.current() is None
+	os.close(watcher.fd)
+
+def test_pool(tmp_path):
+	write(tmp_path.joinpath("a.dat"), 10, 1000)
+	dataflow = Dataflow(label="Inbound", directory=tmp_path, pattern="*.dat", watch=True)
+	pool = WatcherPool()
+	try:
+		full_scans = []
+		def full_scan():
+			full_scans.append(1)
+			return ScanResult()
+
+		assert pool.scan(dataflow, full_scan).files == 1
+		write(tmp_path.joinpath("b.dat"), 5, 2000)
+		# events are handled by the watcher thread
+		for _ in range(50):
+			result = pool.scan(dataflow, full_scan)
+			if result.files == 2:
+				break
+
+			time.sleep(0.05)
+
+		assert (result.files, result.size, result.newest) == (2, 15, 2000)
+
+		# a watcher which lost events is replaced by one listing the tree again
+		watcher = pool.watchers[str(tmp_path), ("*.dat",), 0]
+		watcher.invalidate("test")
+		assert pool.scan(dataflow, full_scan).files == 2
+		assert pool.watchers[str(tmp_path), ("*.dat",), 0] is not watcher
+		assert full_scans == []
+
+	finally:
+		pool.close()
+
+def test_pool_retry(tmp_path, monkeypatch):
+	"""A dataflow which cannot be watched is scanned, and watched again after a while."""
+	dataflow = Dataflow(label="Inbound", directory=tmp_path, pattern="*.dat", watch=True)
+	watchers = []
+
+	class Unwatchable(DataflowWatcher):
+		def __init__(self, dataflow):
+			watchers.append(dataflow)
+			raise OSError(errno.EMFILE, "Too many open files")
+
+	monkeypatch.setattr(watch, "DataflowWatcher", Unwatchable)
+	pool = WatcherPool()
+	assert pool.scan(dataflow, lambda: ScanResult(files=7)).files == 7
+	assert pool.scan(dataflow, lambda: ScanResult(files=8)).files == 8
+	assert len(watchers) == 1
+	monkeypatch.setattr(watch, "RETRY_INTERVAL", 0)
+	assert pool.scan(dataflow, lambda: ScanResult(files=9)).files == 9
+	assert len(watchers) == 2
+
+def test_pool_start(tmp_path, monkeypatch):
+	"""A watcher listing a large tree does not hold up scans of other dataflows."""
+	slow = Dataflow(label="Slow", directory=tmp_path.joinpath("slow"), pattern="*.dat", watch=True)
+	fast = Dataflow(label="Fast", directory=tmp_path, pattern="*.dat", watch=True)
+	listing = threading.Event()
+	listed = threading.Event()
+
+	class Listing:
+		lost = False
+
+		def __init__(self, dataflow):
+			if dataflow is slow:
+				listing.set()
+				listed.wait(5)
+
+		def current(self):
+			return ScanResult(files=1)
+
+		def close(self):
+			pass
+
+	monkeypatch.setattr(watch, "DataflowWatcher", Listing)
+	pool = WatcherPool()
+	thread = threading.Thread(target=pool.scan, args=(slow, ScanResult))
+	thread.start()
+	assert listing.wait(5)
+	assert pool.scan(fast, ScanResult).files == 1
+	assert thread.is_alive()
+	listed.set()
+	thread.join()
+	assert pool.scan(slow, ScanResult).files == 1
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Test the web load measurement against a local stand-in HTTP server."""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from cmon.context import Context
+from cmon.histogram import Histogram
+from cmon.measurement import MeasurementState
+from cmon.website.website import Website
+from cmon.website.website import LoadTest
+from cmon.website.web_tests import measure_web_load
+
+class StandIn(BaseHTTPRequestHandler):
+	"""Answer "/" with a small page and anything else with 500."""
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		body = b"<html>ok</html>"
+		self.send_response(200 if self.path == "/" else 500)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+def serve():
+	"""Start a stand-in server on a free port and return it."""
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def load(url, **kwargs):
+	"""Run a short load test against `url` and return messages by name."""
+	website = Website(label="Stand-in", load_test=LoadTest(url, concurrency=4, duration=0.5, **kwargs))
+	result = asyncio.run(measure_web_load(subject=website, context=Context()))
+	return result, {message.name: message.value for message in result.messages}
+
+def test_histogram():
+	"""Percentiles are within the histogram precision."""
+	histogram = Histogram(precision=0.01)
+	for value in range(1, 10001):
+		histogram.record(value)
+
+	assert histogram.count == 10000
+	for q in (0.5, 0.95, 0.99):
+		expected = q * 9999 + 1
+		assert abs(histogram.percentile(q) - expected) <= expected * 0.01
+
+def test_load_good():
+	"""All requests succeed against a healthy server."""
+	server = serve()
+	try:
+		result, messages = load("http://127.0.0.1:{port}/".format(port=server.server_port),
+								max_error_rate=0)
+	finally:
+		server.shutdown()
+
+	assert result.state is MeasurementState.GOOD
+	assert messages["requests"] > 0
+	assert messages["error_rate"] == 0
+	assert messages["throughput"] > 0
+	assert 0 < messages["p50"] <= messages["p95"] <= messages["p99"]
+
+def test_load_errors():
+	"""Error responses count towards the error rate and fail the test."""
+	server = serve()
+	try:
+		result, messages = load("http://127.0.0.1:{port}/fail".format(port=server.server_port),
+								max_error_rate=0.1)
+	finally:
+		server.shutdown()
+
+	assert result.state is MeasurementState.FAILED
+	assert messages["error_rate"] == 100
+	assert messages["p50"] is None
+
+def test_load_not_configured():
+	"""Sites without a load test are not applicable."""
+	website = Website(label="Stand-in")
+	result = asyncio.run(measure_web_load(subject=website, context=Context()))
+	assert result.state == MeasurementState.NOT_APPLICABLE
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""Test fetching and checking web pages against a local stand-in HTTP server."""
+
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from cmon.context import Context
+from cmon.measurement import MeasurementState
+from cmon.website.website import Website
+from cmon.website.web_tests import measure_web_urls
+
+class StandIn(BaseHTTPRequestHandler):
+	"""Answer "/" with a small page, other paths with the test cases in `PAGES`, and drop the
+	connection for "/drop"."""
+	protocol_version = "HTTP/1.1"
+
+	def do_GET(self):
+		if self.path == "/drop":
+			self.close_connection = True
+			return
+
+		self.reply(*PAGES.get(self.path, (200, [b"<html>ok</html>"])))
+
+	def reply(self, code, parts):
+		"""Send `parts` of the body separately, so the client reads them as separate chunks."""
+		self.send_response(code)
+		if code != 204:
+			self.send_header("Content-Length", str(sum(len(part) for part in parts)))
+
+		self.end_headers()
+		for part in parts:
+			self.wfile.write(part)
+			self.wfile.flush()
+			time.sleep(0.05)
+
+	def log_message(self, format, *args):
+		pass
+
+# Path against response code and body parts
+PAGES = {
+	"/big": (200, [b"x" * 5000, b"y" * 5000]),
+	"/split": (200, [b"<html>Internal Ser", b"ver Error</html>"]),
+	"/late": (200, [b"x" * 900, b"<p>Bad Gateway</p>"]),
+	"/empty": (200, []),
+	"/nocontent": (204, []),
+	"/missing": (404, [b"<html>Not found</html>"]),
+}
+
+def serve():
+	"""Start a stand-in server on a free port and return it."""
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def base(server):
+	return "http://127.0.0.1:{port}".format(port=server.server_port)
+
+def closed_port():
+	"""A local port with nothing listening on it."""
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def server():
+	server = serve()
+	yield server
+	server.shutdown()
+
+def test_failed_urls(server):
+	"""A URL whose request fails does not lose the results of the others."""
+	refused = "http://127.0.0.1:{port}/".format(port=closed_port())
+	website = Website(label="Stand-in", urls=[base(server) + "/", base(server) + "/drop", refused])
+	result = measure_web_urls(subject=website, context=Context())
+
+	assert result.state is MeasurementState.FAILED
+	responses = {m.parameter: m for m in result.messages if m.name == "response"}
+	assert responses[base(server)].error is None
+	assert responses[base(server)].value > 0
+	assert "RemoteProtocolError" in responses[base(server) + "/drop"].error
+	assert "ConnectionException" in responses[refused[:-1]].error
+	assert [m.parameter for m in result.messages if m.name == "size"] == [base(server)]
+
+def fetch(server, path, **kwargs):
+	"""Get `path` from the stand-in `server` and return the fetched page and its check."""
+	website = Website(label="Stand-in", **kwargs)
+	fetched = website.get(base(server) + path)
+	return fetched, website.validate(fetched)
+
+def test_good(server):
+	fetched, check = fetch(server, "/")
+	assert check is True
+	assert (fetched.size, fetched.truncated) == (15, False)
+	assert {"dns", "ttfb", "download"} <= set(fetched.timings)
+
+def test_truncated(server):
+	"""Reading stops at `max_bytes`, even part way through a chunk."""
+	fetched, check = fetch(server, "/big", max_bytes=6000)
+	assert check is True
+	assert (fetched.size, fetched.truncated) == (6000, True)
+	fetched, check = fetch(server, "/big", max_bytes=10000)
+	assert (fetched.size, fetched.truncated) == (10000, False)
+
+def test_signature_split(server):
+	"""An error signature is found even when split across two chunks."""
+	fetched, check = fetch(server, "/split")
+	assert check == "Found \"Internal Server Error\""
+
+def test_signature_beyond_limit(server):
+	"""Content after `max_bytes` is not checked."""
+	assert fetch(server, "/late")[1] == "Found \"Bad Gateway\""
+	assert fetch(server, "/late", max_bytes=900)[1] is True
+
+def test_empty(server):
+	assert fetch(server, "/empty")[1] == "Empty response"
+	assert fetch(server, "/nocontent")[1] is True
+
+def test_bad_code(server):
+	assert fetch(server, "/missing")[1].startswith("Bad code 404")